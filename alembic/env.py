@@ -8,6 +8,7 @@ from sqlalchemy.ext.asyncio import async_engine_from_config
 from alembic import context
 from frank.core.config import settings
 from frank.core.db import Base
+from frank.core.shards import shard_urls
 from frank.db import models  # noqa: F401
 
 
@@ -67,17 +68,22 @@ async def run_migrations_online() -> None:
     In this scenario we need to create an Engine
     and associate a connection with the context.
 
-    """
-    connectable = async_engine_from_config(
-        config.get_section(config.config_ini_section, {}),
-        prefix="sqlalchemy.",
-        poolclass=pool.NullPool,
-    )
+    Chat shards (DB_SHARDS) get the same schema as the main database, so
+    they are migrated right after it.
 
-    async with connectable.connect() as connection:
-        await connection.run_sync(do_run_migrations)
-
-    await connectable.dispose()
+    """
+    for url in [settings.DATABASE_URL, *shard_urls()]:
+        config.set_main_option("sqlalchemy.url", url)
+        connectable = async_engine_from_config(
+            config.get_section(config.config_ini_section, {}),
+            prefix="sqlalchemy.",
+            poolclass=pool.NullPool,
+        )
+
+        async with connectable.connect() as connection:
+            await connection.run_sync(do_run_migrations)
+
+        await connectable.dispose()
 
 
 config.set_main_option("sqlalchemy.url", settings.DATABASE_URL)
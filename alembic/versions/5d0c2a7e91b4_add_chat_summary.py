@@ -0,0 +1,33 @@
+"""add chat summary
+
+Revision ID: 5d0c2a7e91b4
+Revises: 122883499347
+Create Date: 2026-10-18 10:12:31.480211
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5d0c2a7e91b4"
+down_revision: Union[str, Sequence[str], None] = "122883499347"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("chat", sa.Column("summary", sa.Text(), nullable=True))
+    op.add_column(
+        "chat",
+        sa.Column("summary_seq", sa.Integer(), server_default="0", nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("chat", "summary_seq")
+    op.drop_column("chat", "summary")
@@ -0,0 +1,82 @@
+"""add chat counters and unique message seq index
+
+Revision ID: 9b3e6f1c2d40
+Revises: 5d0c2a7e91b4
+Create Date: 2026-10-18 14:02:17.913550
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9b3e6f1c2d40"
+down_revision: Union[str, Sequence[str], None] = "5d0c2a7e91b4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "chat",
+        sa.Column("last_seq", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "chat",
+        sa.Column("message_count", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "chat",
+        sa.Column("last_message_at", sa.DateTime(timezone=True), nullable=True),
+    )
+
+    # keep the first of any duplicated (chat_id, seq) so the index can be unique
+    op.execute(
+        """
+        DELETE FROM chat_message
+        WHERE EXISTS (
+            SELECT 1 FROM chat_message AS m
+            WHERE m.chat_id = chat_message.chat_id
+              AND m.seq = chat_message.seq
+              AND (m.created_at, m.id) < (chat_message.created_at, chat_message.id)
+        )
+        """
+    )
+    op.drop_index(op.f("ix_chat_message_seq"), table_name="chat_message")
+    op.drop_index(op.f("ix_chat_message_chat_id"), table_name="chat_message")
+    op.create_index(
+        "ix_chat_message_chat_id_seq",
+        "chat_message",
+        ["chat_id", "seq"],
+        unique=True,
+    )
+
+    op.execute(
+        """
+        UPDATE chat SET
+            last_seq = COALESCE(
+                (SELECT MAX(seq) FROM chat_message WHERE chat_id = chat.id), 0
+            ),
+            message_count = (
+                SELECT COUNT(*) FROM chat_message WHERE chat_id = chat.id
+            ),
+            last_message_at = (
+                SELECT MAX(created_at) FROM chat_message WHERE chat_id = chat.id
+            )
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_chat_message_chat_id_seq", table_name="chat_message")
+    op.create_index(
+        op.f("ix_chat_message_chat_id"), "chat_message", ["chat_id"], unique=False
+    )
+    op.create_index(op.f("ix_chat_message_seq"), "chat_message", ["seq"], unique=False)
+    op.drop_column("chat", "last_message_at")
+    op.drop_column("chat", "message_count")
+    op.drop_column("chat", "last_seq")
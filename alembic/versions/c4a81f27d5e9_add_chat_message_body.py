@@ -0,0 +1,51 @@
+"""add chat message body
+
+Revision ID: c4a81f27d5e9
+Revises: 9b3e6f1c2d40
+Create Date: 2026-10-18 17:40:52.208114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c4a81f27d5e9"
+down_revision: Union[str, Sequence[str], None] = "9b3e6f1c2d40"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # existing rows keep their JSON until `python -m frank.db.content migrate`
+    with op.batch_alter_table("chat_message") as batch:
+        batch.add_column(sa.Column("body", sa.LargeBinary(), nullable=True))
+        batch.alter_column("content", existing_type=sa.JSON(), nullable=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    from frank.db.content import decode_body
+
+    messages = sa.table(
+        "chat_message",
+        sa.column("id", sa.Uuid()),
+        sa.column("content", sa.JSON()),
+        sa.column("body", sa.LargeBinary()),
+    )
+    conn = op.get_bind()
+    rows = conn.execute(
+        sa.select(messages.c.id, messages.c.body).where(messages.c.body.is_not(None))
+    ).all()
+    for row in rows:
+        conn.execute(
+            messages.update()
+            .where(messages.c.id == row.id)
+            .values(content=decode_body(row.body))
+        )
+    with op.batch_alter_table("chat_message") as batch:
+        batch.alter_column("content", existing_type=sa.JSON(), nullable=False)
+        batch.drop_column("body")
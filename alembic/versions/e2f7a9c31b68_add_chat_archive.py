@@ -0,0 +1,41 @@
+"""add chat archive
+
+Revision ID: e2f7a9c31b68
+Revises: c4a81f27d5e9
+Create Date: 2026-10-18 20:15:06.741392
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e2f7a9c31b68"
+down_revision: Union[str, Sequence[str], None] = "c4a81f27d5e9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("chat", sa.Column("archive_segment", sa.Integer(), nullable=True))
+    op.add_column("chat", sa.Column("archive_offset", sa.BigInteger(), nullable=True))
+    op.add_column("chat", sa.Column("archive_length", sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    archived = op.get_bind().scalar(
+        sa.text("SELECT COUNT(*) FROM chat WHERE archive_segment IS NOT NULL")
+    )
+    if archived:
+        # their messages would be lost
+        raise RuntimeError(
+            f"{archived} chats are archived; "
+            "run `python -m frank.db.archive restore` first"
+        )
+    op.drop_column("chat", "archive_length")
+    op.drop_column("chat", "archive_offset")
+    op.drop_column("chat", "archive_segment")
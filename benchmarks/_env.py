@@ -0,0 +1,13 @@
+import os
+
+# Benchmarks run without a .env; set dummy values before frank.* imports
+os.environ.setdefault("APP_ENV", "bench")
+os.environ.setdefault("LOGFIRE_TOKEN", "")
+os.environ.setdefault("CACHE_BACKEND", "memory")
+os.environ.setdefault("UPSTASH_REDIS_REST_URL", "https://fake.upstash.io")
+os.environ.setdefault("UPSTASH_REDIS_REST_TOKEN", "bench")
+os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+os.environ.setdefault("HELICONE_API_KEY", "bench")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+os.environ.setdefault("LOGFIRE_IGNORE_NO_CONFIG", "1")
+os.environ.setdefault("LOGFIRE_CONSOLE", "false")
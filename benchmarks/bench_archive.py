@@ -0,0 +1,118 @@
+"""Database size before and after archiving idle chats, and what loading an
+archived chat costs next to a hot one, on a file-backed SQLite database.
+
+Usage: uv run python -m benchmarks.bench_archive [--chats 2000] [--idle 0.9]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart, UserPromptPart
+from sqlalchemy import update
+from benchmarks import _env  # noqa: F401
+from frank.core.config import settings
+from frank.core.db import Base
+from frank.core.shards import Shards
+from frank.db.archive import _vacuum, archive
+from frank.db.models import ChatSession
+from frank.history import History
+from frank.schemas import Chat
+from frank.services import chat as chat_service
+from frank.services.chat import _fetch_chat
+from frank.services.persistence import PendingChat, write_chats
+
+CHAT_MESSAGES = 40
+
+
+def _pending(i: int) -> PendingChat:
+    messages = History(
+        [
+            m
+            for turn in range(CHAT_MESSAGES // 2)
+            for m in (
+                ModelRequest(parts=[UserPromptPart(content=f"question {i} {turn}")]),
+                ModelResponse(parts=[TextPart(content=f"answer {turn} " * 60)]),
+            )
+        ]
+    )
+    chat = Chat(id=str(uuid.uuid4()), userId=str(uuid.uuid4()), lastSeq=len(messages))
+    return PendingChat(chat, dict(enumerate(messages.python_items(), start=1)))
+
+
+async def _time_loads(shard, chat_ids: list[str]) -> list[float]:
+    times = []
+    for chat_id in chat_ids:
+        start = time.perf_counter()
+        async with shard.read_sessions() as session:
+            await _fetch_chat(session, chat_id)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def _mb(path: str) -> float:
+    return os.path.getsize(path) / 1e6
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=2000)
+    parser.add_argument("--idle", type=float, default=0.9)
+    parser.add_argument("--loads", type=int, default=100)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "bench.db")
+    settings.ARCHIVE_DIR = os.path.join(directory, "archive")
+    shards = Shards.connect([f"sqlite+aiosqlite:///{path}"])
+    chat_service.shards = shards
+    shard = shards[0]
+    async with shard.engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    saves = [_pending(i) for i in range(args.chats)]
+    for start in range(0, len(saves), 100):
+        async with shard.sessions() as session:
+            await write_chats(session, saves[start : start + 100])
+    idle = [uuid.UUID(p.chat.id) for p in saves[: int(len(saves) * args.idle)]]
+    async with shard.sessions() as session:
+        await session.execute(
+            update(ChatSession)
+            .where(ChatSession.id.in_(idle))
+            .values(last_message_at=datetime.now(timezone.utc) - timedelta(days=90))
+        )
+        await session.commit()
+    await _vacuum(shard)
+    before = _mb(path)
+
+    start = time.perf_counter()
+    progress = await archive(shards, datetime.now(timezone.utc) - timedelta(days=30))
+    archived_s = time.perf_counter() - start
+    await _vacuum(shard)
+    segments = sum(
+        os.path.getsize(os.path.join(settings.ARCHIVE_DIR, name))
+        for name in os.listdir(settings.ARCHIVE_DIR)
+    )
+    print(
+        f"{progress.chats} of {args.chats} chats, {progress.messages} messages "
+        f"archived in {archived_s:.1f}s"
+    )
+    print(f"  db file    {before:8.1f} MB -> {_mb(path):8.1f} MB")
+    print(f"  segments   {segments / 1e6:8.1f} MB")
+
+    hot = [p.chat.id for p in saves[len(idle) :]][: args.loads]
+    cold = [str(chat_id) for chat_id in idle[: args.loads]]
+    print(f"  {'load':<14} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, chat_ids in (("hot", hot), ("archived", cold), ("restored", cold)):
+        times = await _time_loads(shard, chat_ids)
+        p99 = statistics.quantiles(times, n=100)[98]
+        print(f"  {name:<14} {statistics.median(times):>8.2f} {p99:>8.2f}")
+    await shards.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
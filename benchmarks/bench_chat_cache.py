@@ -0,0 +1,78 @@
+"""Bytes sent to the cache per saved turn as a chat grows, for the
+hash-plus-list layout vs the previous whole-chat blob.
+
+Usage: uv run python -m benchmarks.bench_chat_cache [--turns 200]
+"""
+
+import argparse
+import asyncio
+import json
+import uuid
+from unittest.mock import patch
+from pydantic_ai.messages import (
+    ModelMessagesTypeAdapter,
+    ModelRequest,
+    ModelResponse,
+    TextPart,
+    UserPromptPart,
+)
+from benchmarks import _env  # noqa: F401
+from frank.core.db import Base, SessionLocal, engine
+from frank.core.redis import MemoryBackend
+from frank.schemas import Chat
+from frank.services.chat import save_chat
+
+
+class CountingBackend(MemoryBackend):
+    """In-process cache counting the bytes of script args sent to it"""
+
+    def __init__(self):
+        super().__init__()
+        self.sent = 0
+
+    async def eval(self, script: str, keys: list[str], args: list[str]):
+        self.sent += sum(len(a) for a in args)
+        return await super().eval(script, keys, args)
+
+
+def _legacy_size(chat: Chat) -> int:
+    # the blob the previous save_chat setex'd every turn
+    data = chat.model_dump(by_alias=True, mode="json")
+    data["history"] = json.loads(ModelMessagesTypeAdapter.dump_json(chat.history))
+    return len(json.dumps(data))
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--reply-chars", type=int, default=800)
+    args = parser.parse_args()
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    redis = CountingBackend()
+    chat = Chat(id=str(uuid.uuid4()), userId=str(uuid.uuid4()), title="bench")
+    reply = "x" * args.reply_chars
+
+    print(f"{'turn':>6} {'history':>8} {'blob bytes':>11} {'v2 bytes':>9}")
+    with patch("frank.services.chat.get_redis", return_value=redis):
+        async with SessionLocal() as session:
+            for turn in range(1, args.turns + 1):
+                chat.history.extend(
+                    [
+                        ModelRequest(parts=[UserPromptPart(content=f"q{turn}")]),
+                        ModelResponse(parts=[TextPart(content=reply)]),
+                    ]
+                )
+                before = redis.sent
+                await save_chat(chat, session)
+                if turn == 1 or turn % (args.turns // 10 or 1) == 0:
+                    print(
+                        f"{turn:>6} {len(chat.history):>8} "
+                        f"{_legacy_size(chat):>11} {redis.sent - before:>9}"
+                    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
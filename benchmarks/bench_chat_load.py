@@ -0,0 +1,61 @@
+"""Time for load_chat to read a chat back from the cache as its history
+grows, with and without then reading the messages.
+
+Usage: uv run python -m benchmarks.bench_chat_load [--sizes 10,40,80]
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart, UserPromptPart
+from benchmarks import _env  # noqa: F401
+from frank.core.db import Base, SessionLocal, engine
+from frank.schemas import Chat
+from frank.services.chat import load_chat, save_chat
+
+
+async def _seed(messages: int, reply_chars: int) -> str:
+    chat = Chat(id=str(uuid.uuid4()), userId=str(uuid.uuid4()), title="bench")
+    for i in range(messages // 2):
+        chat.history.extend(
+            [
+                ModelRequest(parts=[UserPromptPart(content=f"q{i}")]),
+                ModelResponse(parts=[TextPart(content="x" * reply_chars)]),
+            ]
+        )
+    async with SessionLocal() as session:
+        await save_chat(chat, session)
+    return chat.id
+
+
+async def _time(chat_id: str, read: bool, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        chat = await load_chat(chat_id, fresh=True)
+        if read:
+            chat.history.messages()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=str, default="10,40,80")
+    parser.add_argument("--reply-chars", type=int, default=800)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    print(f"{'messages':>9} {'load ms':>8} {'load+read ms':>13}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        chat_id = await _seed(size, args.reply_chars)
+        await _time(chat_id, True, 5)  # warm up
+        lazy = await _time(chat_id, False, args.repeat)
+        full = await _time(chat_id, True, args.repeat)
+        print(f"{size:>9} {lazy:>8.3f} {full:>13.3f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
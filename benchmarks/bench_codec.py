@@ -0,0 +1,76 @@
+"""Per-frame CPU and size of the websocket event codecs vs the previous
+dict-based path.
+
+Usage: uv run python -m benchmarks.bench_codec [--n 20000]
+"""
+
+import argparse
+import json
+import timeit
+import pydantic
+from benchmarks import _env  # noqa: F401
+from frank.agents import MODELS
+from frank.codec import MSGPACK_CODEC, decode_event, encode_event
+from frank.schemas import ChatEvent, InitializeAckEvent, ReplyEvent, SendEvent
+
+
+def _legacy_decode(data: str):
+    return pydantic.TypeAdapter(ChatEvent).validate_python(json.loads(data))
+
+
+def _legacy_encode(event) -> str:
+    # model_dump + starlette's send_json encoding
+    return json.dumps(
+        event.model_dump(by_alias=True, mode="json"),
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+
+
+def _codec_encode(event) -> str:
+    return encode_event(event).decode()
+
+
+def _bench(label: str, fn, arg, n: int) -> float:
+    per_frame = timeit.timeit(lambda: fn(arg), number=n) / n * 1e6
+    print(f"  {label:<8} {per_frame:8.2f} us/frame")
+    return per_frame
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=20000)
+    args = parser.parse_args()
+
+    send = SendEvent(chatId="c0ffee", message="hello " * 20, model=MODELS[0].id)
+    cases = {
+        "decode send": (_legacy_decode, decode_event, encode_event(send).decode()),
+        "encode reply": (
+            _legacy_encode,
+            _codec_encode,
+            ReplyEvent(text="some streamed tokens "),
+        ),
+        "encode initialize_ack": (
+            _legacy_encode,
+            _codec_encode,
+            InitializeAckEvent(chatId="c0ffee", models=MODELS),
+        ),
+    }
+
+    for name, (legacy, codec, arg) in cases.items():
+        print(name)
+        before = _bench("legacy", legacy, arg, args.n)
+        after = _bench("codec", codec, arg, args.n)
+        print(f"  saved    {before - after:8.2f} us/frame ({before / after:.1f}x)")
+
+    print("msgpack subprotocol")
+    for event in (cases["encode reply"][2], cases["encode initialize_ack"][2]):
+        print(f"  {event.type.value}")
+        _bench("encode", MSGPACK_CODEC.encode, event, args.n)
+        data = MSGPACK_CODEC.encode(event)
+        _bench("decode", MSGPACK_CODEC.decode, data, args.n)
+        print(f"  size     {len(data):8d} bytes (json {len(encode_event(event))})")
+
+
+if __name__ == "__main__":
+    main()
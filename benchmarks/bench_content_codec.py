@@ -0,0 +1,103 @@
+"""Stored size and decode time per message of each `ChatMessage` content
+encoding: JSON (what the JSON column holds), plain MessagePack, MessagePack
+with zstd alone, and with the shared dictionary (CONTENT_CODEC=zstd).
+
+Usage: uv run python -m benchmarks.bench_content_codec [--turns 500]
+"""
+
+import argparse
+import json
+import random
+import statistics
+import timeit
+import msgpack
+import zstandard
+from pydantic_ai.messages import (
+    ModelRequest,
+    ModelResponse,
+    SystemPromptPart,
+    TextPart,
+    UserPromptPart,
+)
+from pydantic_ai.usage import RequestUsage
+from benchmarks import _env  # noqa: F401
+from frank.agents import CONTEXT_TOKENS
+from frank.db.content import decode_body, encode_body
+from frank.history import History
+from frank.prompts import SYSTEM_PROMPT
+
+WORDS = (
+    "the a to of and in that is for it you with on this be can are as your "
+    "not have or if but so do will would about what which when more one all "
+    "time model python data request response question answer function code "
+    "example file error value list string number user system chat message"
+).split()
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _messages(turns: int) -> list[dict]:
+    rng = random.Random(0)
+    models = list(CONTEXT_TOKENS)
+    messages = []
+    for i in range(turns):
+        parts = [SystemPromptPart(content=SYSTEM_PROMPT)] if i % 10 == 0 else []
+        parts.append(UserPromptPart(content=_text(rng, rng.randint(5, 60))))
+        messages.append(ModelRequest(parts=parts))
+        messages.append(
+            ModelResponse(
+                parts=[TextPart(content=_text(rng, rng.randint(20, 400)))],
+                usage=RequestUsage(
+                    input_tokens=rng.randint(50, 50_000),
+                    output_tokens=rng.randint(10, 2_000),
+                ),
+                model_name=rng.choice(models),
+                provider_name="openrouter",
+                provider_response_id=f"gen-{rng.getrandbits(64):x}",
+                finish_reason="stop",
+            )
+        )
+    return list(History(messages).python_items())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=500)
+    args = parser.parse_args()
+
+    messages = _messages(args.turns)
+    plain = zstandard.ZstdCompressor(level=3)
+    unplain = zstandard.ZstdDecompressor()
+    encodings = {
+        "json": (
+            lambda m: json.dumps([m]).encode(),
+            json.loads,
+        ),
+        "msgpack": (lambda m: msgpack.packb([m]), msgpack.unpackb),
+        "msgpack+zstd": (
+            lambda m: plain.compress(msgpack.packb([m])),
+            lambda b: msgpack.unpackb(unplain.decompress(b)),
+        ),
+        "msgpack+zstd+dict": (lambda m: encode_body([m]), decode_body),
+    }
+
+    json_bytes = None
+    print(f"{len(messages)} messages")
+    print(f"  {'encoding':<18} {'bytes':>9} {'median':>7} {'ratio':>6} {'decode':>10}")
+    for name, (encode, decode) in encodings.items():
+        encoded = [encode(m) for m in messages]
+        assert [decode(b) for b in encoded] == [[m] for m in messages]
+        total = sum(map(len, encoded))
+        json_bytes = json_bytes or total
+        seconds = timeit.timeit(lambda: [decode(b) for b in encoded], number=5)
+        print(
+            f"  {name:<18} {total:>9} {statistics.median(map(len, encoded)):>7.0f}"
+            f" {json_bytes / total:>5.1f}x"
+            f" {seconds / 5 / len(messages) * 1e6:>7.1f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Save and load latency for one chat as the chat_message table grows, on a
+file-backed SQLite database. Both should stay flat: saves read the chat row's
+counters instead of scanning for MAX(seq), and loads read a range of the
+(chat_id, seq) index.
+
+Usage: uv run python -m benchmarks.bench_db_scale [--rows 10000,100000,1000000]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart, UserPromptPart
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from benchmarks import _env  # noqa: F401
+from frank.core.db import Base
+from frank.db.models import ChatMessage, ChatRole, ChatSession
+from frank.history import History
+from frank.schemas import Chat
+from frank.services.chat import _fetch_chat
+from frank.services.persistence import PendingChat, write_chats
+
+CHAT_MESSAGES = 200
+
+
+async def _grow(engine, rows: int) -> list[uuid.UUID]:
+    """Add chats of CHAT_MESSAGES messages until the table has `rows`"""
+    chat_ids = [uuid.uuid4() for _ in range(rows // CHAT_MESSAGES)]
+    content = [{"kind": "request", "parts": []}]
+    async with engine.begin() as conn:
+        await conn.execute(
+            insert(ChatSession),
+            [
+                {
+                    "id": chat_id,
+                    "user_id": uuid.uuid4(),
+                    "last_seq": CHAT_MESSAGES,
+                    "message_count": CHAT_MESSAGES,
+                }
+                for chat_id in chat_ids
+            ],
+        )
+        for chat_id in chat_ids:
+            await conn.execute(
+                insert(ChatMessage),
+                [
+                    {
+                        "id": uuid.uuid4(),
+                        "chat_id": chat_id,
+                        "seq": seq,
+                        "role": ChatRole.USER.value,
+                        "content": content,
+                    }
+                    for seq in range(1, CHAT_MESSAGES + 1)
+                ],
+            )
+    return chat_ids
+
+
+async def _time_save(sessions, chat: Chat, turn: int) -> float:
+    messages = History(
+        [
+            ModelRequest(parts=[UserPromptPart(content=f"q{turn}")]),
+            ModelResponse(parts=[TextPart(content="x" * 800)]),
+        ]
+    )
+    pending = PendingChat(
+        chat, dict(enumerate(messages.python_items(), start=chat.last_seq + 1))
+    )
+    chat.last_seq += len(messages)
+    start = time.perf_counter()
+    async with sessions() as session:
+        await write_chats(session, [pending])
+    return (time.perf_counter() - start) * 1000
+
+
+async def _time_load(sessions, chat_id: str) -> float:
+    start = time.perf_counter()
+    async with sessions() as session:
+        await _fetch_chat(session, chat_id)
+    return (time.perf_counter() - start) * 1000
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=str, default="10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    print(f"{'rows':>9} {'save p50 ms':>12} {'save p99 ms':>12} {'load p50 ms':>12}")
+    grown = 0
+    for rows in (int(r) for r in args.rows.split(",")):
+        chat_ids = await _grow(engine, rows - grown)
+        grown = rows
+        chat_id = str(chat_ids[len(chat_ids) // 2])
+        chat = Chat(id=chat_id, userId=str(uuid.uuid4()), lastSeq=CHAT_MESSAGES)
+        saves = [await _time_save(sessions, chat, i) for i in range(args.repeat)]
+        loads = [await _time_load(sessions, chat_id) for _ in range(args.repeat)]
+        p99 = statistics.quantiles(saves, n=100)[98]
+        print(
+            f"{rows:>9} {statistics.median(saves):>12.2f} {p99:>12.2f} "
+            f"{statistics.median(loads):>12.2f}"
+        )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
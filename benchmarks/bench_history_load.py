@@ -0,0 +1,86 @@
+"""Time to load a chat from the database on a cache miss, windowed vs the
+whole history, as the chat grows.
+
+Usage: uv run python -m benchmarks.bench_history_load [--sizes 100,1000,5000]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from pydantic_ai.messages import (
+    ModelMessagesTypeAdapter,
+    ModelRequest,
+    ModelResponse,
+    TextPart,
+    UserPromptPart,
+)
+from benchmarks import _env  # noqa: F401
+from frank.core.db import Base, SessionLocal, engine
+from frank.db.models import ChatMessage, ChatRole, ChatSession
+from frank.services.chat import _fetch_chat
+
+
+async def _seed(messages: int, reply_chars: int) -> str:
+    chat_id = uuid.uuid4()
+    async with SessionLocal() as session:
+        session.add(
+            ChatSession(
+                id=chat_id,
+                user_id=uuid.uuid4(),
+                title="bench",
+                last_seq=messages,
+                message_count=messages,
+            )
+        )
+        for seq in range(1, messages + 1):
+            if seq % 2:
+                msg = ModelRequest(parts=[UserPromptPart(content=f"q{seq}")])
+                role = ChatRole.USER
+            else:
+                msg = ModelResponse(parts=[TextPart(content="x" * reply_chars)])
+                role = ChatRole.ASSISTANT
+            session.add(
+                ChatMessage(
+                    chat_id=chat_id,
+                    seq=seq,
+                    role=role.value,
+                    content=json.loads(ModelMessagesTypeAdapter.dump_json([msg])),
+                )
+            )
+        await session.commit()
+    return str(chat_id)
+
+
+async def _time(chat_id: str, window: int | None, repeat: int) -> float:
+    async with SessionLocal() as session:
+        await _fetch_chat(session, chat_id, window=window)  # warm up
+        session.expunge_all()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            await _fetch_chat(session, chat_id, window=window)
+            session.expunge_all()
+        return (time.perf_counter() - start) / repeat * 1000
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=str, default="100,1000,5000")
+    parser.add_argument("--reply-chars", type=int, default=800)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    print(f"{'messages':>9} {'window ms':>10} {'full ms':>9}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        chat_id = await _seed(size, args.reply_chars)
+        windowed = await _time(chat_id, 80, args.repeat)
+        full = await _time(chat_id, None, args.repeat)
+        print(f"{size:>9} {windowed:>10.2f} {full:>9.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""Database connections held as the number of idle /ws/chat sockets grows.
+
+Each socket authenticates, initializes without a chat and then sits idle.
+Connections checked out of every pool (the write and read engines, and each
+shard's) should stay flat instead of growing with the number of sockets.
+
+Usage: uv run python -m benchmarks.bench_idle_sockets [--steps 10,50,200]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+from contextlib import ExitStack
+
+_db_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_db_dir}/bench.db"
+
+from benchmarks import _env  # noqa: E402,F401
+from starlette.testclient import TestClient  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncEngine  # noqa: E402
+from frank.core.db import Base, SessionLocal, engine, read_engine  # noqa: E402
+from frank.core.shards import shards  # noqa: E402
+from frank.db import models  # noqa: E402,F401
+from frank.services.auth import create_anonymous_user  # noqa: E402
+from main import app  # noqa: E402
+
+
+def _pools() -> dict[str, AsyncEngine]:
+    """Each distinct engine, by what it is for"""
+    named = {"write": engine, "read": read_engine}
+    for i, shard in enumerate(shards):
+        named[f"shard {i} write"] = shard.engine
+        named[f"shard {i} read"] = shard.read_engine
+    pools: dict[str, AsyncEngine] = {}
+    for name, pool_engine in named.items():
+        if pool_engine not in pools.values():
+            pools[name] = pool_engine
+    return pools
+
+
+def _row(sockets: int, pools: dict[str, AsyncEngine]) -> str:
+    return f"{sockets:>8}" + "".join(
+        f" {e.pool.checkedout():>14}" for e in pools.values()
+    )
+
+
+async def _setup() -> str:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as session:
+        _, token = await create_anonymous_user(session)
+        return token.token
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=str, default="10,50,200")
+    args = parser.parse_args()
+
+    token = asyncio.run(_setup())
+    steps = [int(n) for n in args.steps.split(",")]
+
+    pools = _pools()
+    for name, e in pools.items():
+        print(f"{name}: pool size {e.pool.size()}, max overflow {e.pool._max_overflow}")
+    print("checked out")
+    print(f"{'sockets':>8}" + "".join(f" {name:>14}" for name in pools))
+    with TestClient(app) as client, ExitStack() as stack:
+        print(_row(0, pools))
+        sockets = []
+        for target in steps:
+            while len(sockets) < target:
+                ws = stack.enter_context(client.websocket_connect(f"/ws/chat?token={token}"))
+                ws.send_json({"type": "initialize"})
+                assert ws.receive_json()["type"] == "initialize_ack"
+                sockets.append(ws)
+            print(_row(len(sockets), pools))
+
+
+if __name__ == "__main__":
+    main()
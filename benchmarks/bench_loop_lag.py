@@ -0,0 +1,80 @@
+"""Worst event loop stall while long chat histories are decoded and encoded,
+inline vs offloaded to the serialization pools. The stall is what every
+other socket on the worker sees as a gap in its stream.
+
+Usage: uv run python -m benchmarks.bench_loop_lag [--messages 80,400]
+"""
+
+import argparse
+import asyncio
+import time
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart, UserPromptPart
+from benchmarks import _env  # noqa: F401
+from frank.core.config import settings
+from frank.history import History, _message_adapter
+
+
+def _raw_history(messages: int, reply_chars: int) -> list[str]:
+    raw = []
+    for i in range(messages // 2):
+        raw += [
+            _message_adapter.dump_json(msg).decode()
+            for msg in (
+                ModelRequest(parts=[UserPromptPart(content=f"q{i}")]),
+                ModelResponse(parts=[TextPart(content=f"{i}" * reply_chars)]),
+            )
+        ]
+    return raw
+
+
+async def _worst_lag(raw: list[str], repeat: int) -> float:
+    worst = 0.0
+    done = asyncio.Event()
+
+    async def _tick():
+        nonlocal worst
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            worst = max(worst, time.perf_counter() - start - 0.001)
+
+    ticker = asyncio.create_task(_tick())
+    await asyncio.sleep(0.01)
+    for _ in range(repeat):
+        history = History(raw)
+        await history.decoded()
+        await history.dump_json()
+        await asyncio.sleep(0.005)  # let the ticker in between rounds
+    done.set()
+    await ticker
+    return worst * 1000
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=str, default="80,400")
+    parser.add_argument("--reply-chars", type=int, default=4000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(
+        f"{'messages':>9} {'KiB':>6} {'inline ms':>10} {'thread ms':>10} "
+        f"{'process ms':>11}"
+    )
+    for size in (int(s) for s in args.messages.split(",")):
+        raw = _raw_history(size, args.reply_chars)
+        kib = sum(map(len, raw)) // 1024
+        settings.SERIALIZE_OFFLOAD_BYTES = 1 << 62
+        await _worst_lag(raw, 1)  # warm up
+        inline = await _worst_lag(raw, args.repeat)
+        settings.SERIALIZE_OFFLOAD_BYTES = 0
+        thread = await _worst_lag(raw, args.repeat)
+        settings.SERIALIZE_PROCESS_BYTES = 1
+        await _worst_lag(raw, 1)  # start the workers
+        process = await _worst_lag(raw, args.repeat)
+        settings.SERIALIZE_PROCESS_BYTES = 0
+        print(f"{size:>9} {kib:>6} {inline:>10.2f} {thread:>10.2f} {process:>11.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
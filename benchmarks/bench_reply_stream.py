@@ -0,0 +1,86 @@
+"""Frames and CPU per streamed reply, with and without delta coalescing.
+
+Usage: uv run python -m benchmarks.bench_reply_stream [--deltas 600] [--gap-ms 2]
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from unittest.mock import AsyncMock, patch
+from benchmarks import _env  # noqa: F401
+from frank.schemas import AgentQuery, AuthUserOut, Chat
+from frank.ws import ChatWebSocketHandler
+
+
+class FakeWebSocket:
+    """Counts frames and bytes sent by the handler"""
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        self.first_frame_at: float | None = None
+
+    async def send_text(self, data: str) -> None:
+        if self.first_frame_at is None:
+            self.first_frame_at = time.perf_counter()
+        self.frames += 1
+        self.bytes += len(data.encode())
+
+
+async def run_once(window_ms: int, deltas: int, gap: float) -> dict:
+    async def _fake_stream(*args, on_done=None, **kwargs):
+        for i in range(deltas):
+            await asyncio.sleep(gap)
+            yield f"tok{i % 10} "
+        if on_done:
+            await on_done(AgentQuery(prompt="bench", model="bench"), [])
+
+    ws = FakeWebSocket()
+    user = AuthUserOut(id=str(uuid.uuid4()))
+    handler = ChatWebSocketHandler(ws, user, coalesce_ms=window_ms)
+    chat = Chat(id=str(uuid.uuid4()), userId=user.id, title="bench")
+
+    with (
+        patch("frank.services.generation.stream_agent_response", _fake_stream),
+        patch.object(handler, "handle_agent_done", AsyncMock()),
+    ):
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        await handler.start_reply(AgentQuery(prompt="bench", model="bench"), chat)
+        await handler.reply_task
+        await handler.outbox.drain()
+        cpu = time.process_time() - cpu_started
+        wall = time.perf_counter() - started
+
+    return {
+        "window_ms": window_ms,
+        "frames": ws.frames,
+        "bytes": ws.bytes,
+        "cpu_ms": cpu * 1000,
+        "wall_ms": wall * 1000,
+        "ttft_ms": ((ws.first_frame_at or started) - started) * 1000,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--deltas", type=int, default=600)
+    parser.add_argument("--gap-ms", type=float, default=2)
+    parser.add_argument("--windows", type=str, default="0,16,30,50")
+    args = parser.parse_args()
+
+    print(f"{args.deltas} deltas, {args.gap_ms} ms apart")
+    print(
+        f"{'window':>8} {'frames':>8} {'bytes':>8} {'cpu ms':>8} {'wall ms':>8} {'ttft ms':>8}"
+    )
+    for window in (int(w) for w in args.windows.split(",")):
+        r = await run_once(window, args.deltas, args.gap_ms / 1000)
+        print(
+            f"{r['window_ms']:>8} {r['frames']:>8} {r['bytes']:>8} "
+            f"{r['cpu_ms']:>8.1f} {r['wall_ms']:>8.1f} {r['ttft_ms']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+"""Chat writes per second as chats are split over more SQLite files, with
+many users each writing turns to the DB one transaction at a time.
+
+Usage: uv run python -m benchmarks.bench_shards [--users 200 --turns 5 --shards 1,2,4,8]
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+import uuid
+from unittest.mock import patch
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart, UserPromptPart
+from benchmarks import _env  # noqa: F401
+from frank.core.db import Base
+from frank.core.shards import Shards, shard_urls
+from frank.history import History
+from frank.schemas import Chat
+from frank.services.persistence import ChatWriter, PendingChat
+
+
+async def _run(count: int, users: int, turns: int) -> float:
+    template = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/chats-{{shard}}.db"
+    shards = Shards.connect(shard_urls(count, template))
+    for shard in shards:
+        async with shard.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    writer = ChatWriter()
+
+    async def _user_turns():
+        chat = Chat(id=str(uuid.uuid4()), userId=str(uuid.uuid4()), title="bench")
+        for turn in range(turns):
+            messages = History(
+                [
+                    ModelRequest(parts=[UserPromptPart(content=f"q{turn}")]),
+                    ModelResponse(parts=[TextPart(content="x" * 800)]),
+                ]
+            )
+            first = chat.last_seq + 1
+            chat.last_seq += len(messages)
+            await writer.write(
+                PendingChat(chat, dict(enumerate(messages.python_items(), first)))
+            )
+
+    with patch("frank.services.persistence.shards", shards):
+        start = time.perf_counter()
+        await asyncio.gather(*(_user_turns() for _ in range(users)))
+        elapsed = time.perf_counter() - start
+    await shards.dispose()
+    return users * turns / elapsed
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--shards", type=str, default="1,2,4,8")
+    args = parser.parse_args()
+
+    print(f"{'shards':>6} {'saves/s':>8}")
+    for count in (int(n) for n in args.shards.split(",")):
+        rate = await _run(count, args.users, args.turns)
+        print(f"{count:>6} {rate:>8.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
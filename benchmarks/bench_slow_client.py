@@ -0,0 +1,103 @@
+"""Upstream read time, frames and queue depth for a reply sent to a client
+whose socket writes are slow, per outbox size.
+
+Usage: uv run python -m benchmarks.bench_slow_client [--deltas 600] [--write-ms 20]
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from unittest.mock import AsyncMock, patch
+from benchmarks import _env  # noqa: F401
+from frank.core.config import settings
+from frank.schemas import AgentQuery, AuthUserOut, Chat
+from frank.ws import ChatWebSocketHandler
+
+
+class SlowWebSocket:
+    """Takes `delay` seconds per frame, like a client on a bad link"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.frames = 0
+
+    async def send_text(self, data: str) -> None:
+        await asyncio.sleep(self.delay)
+        self.frames += 1
+
+    async def close(self, code: int = 1000, reason: str | None = None) -> None:
+        pass
+
+
+async def run_once(size: int, deltas: int, gap: float, delay: float) -> dict:
+    upstream_done = 0.0
+
+    async def _fake_stream(*args, on_done=None, **kwargs):
+        nonlocal upstream_done
+        for i in range(deltas):
+            await asyncio.sleep(gap)
+            yield f"tok{i % 10} "
+        upstream_done = time.perf_counter()
+
+    settings.WS_OUTBOX_SIZE = size
+    ws = SlowWebSocket(delay)
+    user = AuthUserOut(id=str(uuid.uuid4()))
+    handler = ChatWebSocketHandler(ws, user, coalesce_ms=0)
+    chat = Chat(id=str(uuid.uuid4()), userId=user.id, title="bench")
+    peak = 0
+
+    async def _watch():
+        nonlocal peak
+        while True:
+            peak = max(peak, len(handler.outbox))
+            await asyncio.sleep(0.001)
+
+    with (
+        patch("frank.services.generation.stream_agent_response", _fake_stream),
+        patch.object(handler, "handle_agent_done", AsyncMock()),
+    ):
+        watcher = asyncio.create_task(_watch())
+        started = time.perf_counter()
+        await handler.start_reply(AgentQuery(prompt="bench", model="bench"), chat)
+        await handler.reply_task
+        await handler.outbox.drain()
+        finished = time.perf_counter()
+        watcher.cancel()
+
+    return {
+        "size": size,
+        "upstream_ms": (upstream_done - started) * 1000,
+        "delivered_ms": (finished - started) * 1000,
+        "frames": ws.frames,
+        "peak": peak,
+        "closed": handler.outbox.closed,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--deltas", type=int, default=600)
+    parser.add_argument("--gap-ms", type=float, default=2)
+    parser.add_argument("--write-ms", type=float, default=20)
+    parser.add_argument("--sizes", type=str, default="8,64,256")
+    args = parser.parse_args()
+
+    print(
+        f"{args.deltas} deltas {args.gap_ms} ms apart, "
+        f"{args.write_ms} ms per socket write"
+    )
+    print(
+        f"{'size':>6} {'upstream ms':>12} {'delivered ms':>13} "
+        f"{'frames':>7} {'peak':>5} {'closed':>7}"
+    )
+    for size in (int(s) for s in args.sizes.split(",")):
+        r = await run_once(size, args.deltas, args.gap_ms / 1000, args.write_ms / 1000)
+        print(
+            f"{r['size']:>6} {r['upstream_ms']:>12.1f} {r['delivered_ms']:>13.1f} "
+            f"{r['frames']:>7} {r['peak']:>5} {str(r['closed']):>7}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
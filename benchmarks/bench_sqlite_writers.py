@@ -0,0 +1,117 @@
+"""Write and read latency when many sockets hit one SQLite file at once,
+with every connection free to write (one shared pool, default pragmas) vs a
+single write connection beside a read-only WAL pool.
+
+Each writer saves turns of its own chat straight to the DB; each reader
+loads a chat the way a REST fetch does, every --pause-ms.
+
+Usage: uv run python -m benchmarks.bench_sqlite_writers [--writers 50 --readers 10]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart, UserPromptPart
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from benchmarks import _env  # noqa: F401
+from frank.core.config import settings
+from frank.core.db import Base, create_engines
+from frank.history import History
+from frank.schemas import Chat
+from frank.services.chat import _fetch_chat
+from frank.services.persistence import PendingChat, write_chats
+
+
+def _ms(samples: list[float]) -> str:
+    p99 = statistics.quantiles(samples, n=100)[98] if len(samples) > 1 else 0
+    return f"{statistics.median(samples):>8.1f} {p99:>8.1f}"
+
+
+async def _run(
+    single_writer: bool, writers: int, readers: int, turns: int, pause_ms: int
+):
+    settings.SQLITE_SINGLE_WRITER = single_writer
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    write_engine, read_engine = create_engines(f"sqlite+aiosqlite:///{path}")
+    async with write_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    write_sessions = async_sessionmaker(write_engine, expire_on_commit=False)
+    read_sessions = async_sessionmaker(read_engine, expire_on_commit=False)
+    chat_ids = [str(uuid.uuid4()) for _ in range(writers)]
+    write_ms, read_ms, errors = [], [], 0
+    done = asyncio.Event()
+
+    async def _write(chat_id: str):
+        nonlocal errors
+        chat = Chat(id=chat_id, userId=str(uuid.uuid4()), title="bench")
+        for turn in range(turns):
+            messages = History(
+                [
+                    ModelRequest(parts=[UserPromptPart(content=f"q{turn}")]),
+                    ModelResponse(parts=[TextPart(content="x" * 800)]),
+                ]
+            )
+            pending = PendingChat(
+                chat, dict(enumerate(messages.python_items(), chat.last_seq + 1))
+            )
+            start = time.perf_counter()
+            try:
+                async with write_sessions() as session:
+                    await write_chats(session, [pending])
+                chat.last_seq += len(messages)
+            except OperationalError:
+                errors += 1
+            write_ms.append((time.perf_counter() - start) * 1000)
+
+    async def _read(i: int):
+        nonlocal errors
+        while not done.is_set():
+            start = time.perf_counter()
+            try:
+                async with read_sessions() as session:
+                    await _fetch_chat(session, chat_ids[i % writers])
+            except OperationalError:
+                errors += 1
+            read_ms.append((time.perf_counter() - start) * 1000)
+            await asyncio.sleep(pause_ms / 1000)
+
+    start = time.perf_counter()
+    reading = [asyncio.create_task(_read(i)) for i in range(readers)]
+    await asyncio.gather(*(_write(chat_id) for chat_id in chat_ids))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await asyncio.gather(*reading)
+    await write_engine.dispose()
+    await read_engine.dispose()
+    return writers * turns / elapsed, len(read_ms) / elapsed, write_ms, read_ms, errors
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writers", type=int, default=50)
+    parser.add_argument("--readers", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--pause-ms", type=int, default=50)
+    args = parser.parse_args()
+
+    print(
+        f"{'mode':<14} {'saves/s':>8} {'loads/s':>8} {'write p50':>9} {'p99':>8} "
+        f"{'read p50':>8} {'p99':>8} {'errors':>6}"
+    )
+    for name, single_writer in (("shared pool", False), ("single writer", True)):
+        saves, loads, write_ms, read_ms, errors = await _run(
+            single_writer, args.writers, args.readers, args.turns, args.pause_ms
+        )
+        print(
+            f"{name:<14} {saves:>8.0f} {loads:>8.0f} {_ms(write_ms):>18} {_ms(read_ms):>17} "
+            f"{errors:>6}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
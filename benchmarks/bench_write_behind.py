@@ -0,0 +1,75 @@
+"""Saves per second and DB transactions when many chats save turns at once,
+writing each save through vs queueing them behind the cache, on a file-backed
+SQLite database.
+
+Usage: uv run python -m benchmarks.bench_write_behind [--chats 200 --turns 5]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+from unittest.mock import patch
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart, UserPromptPart
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from benchmarks import _env  # noqa: F401
+from frank.core.config import settings
+from frank.core.db import Base
+from frank.schemas import Chat
+from frank.services.chat import save_chat
+from frank.services.persistence import ChatWriter, write_chats
+
+
+async def _run(chats: int, turns: int, write_behind_ms: int) -> tuple[float, int]:
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    writer = ChatWriter(async_sessionmaker(engine, expire_on_commit=False))
+    transactions = 0
+
+    async def _counted(session, batch):
+        nonlocal transactions
+        transactions += 1
+        await write_chats(session, batch)
+
+    async def _chat_turns():
+        chat = Chat(id=str(uuid.uuid4()), userId=str(uuid.uuid4()), title="bench")
+        for turn in range(turns):
+            chat.history.extend(
+                [
+                    ModelRequest(parts=[UserPromptPart(content=f"q{turn}")]),
+                    ModelResponse(parts=[TextPart(content="x" * 800)]),
+                ]
+            )
+            await save_chat(chat)
+
+    settings.WRITE_BEHIND_MS = write_behind_ms
+    with (
+        patch("frank.services.chat.writer", writer),
+        patch("frank.services.persistence.write_chats", _counted),
+    ):
+        start = time.perf_counter()
+        await asyncio.gather(*(_chat_turns() for _ in range(chats)))
+        await writer.close()
+        elapsed = time.perf_counter() - start
+    await engine.dispose()
+    return chats * turns / elapsed, transactions
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'mode':>14} {'saves/s':>9} {'transactions':>13}")
+    for label, delay in (("write-through", 0), ("write-behind", 200)):
+        rate, transactions = await _run(args.chats, args.turns, delay)
+        print(f"{label:>14} {rate:>9.0f} {transactions:>13}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,6 +1,6 @@
 import useWebSocket, { ReadyState } from 'react-use-websocket';
 import { flushSync } from 'react-dom';
-import { useEffect, useCallback, useMemo, useRef } from 'react';
+import { useEffect, useCallback, useMemo, useRef, useState } from 'react';
 import type {
   ChatEvent,
   ChatTitleEvent,
@@ -18,7 +18,9 @@ import { useNavigate } from 'react-router';
 
 export default function useChat(chatId?: string) {
   const { model, history, addMessage, clearHistory, setHistory, authToken } = useStore();
-  const shouldConnect = useMemo(() => !!authToken, [authToken]);
+  // closed by the server for being idle; reconnect once the user is back
+  const [idle, setIdle] = useState(false);
+  const shouldConnect = useMemo(() => !!authToken && !idle, [authToken, idle]);
   const navigate = useNavigate();
   const prevChatIdRef = useRef(chatId);
 
@@ -27,15 +29,23 @@ export default function useChat(chatId?: string) {
     {
       onOpen: async () => {
         useStore.setState({ loading: true });
-        if (chatId) await loadChat(chatId);
+        // keep the partial reply on screen and ask for the rest of it
+        const resuming = !!chatId && useStore.getState().sending;
+        if (!resuming) useStore.setState({ replyOffset: 0 });
+        if (chatId && !resuming) await loadChat(chatId);
         sendJsonMessage({
           type: EventType.INITIALIZE,
           chatId,
+          resumeFrom: resuming ? useStore.getState().replyOffset : null,
           ts: new Date().toISOString(),
         });
         console.log('ws open');
       },
       onClose: async (event) => {
+        if (event.code === 4000) {
+          setIdle(true);
+          return;
+        }
         if (event.code === 1008 || event.code === 4401 || event.code === 1006) {
           console.log('ws auth failed, re-authenticating');
           await useStore.getState().signInAnonymously();
@@ -50,12 +60,25 @@ export default function useChat(chatId?: string) {
     useStore.setState({ connected: readyState === ReadyState.OPEN });
   }, [readyState]);
 
+  useEffect(() => {
+    if (!idle) return;
+    const wake = () => {
+      if (document.visibilityState === 'visible') setIdle(false);
+    };
+    window.addEventListener('focus', wake);
+    document.addEventListener('visibilitychange', wake);
+    return () => {
+      window.removeEventListener('focus', wake);
+      document.removeEventListener('visibilitychange', wake);
+    };
+  }, [idle]);
+
   const sendMessage = useCallback(
     async (message: string) => {
       flushSync(() => {
         addMessage({ role: 'user', content: message });
       });
-      useStore.setState({ sending: true });
+      useStore.setState({ sending: true, replyOffset: 0 });
 
       if (chatId) {
         // add placeholder message
@@ -72,6 +95,8 @@ export default function useChat(chatId?: string) {
         const newChat: NewChatEvent = {
           type: EventType.NEW_CHAT,
           message,
+          // start the reply now; the chat page picks it up by resuming
+          stream: true,
           model: model?.id ?? null,
           ts: new Date().toISOString(),
         };
@@ -108,6 +133,10 @@ export default function useChat(chatId?: string) {
         handleReply(event as ReplyEvent);
         break;
 
+      case EventType.PING:
+        sendJsonMessage({ type: EventType.PONG, ts: new Date().toISOString() });
+        break;
+
       case EventType.INITIALIZE_ACK: {
         const { models } = event as InitializeAckEvent;
         useStore.getState().setModels(models);
@@ -130,7 +159,15 @@ export default function useChat(chatId?: string) {
   }
 
   async function handleReply(event: ReplyEvent) {
-    if (event.text) {
+    // skip any text we already had before a reconnect
+    const { replyOffset } = useStore.getState();
+    const offset = event.offset ?? replyOffset;
+    const text = event.text?.slice(Math.max(0, replyOffset - offset));
+    useStore.setState({
+      replyOffset: Math.max(replyOffset, offset + (event.text?.length ?? 0)),
+    });
+
+    if (text) {
       const lastMsg = history[history.length - 1];
 
       if (lastMsg && lastMsg.role === 'assistant') {
@@ -138,11 +175,11 @@ export default function useChat(chatId?: string) {
           ...history.slice(0, -1),
           {
             ...lastMsg,
-            content: lastMsg.content + event.text,
+            content: lastMsg.content + text,
           },
         ]);
       } else {
-        setHistory([...history, { role: 'assistant', content: event.text }]);
+        setHistory([...history, { role: 'assistant', content: text }]);
       }
     }
 
@@ -180,6 +217,7 @@ export default function useChat(chatId?: string) {
   // Load chat when chatId changes (e.g. navigating between chats via history panel)
   useEffect(() => {
     if (chatId && chatId !== prevChatIdRef.current && readyState === ReadyState.OPEN) {
+      useStore.setState({ replyOffset: 0 });
       loadChat(chatId);
       sendJsonMessage({
         type: EventType.INITIALIZE,
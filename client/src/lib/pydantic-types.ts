@@ -88,6 +88,7 @@ export interface InitializeAckEvent {
 export interface InitializeEvent {
   type?: 'initialize';
   chatId?: string | null;
+  resumeFrom?: number | null;
   ts?: string;
 }
 /**
@@ -106,6 +107,21 @@ export interface NewChatEvent {
   type?: 'new_chat';
   message: string;
   model?: string | null;
+  stream?: boolean;
+  ts?: string;
+}
+/**
+ * Heartbeat; the receiving side answers with a pong
+ */
+export interface PingEvent {
+  type?: 'ping';
+  ts?: string;
+}
+/**
+ * Answer to a heartbeat ping
+ */
+export interface PongEvent {
+  type?: 'pong';
   ts?: string;
 }
 /**
@@ -115,6 +131,8 @@ export interface ReplyEvent {
   type?: 'reply';
   text?: string;
   done?: boolean;
+  generationId?: string | null;
+  offset?: number;
   ts?: string;
 }
 /**
@@ -127,6 +145,14 @@ export interface SendEvent {
   model: string | null;
   ts?: string;
 }
+/**
+ * Client sends this to stop the reply that is currently streaming
+ */
+export interface StopEvent {
+  type?: 'stop';
+  chatId?: string | null;
+  ts?: string;
+}
 /**
  * Chat session for client, with history converted to ChatEntry list
  */
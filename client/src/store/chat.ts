@@ -11,6 +11,7 @@ export const createChatSlice: StateCreator<ChatState, [], [], ChatState> = (set,
     addMessage: (message) => set({ history: [...get().history, message] }),
     loading: false,
     sending: false,
+    replyOffset: 0,
     connected: false,
     startNewChat: () => {},
     sendMessage: () => {},
@@ -6,9 +6,12 @@ export type ChatEvent =
   | types.InitializeAckEvent
   | types.NewChatEvent
   | types.NewChatAckEvent
+  | types.PingEvent
+  | types.PongEvent
   | types.ReplyEvent
   | types.ChatTitleEvent
-  | types.SendEvent;
+  | types.SendEvent
+  | types.StopEvent;
 
 export const EventType = {
   INITIALIZE: 'initialize',
@@ -18,6 +21,9 @@ export const EventType = {
   REPLY: 'reply',
   CHAT_TITLE: 'chat_title',
   SEND: 'send',
+  STOP: 'stop',
+  PING: 'ping',
+  PONG: 'pong',
   ERROR: 'error',
 } as const;
 
@@ -34,6 +40,8 @@ export interface ChatState {
   addMessage: (message: types.ChatEntry) => void;
   loading: boolean;
   sending: boolean;
+  // reply text received so far, so a reconnect can resume mid-reply
+  replyOffset: number;
   connected: boolean;
   startNewChat: () => void;
   sendMessage: (message: string) => void;
@@ -2,7 +2,7 @@
 set -e
 
 uv run alembic upgrade head
-uv run uvicorn main:app --host 0.0.0.0 --port 8000 &
+uv run uvicorn main:app --ws websockets --ws-per-message-deflate true --host 0.0.0.0 --port 8000 &
 
 python -c "
 import socket, time
@@ -2,8 +2,13 @@ from typing import Awaitable, Callable, AsyncGenerator
 from cachetools import LRUCache, cached
 from openai import AsyncOpenAI
 from pydantic_ai import Agent
-from pydantic_ai.messages import ModelMessage
-from pydantic_ai.result import StreamedRunResult
+from pydantic_ai.messages import (
+    ModelMessage,
+    ModelRequest,
+    ModelResponse,
+    TextPart,
+    UserPromptPart,
+)
 from pydantic_ai.models.openai import OpenAIModel
 from pydantic_ai.providers.openai import OpenAIProvider
 from frank.core.config import settings
@@ -27,6 +32,16 @@ MODELS = [
 
 DEFAULT_MODEL = next((m for m in MODELS if m.is_default), MODELS[0])
 
+# context window of each model, in tokens
+CONTEXT_TOKENS = {
+    "google/gemini-3-flash-preview": 1_048_576,
+    "openai/gpt-5.2": 400_000,
+    "anthropic/claude-sonnet-4.5": 200_000,
+    "x-ai/grok-4.1-fast": 2_000_000,
+    "deepseek/deepseek-v3.2": 163_840,
+    "meta-llama/llama-4-maverick": 1_048_576,
+}
+
 base_agent = Agent(instrument=True)
 
 
@@ -56,7 +71,7 @@ def base_agent_system_prompt() -> str:
     return SYSTEM_PROMPT
 
 
-OnDoneCallback = Callable[[AgentQuery, StreamedRunResult], Awaitable[None]]
+OnDoneCallback = Callable[[AgentQuery, list[ModelMessage]], Awaitable[None]]
 
 
 async def stream_agent_response(
@@ -82,4 +97,16 @@ async def stream_agent_response(
 
     if on_done:
         query.result = "".join(output)
-        await on_done(query, result)
+        await on_done(query, result.new_messages())
+
+
+def partial_messages(query: AgentQuery) -> list[ModelMessage]:
+    """History entries for a reply that was stopped before the agent finished"""
+    messages: list[ModelMessage] = [
+        ModelRequest(parts=[UserPromptPart(content=query.prompt)])
+    ]
+    if query.result:
+        messages.append(
+            ModelResponse(parts=[TextPart(content=query.result)], model_name=query.model)
+        )
+    return messages
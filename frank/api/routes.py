@@ -3,8 +3,10 @@ from fastapi import APIRouter, HTTPException, Depends
 from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from frank.services.chat import ChatRequired, make_user_chat
+from frank.core.executor import offload
 from frank.services.auth import UserRequired, create_anonymous_user
 from frank.core.db import get_session
+from frank.core.shards import shards
 from frank.schemas import UserChat, AuthAnonymousResponse, AuthUserOut, ChatSummary
 from frank.db.models import AuthToken as DbAuthToken, ChatSession
 
@@ -18,23 +20,22 @@ async def get_chat(chat: ChatRequired, user: UserRequired) -> UserChat:
     if chat.user_id != user.id:
         raise HTTPException(status_code=403, detail="Access denied")
 
-    user_chat = make_user_chat(chat)
+    # long chats are converted off the event loop
+    user_chat = await offload(make_user_chat, chat, size=chat.history.size)
     return user_chat.model_dump(by_alias=True, mode="json")
 
 
 @router.get("/api/chats")
-async def list_chats(
-    user: UserRequired,
-    session: AsyncSession = Depends(get_session),
-) -> list[ChatSummary]:
+async def list_chats(user: UserRequired) -> list[ChatSummary]:
     """List chat sessions for the authenticated user"""
-    result = await session.execute(
-        select(ChatSession)
-        .where(ChatSession.user_id == uuid.UUID(user.id))
-        .order_by(ChatSession.ts.desc())
-        .limit(50)
-    )
-    rows = result.scalars().all()
+    async with shards.for_user(user.id).read_sessions() as session:
+        result = await session.execute(
+            select(ChatSession)
+            .where(ChatSession.user_id == uuid.UUID(user.id))
+            .order_by(ChatSession.ts.desc())
+            .limit(50)
+        )
+        rows = result.scalars().all()
     return [
         ChatSummary(id=str(r.id), title=r.title, ts=r.ts)
         for r in rows
@@ -0,0 +1,77 @@
+"""Wire codecs for websocket chat events.
+
+Validators and serializers are built once at import time. The JSON codec
+validates incoming frames straight from JSON into the `ChatEvent` union (no
+intermediate dict) and serializes outgoing events straight to bytes. Clients
+can negotiate a MessagePack codec with the `frank.msgpack.v1` subprotocol,
+which sends binary frames instead; JSON text frames stay the default.
+"""
+
+import msgpack
+from pydantic import TypeAdapter
+from frank.schemas import ChatEvent
+
+
+_event_adapter: TypeAdapter[ChatEvent] = TypeAdapter(ChatEvent)
+
+
+def decode_event(data: str | bytes) -> ChatEvent:
+    """Parse a raw JSON frame into a ChatEvent (raises pydantic.ValidationError)"""
+    return _event_adapter.validate_json(data)
+
+
+def encode_event(event: ChatEvent) -> bytes:
+    """Serialize an event to JSON bytes using its compiled serializer"""
+    return event.__pydantic_serializer__.to_json(event, by_alias=True)
+
+
+class JsonCodec:
+    """JSON text frames (default for clients that don't negotiate)"""
+
+    subprotocol = "frank.json.v1"
+    binary = False
+
+    def decode(self, data: str | bytes) -> ChatEvent:
+        return decode_event(data)
+
+    def encode(self, event: ChatEvent) -> bytes:
+        return encode_event(event)
+
+
+class MsgpackCodec:
+    """MessagePack binary frames, same field names as the JSON protocol"""
+
+    subprotocol = "frank.msgpack.v1"
+    binary = True
+
+    def decode(self, data: str | bytes) -> ChatEvent:
+        if isinstance(data, str):
+            # tolerate JSON text frames from a client mid-upgrade
+            return decode_event(data)
+        try:
+            obj = msgpack.unpackb(data)
+        except (ValueError, msgpack.UnpackException):
+            # let pydantic produce the usual validation error for bad frames
+            return decode_event(data)
+        return _event_adapter.validate_python(obj)
+
+    def encode(self, event: ChatEvent) -> bytes:
+        return msgpack.packb(
+            event.__pydantic_serializer__.to_python(event, by_alias=True, mode="json")
+        )
+
+
+JSON_CODEC = JsonCodec()
+MSGPACK_CODEC = MsgpackCodec()
+CODECS = {codec.subprotocol: codec for codec in (JSON_CODEC, MSGPACK_CODEC)}
+
+EventCodec = JsonCodec | MsgpackCodec
+
+
+def negotiate_codec(offered: list[str]) -> tuple[EventCodec, str | None]:
+    """Pick a codec from the client's offered subprotocols (in its order of
+    preference). Returns the codec and the subprotocol to accept with."""
+    for subprotocol in offered:
+        if codec := CODECS.get(subprotocol):
+            return codec, subprotocol
+    return JSON_CODEC, None
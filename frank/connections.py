@@ -0,0 +1,80 @@
+"""Registry of open /ws/chat connections and the reaper that closes stale ones.
+
+Half-open sockets (a phone that lost signal, a proxy that dropped the
+connection without telling us) otherwise keep a handler, its chat history
+and its reply subscription alive until TCP gives up. One background task
+pings every connection, closes the ones that stopped answering and, after
+WS_IDLE_TIMEOUT_S, the ones nobody is using. Before that, idle connections
+let go of their chat's history after WS_EVICT_AFTER_S; it is only needed
+during a turn, and the next send loads it back.
+"""
+
+import asyncio
+import time
+import logfire
+from typing import TYPE_CHECKING
+from frank.core import metrics
+from frank.core.config import settings
+
+if TYPE_CHECKING:
+    from frank.ws import ChatWebSocketHandler
+
+
+_connections: set["ChatWebSocketHandler"] = set()
+
+
+def register(handler: "ChatWebSocketHandler") -> None:
+    _connections.add(handler)
+
+
+def unregister(handler: "ChatWebSocketHandler") -> None:
+    _connections.discard(handler)
+
+
+def connections() -> set["ChatWebSocketHandler"]:
+    return _connections
+
+
+async def reap_once(now: float | None = None) -> int:
+    """Ping live connections and close stale ones. Returns how many were
+    closed."""
+    now = time.monotonic() if now is None else now
+    stale: list[tuple["ChatWebSocketHandler", str]] = []
+    idle = 0
+
+    for handler in list(_connections):
+        if now - handler.last_seen > settings.WS_DEAD_TIMEOUT_S:
+            stale.append((handler, "dead"))
+        elif handler.is_idle(now):
+            idle += 1
+            timeout = settings.WS_IDLE_TIMEOUT_S
+            if timeout and now - handler.last_activity > timeout:
+                stale.append((handler, "idle"))
+            evict_after = settings.WS_EVICT_AFTER_S
+            if evict_after and now - handler.last_activity > evict_after:
+                if handler.evict_chat():
+                    metrics.ws_evicted.add(1)
+        metrics.ws_resident_messages.record(handler.resident_messages())
+        metrics.ws_resident_bytes.record(handler.resident_bytes())
+        if now - handler.last_ping >= settings.WS_PING_INTERVAL_S:
+            handler.ping(now)
+
+    metrics.ws_live.set(len(_connections))
+    metrics.ws_idle.set(idle)
+
+    if stale:
+        await asyncio.gather(*(handler.reap(reason) for handler, reason in stale))
+        for _, reason in stale:
+            metrics.ws_reaped.add(1, {"reason": reason})
+    return len(stale)
+
+
+async def run_reaper() -> None:
+    """Sweep connections every WS_REAP_INTERVAL_S until cancelled"""
+    while True:
+        await asyncio.sleep(settings.WS_REAP_INTERVAL_S)
+        try:
+            if reaped := await reap_once():
+                logfire.info(f"Reaped {reaped} stale websocket connections")
+        except Exception as e:
+            logfire.error(f"Error reaping websocket connections: {e}")
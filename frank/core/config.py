@@ -1,4 +1,5 @@
 import os
+from typing import Literal
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 _env_file = ".env.production" if os.getenv("APP_ENV") == "production" else ".env"
@@ -7,11 +8,104 @@ _env_file = ".env.production" if os.getenv("APP_ENV") == "production" else ".env
 class Settings(BaseSettings):
     APP_ENV: str
     LOGFIRE_TOKEN: str
-    UPSTASH_REDIS_REST_URL: str
-    UPSTASH_REDIS_REST_TOKEN: str
+    # cache: "upstash" (REST), "redis" (native protocol, for self-hosted
+    # Redis/Valkey at REDIS_URL) or "memory" (in process, tests and dev)
+    CACHE_BACKEND: Literal["upstash", "redis", "memory"] = "upstash"
+    UPSTASH_REDIS_REST_URL: str = ""
+    UPSTASH_REDIS_REST_TOKEN: str = ""
+    REDIS_URL: str = "redis://localhost:6379/0"
+    REDIS_MAX_CONNECTIONS: int = 20
+    # cache calls give up after CACHE_TIMEOUT_MS; after CACHE_BREAKER_FAILURES
+    # failures in a row the cache is skipped for CACHE_BREAKER_RESET_S, then
+    # one probe call decides whether to use it again
+    CACHE_TIMEOUT_MS: int = 300
+    CACHE_BREAKER_FAILURES: int = 5
+    CACHE_BREAKER_RESET_S: float = 10
     OPENROUTER_API_KEY: str
     HELICONE_API_KEY: str
     DATABASE_URL: str
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    # a SQLite file gets a single write connection, which writes queue for,
+    # and a pool of DB_POOL_SIZE read-only WAL connections (see
+    # frank/core/db.py); the rest are pragmas for both
+    SQLITE_SINGLE_WRITER: bool = True
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_CACHE_KB: int = 16384
+    SQLITE_MMAP_BYTES: int = 268435456
+    # chats can be split over DB_SHARDS databases by user, each at
+    # DB_SHARD_URL with "{shard}" replaced by its number; 0 keeps them in
+    # DATABASE_URL along with everything else
+    DB_SHARDS: int = 0
+    DB_SHARD_URL: str = ""
+    # message content is stored as "zstd" (dictionary-compressed MessagePack,
+    # see frank/db/content.py) or "json"; either codec reads both
+    CONTENT_CODEC: Literal["json", "zstd"] = "zstd"
+    CONTENT_ZSTD_LEVEL: int = 3
+    # `python -m frank.db.archive archive` moves the messages of chats idle
+    # for ARCHIVE_AFTER_DAYS into segment files of about ARCHIVE_SEGMENT_BYTES
+    # in ARCHIVE_DIR, which should be on the DB's volume ("" disables it)
+    ARCHIVE_DIR: str = ""
+    ARCHIVE_AFTER_DAYS: float = 30
+    ARCHIVE_SEGMENT_BYTES: int = 268435456
+    # chats are written to the DB behind the cache: saves of a queued chat
+    # merge, and up to WRITE_BEHIND_BATCH chats are committed together at
+    # most WRITE_BEHIND_MS after a save (0 writes every save through); a
+    # chat that fails WRITE_BEHIND_ATTEMPTS writes in a row is dropped. A
+    # cached chat the DB is still behind on WRITE_BEHIND_GRACE_S after that is
+    # written from the cache when next read (its worker likely died)
+    WRITE_BEHIND_MS: int = 200
+    WRITE_BEHIND_BATCH: int = 100
+    WRITE_BEHIND_ATTEMPTS: int = 5
+    WRITE_BEHIND_GRACE_S: float = 30
+    # websocket reply coalescing (per-connection overridable)
+    WS_COALESCE_WINDOW_MS: int = 30
+    WS_COALESCE_MAX_BYTES: int = 2048
+    # outgoing events queued per socket, and what to do when a slow client
+    # fills the queue: "merge" reply deltas, "drop" optional events or
+    # "disconnect"
+    WS_OUTBOX_SIZE: int = 256
+    WS_OUTBOX_POLICY: Literal["merge", "drop", "disconnect"] = "merge"
+    # heartbeats: sockets are pinged every WS_PING_INTERVAL_S and closed if
+    # nothing comes back for WS_DEAD_TIMEOUT_S. They count as idle after
+    # WS_IDLE_AFTER_S without user events and are closed after
+    # WS_IDLE_TIMEOUT_S (0 keeps idle sockets open)
+    WS_PING_INTERVAL_S: float = 25
+    WS_DEAD_TIMEOUT_S: float = 75
+    WS_IDLE_AFTER_S: float = 60
+    WS_IDLE_TIMEOUT_S: float = 1800
+    WS_REAP_INTERVAL_S: float = 5
+    # an idle socket's chat drops to its metadata after WS_EVICT_AFTER_S
+    # without user events (0 keeps it); the next send loads the history back
+    WS_EVICT_AFTER_S: float = 120
+    # decoded chats kept in process in front of Redis
+    CHAT_CACHE_SIZE: int = 1024
+    CHAT_CACHE_TTL_S: float = 30
+    # prompt context: history is fitted to the smaller of CONTEXT_MAX_TOKENS
+    # and the model's window less CONTEXT_RESERVE_TOKENS. Once unsummarized
+    # history passes CONTEXT_SUMMARY_AT of that budget, everything but the
+    # newest CONTEXT_SUMMARY_KEEP of it is folded into the rolling summary
+    CONTEXT_MAX_TOKENS: int = 24_000
+    CONTEXT_RESERVE_TOKENS: int = 8_000
+    CONTEXT_SUMMARY_AT: float = 0.75
+    CONTEXT_SUMMARY_KEEP: float = 0.5
+    # history (de)serialization runs in a thread pool from
+    # SERIALIZE_OFFLOAD_BYTES and in a process pool from
+    # SERIALIZE_PROCESS_BYTES (0 never), so long chats don't stall the loop;
+    # its lag is sampled every LOOP_LAG_INTERVAL_S
+    SERIALIZE_OFFLOAD_BYTES: int = 256 * 1024
+    SERIALIZE_PROCESS_BYTES: int = 0
+    SERIALIZE_WORKERS: int = 2
+    LOOP_LAG_INTERVAL_S: float = 0.1
+    # resumable replies: how long a reply keeps streaming with no socket
+    # attached, how much of its tail is checkpointed to the cache and how often
+    REPLY_RESUME_GRACE_S: float = 15
+    REPLY_BUFFER_CHARS: int = 64_000
+    REPLY_FLUSH_MS: int = 250
+    REPLY_TTL: int = 120
+    # how long a worker's claim on producing a reply outlives its last renewal
+    REPLY_LEASE_S: int = 30
     model_config = SettingsConfigDict(
         env_file=_env_file,
         env_file_encoding="utf-8",
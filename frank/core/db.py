@@ -1,6 +1,27 @@
+"""Database engines and sessions.
+
+A file-backed SQLite database (with SQLITE_SINGLE_WRITER) gets two engines.
+Writes go through `engine`, whose pool holds a single connection: write
+transactions queue for it in order instead of contending for SQLite's
+database lock, where they would spin on busy errors. Reads go through
+`read_engine`, a pool of read-only connections that in WAL mode run
+alongside a write. Other databases use one engine for both.
+"""
+
+import time
+from contextlib import asynccontextmanager
 from typing import AsyncIterator
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from frank.core import metrics
 from frank.core.config import settings
 
 
@@ -8,10 +29,131 @@ class Base(DeclarativeBase):
     pass
 
 
-engine = create_async_engine(settings.DATABASE_URL)
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waits for a connection"""
+
+    role = "main"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            wait_ms = (time.perf_counter() - start) * 1000
+            metrics.db_checkout_wait.record(wait_ms, {"pool": self.role})
+            if self.role == "write":
+                # the one write connection stands in for SQLite's lock
+                metrics.db_write_lock_wait.record(wait_ms)
+
+
+class WritePool(InstrumentedPool):
+    role = "write"
+
+
+class ReadPool(InstrumentedPool):
+    role = "read"
+
+
+def _sqlite_pragmas(read_only: bool) -> list[str]:
+    pragmas = [
+        # persists in the file; the first connection to ask switches it
+        "journal_mode = WAL",
+        "synchronous = NORMAL",
+        f"busy_timeout = {settings.SQLITE_BUSY_TIMEOUT_MS}",
+        f"cache_size = -{settings.SQLITE_CACHE_KB}",
+        f"mmap_size = {settings.SQLITE_MMAP_BYTES}",
+        "temp_store = MEMORY",
+    ]
+    if read_only:
+        pragmas.append("query_only = ON")
+    return pragmas
+
+
+def _in_memory(url: str) -> bool:
+    return make_url(url).database in (None, "", ":memory:")
+
+
+def _is_sqlite_file(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite" and not _in_memory(url)
+
+
+def _instrument(engine: AsyncEngine, pragmas: list[str] | None = None) -> AsyncEngine:
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection, _) -> None:
+        if pragmas:
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(f"PRAGMA {pragma}")
+            cursor.close()
+
+    @event.listens_for(engine.sync_engine, "checkout")
+    def _on_checkout(*args) -> None:
+        metrics.db_checked_out.add(1)
+
+    @event.listens_for(engine.sync_engine, "checkin")
+    def _on_checkin(*args) -> None:
+        metrics.db_checked_out.add(-1)
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def _on_error(context) -> None:
+        if "database is locked" in str(context.original_exception):
+            metrics.db_busy.add(1)
+
+    return engine
+
+
+def create_engines(url: str) -> tuple[AsyncEngine, AsyncEngine]:
+    """The engine to write with and the one to read with, which are the
+    same unless `url` is a SQLite file"""
+    # in-memory sqlite needs its single static connection
+    if _in_memory(url):
+        engine = _instrument(create_async_engine(url))
+        return engine, engine
+    pool = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+    }
+    if not (settings.SQLITE_SINGLE_WRITER and _is_sqlite_file(url)):
+        engine = _instrument(
+            create_async_engine(url, poolclass=InstrumentedPool, **pool)
+        )
+        return engine, engine
+    writer = create_async_engine(
+        url, poolclass=WritePool, **{**pool, "pool_size": 1, "max_overflow": 0}
+    )
+    reader = create_async_engine(url, poolclass=ReadPool, **pool)
+    return (
+        _instrument(writer, _sqlite_pragmas(read_only=False)),
+        _instrument(reader, _sqlite_pragmas(read_only=True)),
+    )
+
+
+engine, read_engine = create_engines(settings.DATABASE_URL)
 SessionLocal = async_sessionmaker(bind=engine, expire_on_commit=False)
+ReadSessionLocal = async_sessionmaker(bind=read_engine, expire_on_commit=False)
 
 
 async def get_session() -> AsyncIterator[AsyncSession]:
     async with SessionLocal() as session:
         yield session
+
+
+async def get_read_session() -> AsyncIterator[AsyncSession]:
+    """Session for requests that only read, kept off the write connection"""
+    async with ReadSessionLocal() as session:
+        yield session
+
+
+@asynccontextmanager
+async def borrow_session(
+    session: AsyncSession | None = None,
+    sessionmaker: async_sessionmaker = ReadSessionLocal,
+) -> AsyncIterator[AsyncSession]:
+    """Use the caller's session if given, otherwise borrow one from
+    `sessionmaker` (the read pool by default) for just this operation"""
+    if session is not None:
+        yield session
+        return
+    async with sessionmaker() as session:
+        yield session
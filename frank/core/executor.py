@@ -0,0 +1,77 @@
+"""Serialization off the event loop.
+
+Decoding or encoding a long chat's history can hold the loop for tens of
+milliseconds, and every other socket on the worker stops streaming while it
+does. `offload` runs such work inline when its payload is small, in a thread
+pool from SERIALIZE_OFFLOAD_BYTES up, and in a process pool from
+SERIALIZE_PROCESS_BYTES up (0, the default, never uses one). The loop keeps
+running beside a worker thread, stalling only when they trade the GIL. A
+process doesn't share the GIL at all, but pickling the messages both ways
+has cost more than it saved in benchmarks/bench_loop_lag.py, hence off.
+
+`monitor_loop` samples how late the loop wakes up, which is how long it was
+blocked, into the `event_loop.lag` histogram.
+"""
+
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import cache
+from typing import Callable, TypeVar
+from frank.core import metrics
+from frank.core.config import settings
+
+T = TypeVar("T")
+
+
+@cache
+def _thread_pool() -> Executor:
+    return ThreadPoolExecutor(
+        max_workers=settings.SERIALIZE_WORKERS, thread_name_prefix="serialize"
+    )
+
+
+@cache
+def _process_pool() -> Executor:
+    # not forked: the worker already runs threads
+    return ProcessPoolExecutor(
+        max_workers=settings.SERIALIZE_WORKERS,
+        mp_context=multiprocessing.get_context("forkserver"),
+    )
+
+
+def _pool_for(size: int) -> Executor | None:
+    process_at = settings.SERIALIZE_PROCESS_BYTES
+    if process_at and size >= process_at:
+        return _process_pool()
+    if size >= settings.SERIALIZE_OFFLOAD_BYTES:
+        return _thread_pool()
+    return None
+
+
+async def offload(fn: Callable[..., T], *args, size: int) -> T:
+    """Run `fn(*args)` where its payload of `size` bytes belongs. For the
+    process pool, `fn` and `args` must pickle."""
+    pool = _pool_for(size)
+    where = (
+        "inline"
+        if pool is None
+        else "process"
+        if isinstance(pool, ProcessPoolExecutor)
+        else "thread"
+    )
+    metrics.serialize_calls.add(1, {"where": where})
+    if pool is None:
+        return fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+
+async def monitor_loop() -> None:
+    """Record event loop lag every LOOP_LAG_INTERVAL_S until cancelled"""
+    interval = settings.LOOP_LAG_INTERVAL_S
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = time.perf_counter() - start - interval
+        metrics.loop_lag.record(max(0.0, lag) * 1000)
@@ -0,0 +1,166 @@
+import logfire
+
+
+# websocket reply streaming
+reply_frames = logfire.metric_histogram(
+    "ws.reply.frames",
+    unit="1",
+    description="Reply frames sent to the client per agent response",
+)
+reply_deltas = logfire.metric_histogram(
+    "ws.reply.deltas",
+    unit="1",
+    description="Text deltas received from the agent per response",
+)
+
+# event loop
+loop_lag = logfire.metric_histogram(
+    "event_loop.lag",
+    unit="ms",
+    description="How late the event loop woke from a timed sleep",
+)
+serialize_calls = logfire.metric_counter(
+    "serialize.calls",
+    unit="1",
+    description="History (de)serializations, by where they ran",
+)
+
+# prompt context
+context_tokens = logfire.metric_histogram(
+    "agent.context.tokens",
+    unit="1",
+    description="Estimated history tokens sent with each agent request",
+)
+
+# websocket connections
+ws_live = logfire.metric_gauge(
+    "ws.connections.live",
+    unit="1",
+    description="Open /ws/chat connections",
+)
+ws_idle = logfire.metric_gauge(
+    "ws.connections.idle",
+    unit="1",
+    description="Open /ws/chat connections with no recent user activity",
+)
+ws_reaped = logfire.metric_counter(
+    "ws.connections.reaped",
+    unit="1",
+    description="Connections closed by the reaper, by reason",
+)
+ws_evicted = logfire.metric_counter(
+    "ws.connections.evicted",
+    unit="1",
+    description="Idle connections whose chat history was dropped",
+)
+ws_resident_messages = logfire.metric_histogram(
+    "ws.connections.resident_messages",
+    unit="1",
+    description="Chat messages held by each open connection, per sweep",
+)
+ws_resident_bytes = logfire.metric_histogram(
+    "ws.connections.resident_bytes",
+    unit="By",
+    description="Approximate size of the chat history held by each open "
+    "connection, per sweep",
+)
+
+# websocket outbox
+outbox_queued = logfire.metric_up_down_counter(
+    "ws.outbox.queued",
+    unit="1",
+    description="Events queued for websocket clients and not yet written",
+)
+outbox_stall = logfire.metric_histogram(
+    "ws.outbox.stall",
+    unit="ms",
+    description="Time spent waiting on the socket to write one event",
+)
+outbox_overflow = logfire.metric_counter(
+    "ws.outbox.overflow",
+    unit="1",
+    description="Events that hit a full outbox, by the action taken",
+)
+
+# cache backend
+cache_calls = logfire.metric_counter(
+    "cache.calls",
+    unit="1",
+    description="Cache calls by operation and outcome (ok, error, timeout, skipped)",
+)
+cache_latency = logfire.metric_histogram(
+    "cache.latency",
+    unit="ms",
+    description="Time taken by cache calls that were attempted",
+)
+cache_breaker_state = logfire.metric_gauge(
+    "cache.breaker.state",
+    unit="1",
+    description="Cache circuit breaker: 0 closed, 1 half-open, 2 open",
+)
+
+# in-process chat cache
+chat_cache_hits = logfire.metric_counter(
+    "chat.cache.hits",
+    unit="1",
+    description="Chat loads served from the in-process cache",
+)
+chat_cache_misses = logfire.metric_counter(
+    "chat.cache.misses",
+    unit="1",
+    description="Chat loads that went to Redis or the database",
+)
+chat_reconciled = logfire.metric_counter(
+    "chat.cache.reconciled",
+    unit="1",
+    description="Cached messages found missing from the database and written",
+)
+chat_cache_coalesced = logfire.metric_counter(
+    "chat.cache.coalesced",
+    unit="1",
+    description="Chat loads that waited on a load already in flight",
+)
+
+# database pool
+db_checkout_wait = logfire.metric_histogram(
+    "db.pool.checkout_wait",
+    unit="ms",
+    description="Time spent waiting for a pooled database connection",
+)
+db_checked_out = logfire.metric_up_down_counter(
+    "db.pool.checked_out",
+    unit="1",
+    description="Database connections currently checked out of the pool",
+)
+db_write_lock_wait = logfire.metric_histogram(
+    "db.sqlite.write_wait",
+    unit="ms",
+    description="Time spent waiting for the single SQLite write connection",
+)
+db_busy = logfire.metric_counter(
+    "db.sqlite.busy",
+    unit="1",
+    description="Statements that failed because the SQLite database was locked",
+)
+db_write_batch = logfire.metric_histogram(
+    "db.writes.batch",
+    unit="1",
+    description="Chats written per database transaction",
+)
+db_writes_dropped = logfire.metric_counter(
+    "db.writes.dropped",
+    unit="1",
+    description="Chats given up on after WRITE_BEHIND_ATTEMPTS failed writes",
+)
+db_writes_pending = logfire.metric_gauge(
+    "db.writes.pending",
+    unit="1",
+    description="Chats saved to the cache and waiting to be written to the DB",
+)
+
+# chat archive
+chat_archive_restore = logfire.metric_histogram(
+    "chat.archive.restore",
+    unit="ms",
+    description="Time to put an archived chat's messages back in the database",
+)
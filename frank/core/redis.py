@@ -1,11 +1,334 @@
+"""Cache backends, chosen by `CACHE_BACKEND`.
+
+All three speak Redis semantics and expose the same small surface, which is
+all the services use: get/set/setex/expire/delete, Lua scripts through
+`eval(script, keys, args)`, and `pipeline()` for sending several of those in
+one exchange. List and hash work happens inside scripts, so it is atomic and
+takes one round trip whichever backend is in use.
+
+- "upstash": Upstash over its REST API, one HTTPS request per command or
+  pipeline
+- "redis": a pooled native (RESP) client for self-hosted Redis or Valkey;
+  scripts run by EVALSHA after their first use
+- "memory": an in-process Redis for tests, benchmarks and running without a
+  cache server (needs the `fakeredis[lua]` dev dependency)
+
+The backend is wrapped in `GuardedBackend`, which bounds every call by
+CACHE_TIMEOUT_MS and stops calling the cache at all while it keeps failing.
+Callers already treat cache errors as misses, so a slow or down cache costs
+them at most the timeout, and nothing once the breaker has opened.
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
 from cachetools import cached, LRUCache
-from upstash_redis.asyncio import Redis
+from redis.asyncio import Redis as RespRedis
+from upstash_redis.asyncio import Redis as UpstashRedis
+from frank.core import metrics
 from frank.core.config import settings
 
 
-@cached(cache=LRUCache(maxsize=1))
-def get_redis() -> Redis:
-    return Redis(
+class CacheUnavailable(Exception):
+    """The cache call ran over its time budget, or the breaker is open"""
+
+
+class Pipeline:
+    """Commands queued for one exchange with the cache. Results come back in
+    order from `execute()`."""
+
+    def __init__(self, backend: "CacheBackend"):
+        self._backend = backend
+        self._commands: list[tuple[str, tuple, dict]] = []
+
+    def get(self, key: str):
+        return self._queue("get", key)
+
+    def set(self, key: str, value: str, nx: bool = False, ex: int | None = None):
+        return self._queue("set", key, value, nx=nx, ex=ex)
+
+    def setex(self, key: str, seconds: int, value: str):
+        return self._queue("setex", key, seconds, value)
+
+    def expire(self, key: str, seconds: int):
+        return self._queue("expire", key, seconds)
+
+    def delete(self, *keys: str):
+        return self._queue("delete", *keys)
+
+    def eval(self, script: str, keys: list[str], args: list[str]):
+        return self._queue("eval", script, keys, args)
+
+    async def execute(self) -> list[Any]:
+        commands, self._commands = self._commands, []
+        if not commands:
+            return []
+        return await self._backend.run_pipeline(commands)
+
+    def _queue(self, command: str, *args, **kwargs) -> "Pipeline":
+        self._commands.append((command, args, kwargs))
+        return self
+
+
+class UpstashBackend:
+    """Upstash REST API"""
+
+    # survives this process, so write-behind can lean on it
+    durable = True
+
+    def __init__(self, url: str, token: str):
+        self.client = UpstashRedis(url=url, token=token)
+
+    async def get(self, key: str) -> str | None:
+        return await self.client.get(key)
+
+    async def set(
+        self, key: str, value: str, nx: bool = False, ex: int | None = None
+    ) -> bool:
+        return bool(await self.client.set(key, value, nx=nx or None, ex=ex))
+
+    async def setex(self, key: str, seconds: int, value: str) -> None:
+        await self.client.setex(key, seconds, value)
+
+    async def expire(self, key: str, seconds: int) -> bool:
+        return bool(await self.client.expire(key, seconds))
+
+    async def delete(self, *keys: str) -> int:
+        return await self.client.delete(*keys)
+
+    async def eval(self, script: str, keys: list[str], args: list[str]) -> Any:
+        return await self.client.eval(script, keys=keys, args=args)
+
+    def pipeline(self) -> Pipeline:
+        return Pipeline(self)
+
+    async def run_pipeline(self, commands: list[tuple[str, tuple, dict]]) -> list:
+        pipe = self.client.pipeline()
+        for command, args, kwargs in commands:
+            if command == "eval":
+                script, keys, script_args = args
+                pipe.eval(script, keys=keys, args=script_args)
+            elif command == "set":
+                pipe.set(*args, nx=kwargs["nx"] or None, ex=kwargs["ex"])
+            else:
+                getattr(pipe, command)(*args)
+        return await pipe.exec()
+
+
+class RespBackend:
+    """Native Redis protocol over a connection pool"""
+
+    durable = True
+
+    def __init__(self, client: RespRedis):
+        self.client = client
+        self._scripts: dict[str, Any] = {}
+
+    @classmethod
+    def from_url(cls, url: str, max_connections: int) -> "RespBackend":
+        return cls(
+            RespRedis.from_url(
+                url, decode_responses=True, max_connections=max_connections
+            )
+        )
+
+    async def get(self, key: str) -> str | None:
+        return await self.client.get(key)
+
+    async def set(
+        self, key: str, value: str, nx: bool = False, ex: int | None = None
+    ) -> bool:
+        return bool(await self.client.set(key, value, nx=nx, ex=ex))
+
+    async def setex(self, key: str, seconds: int, value: str) -> None:
+        await self.client.set(key, value, ex=seconds)
+
+    async def expire(self, key: str, seconds: int) -> bool:
+        return bool(await self.client.expire(key, seconds))
+
+    async def delete(self, *keys: str) -> int:
+        return await self.client.delete(*keys)
+
+    async def eval(self, script: str, keys: list[str], args: list[str]) -> Any:
+        return await self._script(script)(keys=keys, args=args)
+
+    def pipeline(self) -> Pipeline:
+        return Pipeline(self)
+
+    async def run_pipeline(self, commands: list[tuple[str, tuple, dict]]) -> list:
+        async with self.client.pipeline(transaction=False) as pipe:
+            for command, args, kwargs in commands:
+                if command == "eval":
+                    script, keys, script_args = args
+                    await self._script(script)(keys=keys, args=script_args, client=pipe)
+                elif command == "setex":
+                    key, seconds, value = args
+                    pipe.set(key, value, ex=seconds)
+                else:
+                    getattr(pipe, command)(*args, **kwargs)
+            return await pipe.execute()
+
+    def _script(self, script: str):
+        # registered scripts go by sha, loading themselves on a miss
+        if script not in self._scripts:
+            self._scripts[script] = self.client.register_script(script)
+        return self._scripts[script]
+
+
+class MemoryBackend(RespBackend):
+    """In-process Redis, with Lua scripting"""
+
+    # gone with the process, along with anything only it holds
+    durable = False
+
+    def __init__(self):
+        import fakeredis
+
+        super().__init__(fakeredis.FakeAsyncRedis(decode_responses=True))
+
+
+CacheBackend = UpstashBackend | RespBackend | MemoryBackend
+
+
+class CircuitBreaker:
+    """Opens after `failures` failed calls in a row. Once `reset_s` has passed
+    it lets a single probe through (half-open); the probe's outcome closes it
+    or opens it again."""
+
+    STATES = ("closed", "half_open", "open")
+
+    def __init__(self, failures: int, reset_s: float):
+        self.failures = failures
+        self.reset_s = reset_s
+        self.state = "closed"
+        self._failed = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.reset_s:
+                return False
+            self._set_state("half_open")
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        self._failed = 0
+        self._probing = False
+        self._set_state("closed")
+
+    def record_failure(self) -> None:
+        self._failed += 1
+        self._probing = False
+        if self.state == "half_open" or self._failed >= self.failures:
+            self._opened_at = time.monotonic()
+            self._set_state("open")
+
+    def release(self) -> None:
+        """The call was abandoned by its caller; it proves nothing either way"""
+        self._probing = False
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            self.state = state
+            metrics.cache_breaker_state.set(self.STATES.index(state))
+
+
+class GuardedBackend:
+    """A backend whose calls time out and go through a circuit breaker.
+    Failed or skipped calls raise; timeouts and skips as CacheUnavailable."""
+
+    def __init__(self, backend: CacheBackend, timeout_ms: int, breaker: CircuitBreaker):
+        self.backend = backend
+        self.timeout = timeout_ms / 1000
+        self.breaker = breaker
+
+    @property
+    def durable(self) -> bool:
+        return self.backend.durable
+
+    async def get(self, key: str) -> str | None:
+        return await self._call("get", self.backend.get, key)
+
+    async def set(
+        self, key: str, value: str, nx: bool = False, ex: int | None = None
+    ) -> bool:
+        return await self._call("set", self.backend.set, key, value, nx=nx, ex=ex)
+
+    async def setex(self, key: str, seconds: int, value: str) -> None:
+        await self._call("setex", self.backend.setex, key, seconds, value)
+
+    async def expire(self, key: str, seconds: int) -> bool:
+        return await self._call("expire", self.backend.expire, key, seconds)
+
+    async def delete(self, *keys: str) -> int:
+        return await self._call("delete", self.backend.delete, *keys)
+
+    async def eval(self, script: str, keys: list[str], args: list[str]) -> Any:
+        return await self._call("eval", self.backend.eval, script, keys, args)
+
+    def pipeline(self) -> Pipeline:
+        return Pipeline(self)
+
+    async def run_pipeline(self, commands: list[tuple[str, tuple, dict]]) -> list:
+        return await self._call("pipeline", self.backend.run_pipeline, commands)
+
+    async def _call(
+        self, op: str, fn: Callable[..., Awaitable[Any]], *args, **kwargs
+    ) -> Any:
+        if not self.breaker.allow():
+            metrics.cache_calls.add(1, {"op": op, "outcome": "skipped"})
+            raise CacheUnavailable("cache circuit is open")
+
+        start = time.perf_counter()
+        outcome = "cancelled"
+        try:
+            async with asyncio.timeout(self.timeout):
+                result = await fn(*args, **kwargs)
+            outcome = "ok"
+            return result
+        except TimeoutError as e:
+            outcome = "timeout"
+            raise CacheUnavailable(f"cache {op} timed out") from e
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            if outcome == "ok":
+                self.breaker.record_success()
+            elif outcome == "cancelled":
+                self.breaker.release()
+            else:
+                self.breaker.record_failure()
+            metrics.cache_calls.add(1, {"op": op, "outcome": outcome})
+            metrics.cache_latency.record((time.perf_counter() - start) * 1000)
+
+
+def _make_backend() -> CacheBackend:
+    if settings.CACHE_BACKEND == "redis":
+        return RespBackend.from_url(
+            settings.REDIS_URL, max_connections=settings.REDIS_MAX_CONNECTIONS
+        )
+    if settings.CACHE_BACKEND == "memory":
+        return MemoryBackend()
+    return UpstashBackend(
         url=settings.UPSTASH_REDIS_REST_URL,
         token=settings.UPSTASH_REDIS_REST_TOKEN,
     )
+
+
+@cached(cache=LRUCache(maxsize=1))
+def get_redis() -> GuardedBackend:
+    return GuardedBackend(
+        _make_backend(),
+        timeout_ms=settings.CACHE_TIMEOUT_MS,
+        breaker=CircuitBreaker(
+            failures=settings.CACHE_BREAKER_FAILURES,
+            reset_s=settings.CACHE_BREAKER_RESET_S,
+        ),
+    )
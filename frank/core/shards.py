@@ -0,0 +1,106 @@
+"""Chat storage split over several databases by user.
+
+With DB_SHARDS set, each chat and its messages live in one of DB_SHARDS
+databases, picked by a hash of the chat's user_id. A SQLite file takes one
+write at a time, so this lets users on different shards write at once
+instead of all queueing for the same file. Every shard gets the engines
+`create_engines` would give DATABASE_URL, single writer included. Users and
+auth tokens stay in DATABASE_URL.
+
+Without DB_SHARDS there is one shard, the main database. Changing the
+number of shards moves most users; `python -m frank.db.reshard` moves their
+chats to match.
+"""
+
+import zlib
+from collections.abc import Sequence
+from dataclasses import dataclass
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from frank.core.config import settings
+from frank.core.db import (
+    ReadSessionLocal,
+    SessionLocal,
+    create_engines,
+    engine,
+    read_engine,
+)
+
+
+@dataclass
+class Shard:
+    """One database holding chats, and its sessions"""
+
+    engine: AsyncEngine
+    read_engine: AsyncEngine
+    sessions: async_sessionmaker
+    read_sessions: async_sessionmaker
+
+    @classmethod
+    def connect(cls, url: str) -> "Shard":
+        engine, read_engine = create_engines(url)
+        return cls(
+            engine,
+            read_engine,
+            async_sessionmaker(bind=engine, expire_on_commit=False),
+            async_sessionmaker(bind=read_engine, expire_on_commit=False),
+        )
+
+
+class Shards(Sequence[Shard]):
+    """The shards, and which one holds each user's chats"""
+
+    def __init__(self, shards: list[Shard]):
+        self._shards = shards
+
+    @classmethod
+    def connect(cls, urls: list[str]) -> "Shards":
+        return cls([Shard.connect(url) for url in urls])
+
+    def index_for(self, user_id: str) -> int:
+        return shard_index(user_id, len(self._shards))
+
+    def for_user(self, user_id: str) -> Shard:
+        return self._shards[self.index_for(user_id)]
+
+    def lookup(self, user_id: str | None) -> list[Shard]:
+        """Shards to look in for a chat: its user's, or all of them if the
+        user isn't known"""
+        return list(self._shards) if user_id is None else [self.for_user(user_id)]
+
+    def session(self, user_id: str) -> AsyncSession:
+        """A session for writing to the user's shard"""
+        return self.for_user(user_id).sessions()
+
+    async def dispose(self) -> None:
+        for shard in self._shards:
+            await shard.engine.dispose()
+            if shard.read_engine is not shard.engine:
+                await shard.read_engine.dispose()
+
+    def __getitem__(self, index):
+        return self._shards[index]
+
+    def __len__(self) -> int:
+        return len(self._shards)
+
+
+def shard_index(user_id: str, count: int) -> int:
+    # stable across processes, unlike hash()
+    return zlib.crc32(str(user_id).encode()) % count
+
+
+def shard_urls(count: int | None = None, template: str | None = None) -> list[str]:
+    """URLs of the shards (DB_SHARDS and DB_SHARD_URL by default), or none
+    if chats stay in DATABASE_URL"""
+    count = settings.DB_SHARDS if count is None else count
+    template = settings.DB_SHARD_URL if template is None else template
+    if count and "{shard}" not in template:
+        raise ValueError('the shard URL must contain "{shard}"')
+    return [template.format(shard=i) for i in range(count)]
+
+
+shards = (
+    Shards.connect(shard_urls())
+    if settings.DB_SHARDS
+    else Shards([Shard(engine, read_engine, SessionLocal, ReadSessionLocal)])
+)
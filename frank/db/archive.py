@@ -0,0 +1,416 @@
+"""Archive tier for chats nobody has opened in a while.
+
+Otherwise every message of every chat stays in chat_message for good, and
+the table, its index and the DB's backups only grow, with less and less of
+them fitting in the page cache. `archive` moves the messages of chats idle
+for ARCHIVE_AFTER_DAYS into append-only segment files in ARCHIVE_DIR:
+
+    uv run python -m frank.db.archive archive [--vacuum]
+    uv run python -m frank.db.archive stats
+    uv run python -m frank.db.archive restore  # everything, e.g. to downgrade
+
+The chat row stays, so archived chats are still listed, and records where
+its messages went. Each record in a segment is a header (chat id, payload
+length, crc32 of the payload) and the chat's messages, compressed like
+message bodies (see frank/db/content.py). Segments are read through mmap.
+`load_chat` puts an archived chat's messages back into chat_message (and so
+the cache) before reading it.
+
+A record is synced to disk before its chat is marked archived, and a chat
+is only marked if it has had no messages since it was read, so a crash or a
+save at the wrong moment leaves at worst an unused record. One writer at a
+time holds a lock on the directory, so offsets can't be thrown off by
+another run appending to the same segment. Records of chats
+that have been brought back aren't reclaimed; `stats` says how much of the
+segments is still live.
+"""
+
+import argparse
+import asyncio
+import fcntl
+import json
+import mmap
+import os
+import struct
+import time
+import uuid
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable
+from sqlalchemy import delete, func, select, update
+from frank.core import metrics
+from frank.core.config import settings
+from frank.core.executor import offload
+from frank.core.shards import Shard, Shards, shards
+from frank.db.content import content_codec, decode_body, decode_row, encode_body
+from frank.db.models import ChatMessage, ChatSession
+
+# chat id, payload length, crc32 of the payload
+HEADER = struct.Struct("<16sII")
+
+
+@dataclass
+class Progress:
+    """What `archive` has moved so far"""
+
+    chats: int = 0
+    messages: int = 0
+    # the messages' content as stored in the DB, and as archived
+    db_bytes: int = 0
+    archive_bytes: int = 0
+
+
+class SegmentWriter:
+    """Appends records to the newest segment, starting a new one once it
+    reaches ARCHIVE_SEGMENT_BYTES"""
+
+    def __init__(self):
+        directory = _directory()
+        directory.mkdir(parents=True, exist_ok=True)
+        self._lock = open(directory / "lock", "w")
+        try:
+            fcntl.flock(self._lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock.close()
+            raise RuntimeError(f"Another archive run is writing to {directory}")
+        existing = sorted(directory.glob("*.seg"))
+        self.segment = int(existing[-1].stem) if existing else 1
+        self._file = open(segment_path(self.segment), "ab")
+
+    def append(self, chat_id: uuid.UUID, payload: bytes) -> tuple[int, int, int]:
+        """Write a record. Returns its segment, offset and length."""
+        if self._file.tell() >= settings.ARCHIVE_SEGMENT_BYTES:
+            self._file.close()
+            self.segment += 1
+            self._file = open(segment_path(self.segment), "ab")
+        offset = self._file.tell()
+        header = HEADER.pack(chat_id.bytes, len(payload), zlib.crc32(payload))
+        self._file.write(header + payload)
+        return self.segment, offset, HEADER.size + len(payload)
+
+    def sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+        # closing the lock file releases the lock
+        self._lock.close()
+
+
+class SegmentReader:
+    """Reads records through an mmap of each segment, remapped when a record
+    is past the end of the mapping (the segment was appended to since)"""
+
+    def __init__(self):
+        self._maps: dict[int, mmap.mmap] = {}
+
+    def read(self, chat_id: uuid.UUID, segment: int, offset: int, length: int):
+        mapped = self._maps.get(segment)
+        if mapped is None or offset + length > len(mapped):
+            if mapped is not None:
+                mapped.close()
+            with open(segment_path(segment), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = mapped
+        record = mapped[offset : offset + length]
+        stored_id, size, crc = HEADER.unpack_from(record)
+        payload = record[HEADER.size :]
+        if (
+            stored_id != chat_id.bytes
+            or size != len(payload)
+            or zlib.crc32(payload) != crc
+        ):
+            raise ValueError(f"Bad archive record for chat {chat_id} in {segment}")
+        return payload
+
+    def close(self) -> None:
+        for mapped in self._maps.values():
+            mapped.close()
+        self._maps.clear()
+
+
+_reader = SegmentReader()
+
+
+def segment_path(segment: int) -> Path:
+    return _directory() / f"{segment:06d}.seg"
+
+
+def _directory() -> Path:
+    if not settings.ARCHIVE_DIR:
+        raise RuntimeError("ARCHIVE_DIR is not set")
+    return Path(settings.ARCHIVE_DIR)
+
+
+async def archive(
+    source: Shards,
+    before: datetime,
+    batch: int = 100,
+    on_batch: Callable[[Progress], None] | None = None,
+) -> Progress:
+    """Move the messages of chats with none since `before` to the archive,
+    `batch` chats per transaction"""
+    progress = Progress()
+    writer = SegmentWriter()
+    try:
+        for shard in source:
+            after = None
+            while True:
+                query = (
+                    select(ChatSession.id, ChatSession.last_seq)
+                    .where(
+                        ChatSession.archive_segment.is_(None),
+                        ChatSession.message_count > 0,
+                        func.coalesce(
+                            ChatSession.last_message_at, ChatSession.updated_at
+                        )
+                        < before,
+                    )
+                    .order_by(ChatSession.id)
+                    .limit(batch)
+                )
+                if after is not None:
+                    query = query.where(ChatSession.id > after)
+                async with shard.read_sessions() as session:
+                    chats = (await session.execute(query)).all()
+                if not chats:
+                    break
+                after = chats[-1].id
+                await _archive_batch(shard, dict(chats), writer, progress)
+                if on_batch:
+                    on_batch(progress)
+    finally:
+        writer.close()
+    return progress
+
+
+async def _archive_batch(
+    shard: Shard,
+    last_seqs: dict[uuid.UUID, int],
+    writer: SegmentWriter,
+    progress: Progress,
+) -> None:
+    query = (
+        select(
+            ChatMessage.chat_id,
+            ChatMessage.seq,
+            ChatMessage.role,
+            ChatMessage.created_at,
+            ChatMessage.content,
+            ChatMessage.body,
+        )
+        .where(ChatMessage.chat_id.in_(last_seqs))
+        .order_by(ChatMessage.chat_id, ChatMessage.seq)
+    )
+    messages: defaultdict[uuid.UUID, list[dict]] = defaultdict(list)
+    db_bytes: defaultdict[uuid.UUID, int] = defaultdict(int)
+    async with shard.read_sessions() as session:
+        for row in await session.execute(query):
+            if row.seq > last_seqs[row.chat_id]:
+                continue
+            messages[row.chat_id].append(
+                {
+                    "seq": row.seq,
+                    "role": row.role.value,
+                    "created_at": row.created_at.isoformat(),
+                    "content": decode_row(row.content, row.body),
+                }
+            )
+            db_bytes[row.chat_id] += (
+                len(row.body) if row.body is not None else len(json.dumps(row.content))
+            )
+
+    located = {
+        chat_id: writer.append(chat_id, encode_body(chat_messages))
+        for chat_id, chat_messages in messages.items()
+    }
+    writer.sync()
+
+    async with shard.sessions() as session:
+        for chat_id, (segment, offset, length) in located.items():
+            # skipped if the chat has had messages since they were read
+            marked = await session.execute(
+                update(ChatSession)
+                .where(
+                    ChatSession.id == chat_id,
+                    ChatSession.last_seq == last_seqs[chat_id],
+                    ChatSession.archive_segment.is_(None),
+                )
+                .values(
+                    archive_segment=segment,
+                    archive_offset=offset,
+                    archive_length=length,
+                )
+            )
+            if not marked.rowcount:
+                continue
+            await session.execute(
+                delete(ChatMessage).where(
+                    ChatMessage.chat_id == chat_id,
+                    ChatMessage.seq <= last_seqs[chat_id],
+                )
+            )
+            progress.chats += 1
+            progress.messages += len(messages[chat_id])
+            progress.db_bytes += db_bytes[chat_id]
+            progress.archive_bytes += length
+        await session.commit()
+
+
+async def restore(shard: Shard, chat: ChatSession) -> int:
+    """Put an archived chat's messages back into chat_message. Returns how
+    many, 0 if another load already did. Seqs written again since it was
+    archived (say by reconciling the cache) keep the copy in the DB."""
+    start = time.perf_counter()
+    payload = _reader.read(
+        chat.id, chat.archive_segment, chat.archive_offset, chat.archive_length
+    )
+    messages = await offload(decode_body, payload, size=len(payload))
+    codec = content_codec()
+    async with shard.sessions() as session:
+        unmarked = await session.execute(
+            update(ChatSession)
+            .where(
+                ChatSession.id == chat.id,
+                ChatSession.archive_segment == chat.archive_segment,
+                ChatSession.archive_offset == chat.archive_offset,
+            )
+            .values(archive_segment=None, archive_offset=None, archive_length=None)
+        )
+        if unmarked.rowcount:
+            present = set(
+                await session.scalars(
+                    select(ChatMessage.seq).where(ChatMessage.chat_id == chat.id)
+                )
+            )
+            messages = [m for m in messages if m["seq"] not in present]
+            session.add_all(
+                ChatMessage(
+                    chat_id=chat.id,
+                    seq=message["seq"],
+                    role=message["role"],
+                    created_at=datetime.fromisoformat(message["created_at"]),
+                    **codec.columns(message["content"]),
+                )
+                for message in messages
+            )
+        await session.commit()
+    metrics.chat_archive_restore.record((time.perf_counter() - start) * 1000)
+    return len(messages) if unmarked.rowcount else 0
+
+
+async def restore_all(source: Shards, batch: int = 100) -> int:
+    """Put every archived chat back. Returns how many messages."""
+    restored = 0
+    for shard in source:
+        while True:
+            query = (
+                select(ChatSession)
+                .where(ChatSession.archive_segment.is_not(None))
+                .limit(batch)
+            )
+            async with shard.read_sessions() as session:
+                chats = (await session.scalars(query)).all()
+            if not chats:
+                break
+            for chat in chats:
+                restored += await restore(shard, chat)
+    return restored
+
+
+async def stats(source: Shards) -> dict[str, int]:
+    """Sizes of the archive and of what is left in the DB"""
+    segments = sorted(_directory().glob("*.seg"))
+    totals = {
+        "segments": len(segments),
+        "segment_bytes": sum(path.stat().st_size for path in segments),
+        "live_bytes": 0,
+        "archived_chats": 0,
+        "chats": 0,
+        "messages": 0,
+    }
+    for shard in source:
+        async with shard.read_sessions() as session:
+            chats, archived, live = (
+                await session.execute(
+                    select(
+                        func.count(),
+                        func.count(ChatSession.archive_segment),
+                        func.coalesce(func.sum(ChatSession.archive_length), 0),
+                    )
+                )
+            ).one()
+            messages = await session.scalar(select(func.count(ChatMessage.id)))
+        totals["chats"] += chats
+        totals["archived_chats"] += archived
+        totals["live_bytes"] += live
+        totals["messages"] += messages
+    return totals
+
+
+async def _vacuum(shard: Shard) -> None:
+    # frees the deleted messages' pages; SQLite would otherwise only reuse them
+    if shard.engine.dialect.name != "sqlite":
+        return
+    async with shard.engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.exec_driver_sql("VACUUM")
+        # the file only shrinks once the WAL is written back
+        await conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def _mb(size: int) -> str:
+    return f"{size / 1e6:.1f} MB"
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    archive_args = commands.add_parser("archive", help="archive idle chats")
+    archive_args.add_argument(
+        "--days", type=float, default=None, help="idle for (ARCHIVE_AFTER_DAYS)"
+    )
+    archive_args.add_argument("--batch", type=int, default=100)
+    archive_args.add_argument(
+        "--vacuum", action="store_true", help="shrink the DB files afterwards"
+    )
+    commands.add_parser("stats", help="report archive and DB sizes")
+    commands.add_parser("restore", help="put every archived chat back")
+    args = parser.parse_args()
+
+    if args.command == "archive":
+        days = settings.ARCHIVE_AFTER_DAYS if args.days is None else args.days
+        before = datetime.now(timezone.utc) - timedelta(days=days)
+
+        def report(progress: Progress) -> None:
+            print(
+                f"Archived {progress.chats} chats, {progress.messages} messages: "
+                f"{_mb(progress.db_bytes)} in the DB -> "
+                f"{_mb(progress.archive_bytes)} in {settings.ARCHIVE_DIR}"
+            )
+
+        progress = await archive(shards, before, args.batch, on_batch=report)
+        if not progress.chats:
+            print(f"No chats idle for {days} days")
+        if args.vacuum:
+            for shard in shards:
+                await _vacuum(shard)
+    elif args.command == "restore":
+        print(f"Restored {await restore_all(shards)} messages")
+    else:
+        totals = await stats(shards)
+        print(
+            f"{totals['archived_chats']} of {totals['chats']} chats archived in "
+            f"{totals['segments']} segments, {_mb(totals['segment_bytes'])} "
+            f"({_mb(totals['live_bytes'])} live); "
+            f"{totals['messages']} messages in the DB"
+        )
+    await shards.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
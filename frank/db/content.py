@@ -0,0 +1,199 @@
+"""Storage codecs for `ChatMessage` content.
+
+Rows used to hold their messages as JSON in `content`. With CONTENT_CODEC
+"zstd" (the default) they are written to `body` instead: one version byte,
+then the message list as MessagePack compressed with zstd against a
+dictionary shared by every row. A single message is a few hundred bytes,
+mostly the same keys and values each time, which zstd alone can't do much
+with; the dictionary is what makes it small. The version byte names the
+dictionary, so one can be retrained without rewriting the rows written with
+the last one (add the new file to DICTIONARIES and bump VERSION).
+
+Rows written before this keep their JSON `content` and are read as they
+are. `migrate` (or `make db-compress`) rewrites them in the background, a
+batch at a time:
+
+    uv run python -m frank.db.content migrate
+
+and `train` builds a new dictionary from the messages already stored:
+
+    uv run python -m frank.db.content train frank/db/content-2.zdict
+"""
+
+import argparse
+import asyncio
+import threading
+from functools import cache
+from pathlib import Path
+import msgpack
+import zstandard
+from sqlalchemy import select, update
+from frank.core.config import settings
+from frank.core.shards import Shards, shards
+from frank.db.models import ChatMessage
+
+# version byte -> dictionary the body was compressed with
+DICTIONARIES = {1: "content-1.zdict"}
+VERSION = 1
+
+_local = threading.local()
+
+
+class JsonContent:
+    """The message list as JSON in `content`, as rows were first written"""
+
+    name = "json"
+
+    def columns(self, messages: list[dict]) -> dict:
+        return {"content": messages, "body": None}
+
+
+class ZstdContent:
+    """The message list as dictionary-compressed MessagePack in `body`"""
+
+    name = "zstd"
+
+    def columns(self, messages: list[dict]) -> dict:
+        return {"content": None, "body": encode_body(messages)}
+
+
+JSON_CONTENT = JsonContent()
+ZSTD_CONTENT = ZstdContent()
+CODECS = {codec.name: codec for codec in (JSON_CONTENT, ZSTD_CONTENT)}
+
+ContentCodec = JsonContent | ZstdContent
+
+
+def content_codec() -> ContentCodec:
+    """The codec new rows are written with (CONTENT_CODEC)"""
+    return CODECS[settings.CONTENT_CODEC]
+
+
+def encode_body(messages: list[dict], version: int = VERSION) -> bytes:
+    compressor = _compressors().get(version)
+    if compressor is None:
+        compressor = _compressors()[version] = zstandard.ZstdCompressor(
+            level=settings.CONTENT_ZSTD_LEVEL,
+            dict_data=_dictionary(version),
+            write_dict_id=False,
+        )
+    return bytes([version]) + compressor.compress(msgpack.packb(messages))
+
+
+def decode_body(body: bytes) -> list[dict]:
+    version = body[0]
+    decompressor = _decompressors().get(version)
+    if decompressor is None:
+        decompressor = _decompressors()[version] = zstandard.ZstdDecompressor(
+            dict_data=_dictionary(version)
+        )
+    return msgpack.unpackb(decompressor.decompress(body[1:]))
+
+
+def decode_row(content: list[dict] | None, body: bytes | None) -> list[dict]:
+    """A row's messages, whichever column they are in"""
+    if body is not None:
+        return decode_body(body)
+    return content or []
+
+
+@cache
+def _dictionary(version: int) -> zstandard.ZstdCompressionDict:
+    if version not in DICTIONARIES:
+        raise ValueError(f"Unknown message content version {version}")
+    path = Path(__file__).with_name(DICTIONARIES[version])
+    return zstandard.ZstdCompressionDict(path.read_bytes())
+
+
+def _compressors() -> dict[int, zstandard.ZstdCompressor]:
+    # neither kind can be shared between threads
+    if not hasattr(_local, "compressors"):
+        _local.compressors = {}
+    return _local.compressors
+
+
+def _decompressors() -> dict[int, zstandard.ZstdDecompressor]:
+    if not hasattr(_local, "decompressors"):
+        _local.decompressors = {}
+    return _local.decompressors
+
+
+async def migrate(source: Shards, batch: int = 500, pause: float = 0.05) -> int:
+    """Rewrite rows still holding JSON with the current codec, `batch` at a
+    time with `pause` seconds between batches so live writes get the lock
+    in between. Returns how many were rewritten."""
+    codec = content_codec()
+    if codec is JSON_CONTENT:
+        return 0
+    migrated = 0
+    for shard in source:
+        after = None
+        while True:
+            query = (
+                select(ChatMessage.id, ChatMessage.content)
+                .where(ChatMessage.body.is_(None))
+                .order_by(ChatMessage.id)
+                .limit(batch)
+            )
+            if after is not None:
+                query = query.where(ChatMessage.id > after)
+            async with shard.read_sessions() as session:
+                rows = (await session.execute(query)).all()
+            if not rows:
+                break
+            after = rows[-1].id
+
+            # by primary key, in one executemany
+            async with shard.sessions() as session:
+                await session.execute(
+                    update(ChatMessage),
+                    [
+                        {"id": row.id, **codec.columns(row.content or [])}
+                        for row in rows
+                    ],
+                )
+                await session.commit()
+            migrated += len(rows)
+            await asyncio.sleep(pause)
+    return migrated
+
+
+async def train(source: Shards, size: int, samples: int) -> bytes:
+    """A dictionary of `size` bytes trained on the newest `samples` messages"""
+    messages = []
+    for shard in source:
+        query = (
+            select(ChatMessage.content, ChatMessage.body)
+            .order_by(ChatMessage.created_at.desc())
+            .limit(samples)
+        )
+        async with shard.read_sessions() as session:
+            for row in (await session.execute(query)).all():
+                messages.append(msgpack.packb(decode_row(row.content, row.body)))
+    return zstandard.train_dictionary(size, messages).as_bytes()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate_args = commands.add_parser("migrate", help="rewrite JSON rows")
+    migrate_args.add_argument("--batch", type=int, default=500)
+    migrate_args.add_argument("--pause-ms", type=int, default=50)
+    train_args = commands.add_parser("train", help="train a new dictionary")
+    train_args.add_argument("out", type=Path)
+    train_args.add_argument("--size", type=int, default=16384)
+    train_args.add_argument("--samples", type=int, default=20000)
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrated = await migrate(shards, args.batch, args.pause_ms / 1000)
+        print(f"Rewrote {migrated} messages with {settings.CONTENT_CODEC}")
+    else:
+        dictionary = await train(shards, args.size, args.samples)
+        args.out.write_bytes(dictionary)
+        print(f"Wrote a {len(dictionary)} byte dictionary to {args.out}")
+    await shards.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -56,6 +56,18 @@ class ChatSession(BaseModel):
     ts: Mapped[datetime] = mapped_column(
         sa.DateTime(timezone=True), server_default=func.now(), index=True
     )
+    # rolling summary of the messages up to and including summary_seq
+    summary: Mapped[str | None] = mapped_column(sa.Text)
+    summary_seq: Mapped[int] = mapped_column(sa.Integer, server_default="0")
+    # updated in the same transaction as every insert of messages, so saves
+    # and loads don't have to scan chat_message for them
+    last_seq: Mapped[int] = mapped_column(sa.Integer, server_default="0")
+    message_count: Mapped[int] = mapped_column(sa.Integer, server_default="0")
+    last_message_at: Mapped[datetime | None] = mapped_column(sa.DateTime(timezone=True))
+    # where the messages went if they were archived (see frank/db/archive.py)
+    archive_segment: Mapped[int | None] = mapped_column(sa.Integer)
+    archive_offset: Mapped[int | None] = mapped_column(sa.BigInteger)
+    archive_length: Mapped[int | None] = mapped_column(sa.Integer)
 
     messages: Mapped[list["ChatMessage"]] = relationship(
         back_populates="chat", cascade="all, delete-orphan"
@@ -69,14 +81,20 @@ class ChatRole(str, enum.Enum):
 
 class ChatMessage(BaseModel):
     __tablename__ = "chat_message"
+    __table_args__ = (
+        sa.Index("ix_chat_message_chat_id_seq", "chat_id", "seq", unique=True),
+    )
 
     chat_id: Mapped[uuid.UUID] = mapped_column(
         sa.Uuid(as_uuid=True),
         sa.ForeignKey("chat.id", ondelete="CASCADE"),
-        index=True,
     )
-    seq: Mapped[int] = mapped_column(sa.Integer, index=True)
+    seq: Mapped[int] = mapped_column(sa.Integer)
     role: Mapped[ChatRole] = mapped_column(sa.Enum(ChatRole, name="chat_role"))
-    content: Mapped[dict] = mapped_column(sa.JSON)
+    # legacy JSON; newer rows hold `body` instead (see frank/db/content.py)
+    content: Mapped[list | None] = mapped_column(
+        sa.JSON(none_as_null=True), nullable=True
+    )
+    body: Mapped[bytes | None] = mapped_column(sa.LargeBinary, nullable=True)
 
     chat: Mapped[ChatSession] = relationship(back_populates="messages")
@@ -0,0 +1,111 @@
+"""Move chats to the shards they belong on after DB_SHARDS changes.
+
+Set DB_SHARDS and DB_SHARD_URL to the new layout, migrate (which creates
+the new shards) and, with the app stopped, give this the old layout:
+
+    uv run alembic upgrade head
+    uv run python -m frank.db.reshard --from-shards 2 --from-url "sqlite+..."
+
+`--from-shards 0` means the chats are still in DATABASE_URL. Each batch of
+chats is copied to its new shard and committed there before it is deleted
+from the old one, and chats already copied are skipped, so an interrupted
+run can simply be started again.
+"""
+
+import argparse
+import asyncio
+from collections import defaultdict
+from sqlalchemy import delete, insert, select
+from frank.core.config import settings
+from frank.core.shards import Shard, Shards, shard_urls, shards
+from frank.db.models import ChatMessage, ChatSession
+
+_chats = ChatSession.__table__
+_messages = ChatMessage.__table__
+
+
+async def reshard(source: Shards, target: Shards, batch: int = 100) -> int:
+    """Move every chat in `source` that `target` puts on another database.
+    Returns how many were moved."""
+    moved = 0
+    for shard in source:
+        after = None
+        while True:
+            query = select(_chats.c.id, _chats.c.user_id).order_by(_chats.c.id)
+            if after is not None:
+                query = query.where(_chats.c.id > after)
+            async with shard.read_sessions() as session:
+                rows = (await session.execute(query.limit(batch))).all()
+            if not rows:
+                break
+            after = rows[-1].id
+
+            by_target: defaultdict[int, list] = defaultdict(list)
+            for chat_id, user_id in rows:
+                by_target[target.index_for(str(user_id))].append(chat_id)
+            for index, chat_ids in by_target.items():
+                if target[index].engine.url != shard.engine.url:
+                    await _move(shard, target[index], chat_ids)
+                    moved += len(chat_ids)
+    return moved
+
+
+async def _move(source: Shard, target: Shard, chat_ids: list) -> None:
+    async with source.read_sessions() as session:
+        chats = (
+            await session.execute(select(_chats).where(_chats.c.id.in_(chat_ids)))
+        ).mappings()
+        messages = (
+            await session.execute(
+                select(_messages).where(_messages.c.chat_id.in_(chat_ids))
+            )
+        ).mappings()
+        chats, messages = [dict(r) for r in chats], [dict(r) for r in messages]
+
+    async with target.sessions() as session:
+        copied = set(
+            await session.scalars(select(_chats.c.id).where(_chats.c.id.in_(chat_ids)))
+        )
+        chats = [c for c in chats if c["id"] not in copied]
+        messages = [m for m in messages if m["chat_id"] not in copied]
+        if chats:
+            await session.execute(insert(_chats), chats)
+        if messages:
+            await session.execute(insert(_messages), messages)
+        await session.commit()
+
+    async with source.sessions() as session:
+        await session.execute(
+            delete(_messages).where(_messages.c.chat_id.in_(chat_ids))
+        )
+        await session.execute(delete(_chats).where(_chats.c.id.in_(chat_ids)))
+        await session.commit()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--from-shards",
+        type=int,
+        required=True,
+        help="DB_SHARDS the chats were written with (0: DATABASE_URL)",
+    )
+    parser.add_argument(
+        "--from-url", default="", help="DB_SHARD_URL the chats were written with"
+    )
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args()
+
+    source = Shards.connect(
+        shard_urls(args.from_shards, args.from_url)
+        if args.from_shards
+        else [settings.DATABASE_URL]
+    )
+    moved = await reshard(source, shards, args.batch)
+    await source.dispose()
+    await shards.dispose()
+    print(f"Moved {moved} chats to {len(shards)} shard(s)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
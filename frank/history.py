@@ -0,0 +1,204 @@
+"""Chat history that decodes its messages only when they are used.
+
+Loading a chat from the cache or the DB gives each message as raw JSON (a
+string from the cache, a dict from the DB's JSON column). Validating those
+into pydantic-ai `ModelMessage`s is most of the cost of a load, and many
+loads never look at the messages: a reconnect without a send, or a REST
+fetch that only wants display text. `History` keeps the raw form until a
+message is read, then decodes everything pending in the requested range in
+one batch and keeps the result. Length, slicing and appending never decode,
+and messages that were never decoded are written back out as they came in.
+The async `decoded` and `dump_json` send large batches off the event loop
+(see frank/core/executor.py).
+"""
+
+import json
+from collections.abc import Iterable, Iterator, MutableSequence
+from typing import Any
+from pydantic import TypeAdapter
+from pydantic_core import core_schema
+from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter
+from frank.core.executor import offload
+
+
+_message_adapter: TypeAdapter[ModelMessage] = TypeAdapter(ModelMessage)
+
+# a message not decoded yet: its JSON text, or the dict parsed from it
+RawMessage = str | dict
+
+
+class History(MutableSequence):
+    """List of `ModelMessage`s, each held raw until it is first read"""
+
+    __slots__ = ("_items",)
+
+    def __init__(self, items: Iterable[ModelMessage | RawMessage] = ()):
+        self._items: list[ModelMessage | RawMessage] = list(items)
+
+    def messages(self, start: int = 0) -> list[ModelMessage]:
+        """Messages from index `start` on, decoding any still raw"""
+        start = range(len(self._items))[start:].start
+        self._decode(start)
+        return self._items[start:]
+
+    async def decoded(self, start: int = 0) -> list[ModelMessage]:
+        """Like `messages`, decoding large batches off the event loop"""
+        start = range(len(self._items))[start:].start
+        pending = self._pending(start)
+        if any(pending.values()):
+            texts, dicts = self._raw(pending)
+            decoded = await offload(
+                _validate,
+                texts,
+                dicts,
+                size=sum(map(_item_size, texts)) + sum(map(_item_size, dicts)),
+            )
+            # items may have been decoded meanwhile, but not moved
+            self._fill(pending, decoded)
+        return self._items[start:]
+
+    def json_items(self) -> list[str]:
+        """Each message as JSON text, re-encoding only decoded ones"""
+        return [_dump_json(item) for item in self._items]
+
+    async def dump_json(self) -> list[str]:
+        """Like `json_items`, encoding large histories off the event loop"""
+        return await offload(self.json_items, size=self.size)
+
+    def python_items(self) -> Iterator[dict]:
+        """Each message as a JSON-compatible dict, without validating it"""
+        for item in self._items:
+            if isinstance(item, dict):
+                yield item
+            elif isinstance(item, str):
+                yield json.loads(item)
+            else:
+                yield _message_adapter.dump_python(item, mode="json")
+
+    @property
+    def pending(self) -> int:
+        """Number of messages not decoded yet"""
+        return sum(isinstance(item, RawMessage) for item in self._items)
+
+    @property
+    def size(self) -> int:
+        """Approximate serialized size in bytes"""
+        return sum(map(_item_size, self._items))
+
+    def copy(self) -> "History":
+        return History(self._items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return History(self._items[index])
+        index = range(len(self._items))[index]
+        self._decode(index, index + 1)
+        return self._items[index]
+
+    def __setitem__(self, index, value) -> None:
+        self._items[index] = value
+
+    def __delitem__(self, index) -> None:
+        del self._items[index]
+
+    def insert(self, index: int, value: ModelMessage | RawMessage) -> None:
+        self._items.insert(index, value)
+
+    def extend(self, values: Iterable[ModelMessage | RawMessage]) -> None:
+        self._items.extend(values)
+
+    def __iter__(self) -> Iterator[ModelMessage]:
+        return iter(self.messages())
+
+    def __add__(self, other: Iterable) -> "History":
+        return History([*self._items, *other])
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (History, list)):
+            return self.messages() == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"History({len(self)} messages, {self.pending} pending)"
+
+    def _decode(self, start: int, stop: int | None = None) -> None:
+        pending = self._pending(start, stop)
+        if any(pending.values()):
+            self._fill(pending, _validate(*self._raw(pending)))
+
+    def _pending(self, start: int, stop: int | None = None) -> dict[type, list[int]]:
+        """Indexes of raw messages in the range, by kind"""
+        stop = len(self._items) if stop is None else stop
+        return {
+            kind: [i for i in range(start, stop) if isinstance(self._items[i], kind)]
+            for kind in (str, dict)
+        }
+
+    def _raw(self, pending: dict[type, list[int]]) -> tuple[list[str], list[dict]]:
+        return (
+            [self._items[i] for i in pending[str]],
+            [self._items[i] for i in pending[dict]],
+        )
+
+    def _fill(
+        self,
+        pending: dict[type, list[int]],
+        decoded: tuple[list[ModelMessage], list[ModelMessage]],
+    ) -> None:
+        for kind, messages in zip((str, dict), decoded):
+            for i, message in zip(pending[kind], messages):
+                self._items[i] = message
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source: Any, handler) -> Any:
+        return core_schema.no_info_plain_validator_function(
+            cls._validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(
+                lambda history: list(history.python_items())
+            ),
+        )
+
+    @classmethod
+    def _validate(cls, value: Any) -> "History":
+        if isinstance(value, History):
+            return value
+        if isinstance(value, (list, tuple)):
+            return cls(value)
+        raise ValueError("history must be a list of messages")
+
+
+def _validate(
+    texts: list[str], dicts: list[dict]
+) -> tuple[list[ModelMessage], list[ModelMessage]]:
+    # one validation pass per kind of raw message
+    return (
+        ModelMessagesTypeAdapter.validate_json("[" + ",".join(texts) + "]")
+        if texts
+        else [],
+        ModelMessagesTypeAdapter.validate_python(dicts) if dicts else [],
+    )
+
+
+def _dump_json(item: ModelMessage | RawMessage) -> str:
+    if isinstance(item, str):
+        return item
+    if isinstance(item, dict):
+        return json.dumps(item, separators=(",", ":"))
+    return _message_adapter.dump_json(item).decode()
+
+
+def _item_size(item: ModelMessage | RawMessage) -> int:
+    # JSON text is measured; otherwise the text content plus some overhead
+    if isinstance(item, str):
+        return len(item)
+    parts = item["parts"] if isinstance(item, dict) else item.parts
+    content = (
+        part.get("content")
+        if isinstance(part, dict)
+        else getattr(part, "content", None)
+        for part in parts
+    )
+    return 200 + sum(len(c) for c in content if isinstance(c, str))
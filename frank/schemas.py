@@ -1,8 +1,8 @@
 import enum
 from datetime import datetime, timezone
 from typing import Annotated, Literal
-from pydantic_ai.messages import ModelMessage
 from pydantic import BaseModel, ConfigDict, Field, Discriminator
+from frank.history import History
 
 
 class Chat(BaseModel):
@@ -15,13 +15,21 @@ class Chat(BaseModel):
     cur_query: "AgentQuery | None" = Field(default=None, alias="curQuery")
     pending: bool = False
     last_seq: int = Field(default=0, exclude=True, alias="lastSeq")
+    # number of earlier messages left out of history
+    history_offset: int = Field(default=0, exclude=True, alias="historyOffset")
+    # rolling summary standing in for messages up to summary_seq in prompts
+    summary: str | None = Field(default=None, exclude=True)
+    summary_seq: int = Field(default=0, exclude=True, alias="summarySeq")
     ts: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc), alias="updatedAt"
     )
-    # server-side history has pydantic-ai ModelMessage list, which needs to be
-    # serialized to json for storage (using type adapter)
-    history: list[ModelMessage] = Field(default_factory=list, exclude=True)
+    # server-side history of pydantic-ai ModelMessages, kept as loaded (raw
+    # JSON) until a message is read
+    history: History = Field(default_factory=History, exclude=True)
+
+    # so assigning a plain list still gives a History
+    model_config = ConfigDict(validate_assignment=True)
 
 
 class UserChat(Chat):
@@ -84,6 +92,9 @@ class EventType(str, enum.Enum):
     NEW_CHAT = "new_chat"
     NEW_CHAT_ACK = "new_chat_ack"
     REPLY = "reply"
+    STOP = "stop"
+    PING = "ping"
+    PONG = "pong"
     CHAT_TITLE = "chat_title"
     ERROR = "error"
 
@@ -93,6 +104,8 @@ class InitializeEvent(BaseModel):
 
     type: Literal[EventType.INITIALIZE] = EventType.INITIALIZE
     chat_id: str | None = Field(default=None, alias="chatId")
+    # reply offset already received, to resume a reply cut off mid-stream
+    resume_from: int | None = Field(default=None, alias="resumeFrom", ge=0)
     ts: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
@@ -111,6 +124,9 @@ class NewChatEvent(BaseModel):
     type: Literal[EventType.NEW_CHAT] = EventType.NEW_CHAT
     message: str
     model: str | None = None
+    # start the reply right away and stream it after the ack, instead of
+    # waiting for the client to initialize the new chat
+    stream: bool = False
     ts: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
@@ -133,12 +149,37 @@ class SendEvent(BaseModel):
     ts: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
+class StopEvent(BaseModel):
+    """Client sends this to stop the reply that is currently streaming"""
+
+    type: Literal[EventType.STOP] = EventType.STOP
+    chat_id: str | None = Field(default=None, alias="chatId")
+    ts: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class PingEvent(BaseModel):
+    """Heartbeat; the receiving side answers with a pong"""
+
+    type: Literal[EventType.PING] = EventType.PING
+    ts: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class PongEvent(BaseModel):
+    """Answer to a heartbeat ping"""
+
+    type: Literal[EventType.PONG] = EventType.PONG
+    ts: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
 class ReplyEvent(BaseModel):
     """Server sends this to reply (partially) to the client's message"""
 
     type: Literal[EventType.REPLY] = EventType.REPLY
     text: str = ""
     done: bool = False
+    generation_id: str | None = Field(default=None, alias="generationId")
+    # offset of `text` within the whole reply
+    offset: int = 0
     ts: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
@@ -164,6 +205,9 @@ ChatEvent = Annotated[
     | NewChatEvent
     | NewChatAckEvent
     | SendEvent
+    | StopEvent
+    | PingEvent
+    | PongEvent
     | ReplyEvent
     | ChatTitleEvent
     | ErrorEvent,
@@ -4,7 +4,7 @@ from typing import Annotated
 from fastapi import Depends, HTTPException, status, Query, Header
 from sqlalchemy import select, or_
 from sqlalchemy.ext.asyncio import AsyncSession
-from frank.core.db import get_session
+from frank.core.db import ReadSessionLocal, get_read_session, get_session
 from frank.db.models import User as DbUser, AuthToken as DbAuthToken
 from frank.schemas import AuthUserOut
 
@@ -31,7 +31,7 @@ async def get_user_from_token(token: str, session: AsyncSession) -> AuthUserOut
 async def get_user(
     token: str = Query(None),
     authorization: str = Header(None),
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
 ) -> AuthUserOut:
     token_to_try = token or (
         authorization.replace("Bearer ", "")
@@ -49,6 +49,16 @@ async def get_user(
     )
 
 
+async def get_ws_user(
+    token: str = Query(None),
+    authorization: str = Header(None),
+) -> AuthUserOut:
+    """Like get_user, but only holds a DB connection for the token lookup
+    instead of for the whole life of the websocket"""
+    async with ReadSessionLocal() as session:
+        return await get_user(token, authorization, session)
+
+
 async def create_anonymous_user(
     session: AsyncSession = Depends(get_session),
 ) -> tuple[DbUser, DbAuthToken]:
@@ -61,3 +71,4 @@ async def create_anonymous_user(
 
 
 UserRequired = Annotated[AuthUserOut, Depends(get_user)]
+WsUserRequired = Annotated[AuthUserOut, Depends(get_ws_user)]
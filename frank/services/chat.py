@@ -1,104 +1,388 @@
+import asyncio
 import json
 import logfire
 import uuid
 import httpx
+from cachetools import TTLCache
 from datetime import datetime, timezone
-from typing import Annotated
-from fastapi import Depends, HTTPException, WebSocket
-from pydantic_ai.messages import (
-    ModelMessagesTypeAdapter,
-    ModelRequest,
-    TextPart,
-    UserPromptPart,
-)
+from typing import Annotated, Awaitable, Callable
+from fastapi import Depends, HTTPException
+from pydantic_ai.messages import ModelRequest, TextPart, UserPromptPart
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
+from frank.core import metrics
 from frank.core.config import settings
-from frank.core.db import SessionLocal, get_session
+from frank.core.db import borrow_session
 from frank.core.redis import get_redis
-from frank.db.models import ChatMessage, ChatRole, ChatSession
-from frank.schemas import Chat, ChatTitleEvent, UserChat, ChatEntry
+from frank.core.shards import shards
+from frank.db.archive import restore
+from frank.db.content import decode_row
+from frank.db.models import ChatMessage, ChatSession
+from frank.history import History
+from frank.services.auth import UserRequired
+from frank.services.persistence import PendingChat, write_chats, writer
+from frank.schemas import Chat, ChatEvent, ChatTitleEvent, UserChat, ChatEntry
 
 
 HISTORY_LENGTH = 80
 CHAT_TTL = 60 * 60 * 24
 
 
-async def load_chat(chat_id: str, session: AsyncSession) -> Chat | None:
-    """Load a chat session from Redis, falling back to DB"""
+async def load_chat(
+    chat_id: str,
+    session: AsyncSession | None = None,
+    fresh: bool = False,
+    user_id: str | None = None,
+) -> Chat | None:
+    """Load a chat session from the in-process cache, then Redis, falling back
+    to DB. Concurrent misses for the same chat share one load. Without a
+    session, one is borrowed from the pool only on a cache miss, on the shard
+    of `user_id` (every shard in turn if not given). `fresh` skips the
+    in-process cache, which other workers' saves don't reach."""
+    if not fresh and (chat := _chats.get(chat_id)):
+        metrics.chat_cache_hits.add(1)
+        return _copy_chat(chat)
+
+    while loading := _loading.get(chat_id):
+        metrics.chat_cache_coalesced.add(1)
+        try:
+            chat = await asyncio.shield(loading)
+        except asyncio.CancelledError:
+            if not loading.cancelled():
+                raise
+            continue  # that load failed; the next waiter takes over
+        return _copy_chat(chat) if chat else None
+
+    metrics.chat_cache_misses.add(1)
+    loading = asyncio.get_running_loop().create_future()
+    _loading[chat_id] = loading
+    try:
+        chat = await _read_chat(chat_id, session, user_id)
+    except BaseException:
+        loading.cancel()
+        raise
+    finally:
+        del _loading[chat_id]
+    loading.set_result(chat)
+    if chat:
+        _chats[chat_id] = chat
+        return _copy_chat(chat)
+    return None
+
+
+async def _read_chat(
+    chat_id: str, session: AsyncSession | None, user_id: str | None
+) -> Chat | None:
     redis = get_redis()
 
     # fetch from cache
     try:
-        cached = await redis.get(_make_key(chat_id))
-
-        if cached:
-            if isinstance(cached, (str, bytes)):
-                return Chat.model_validate_json(cached)
-            return Chat.model_validate(cached)
+        meta, messages = await redis.eval(
+            _READ_CHAT,
+            keys=[_meta_key(chat_id), _history_key(chat_id)],
+            args=[str(HISTORY_LENGTH)],
+        )
+        if meta:
+            chat, db_seq = _chat_from_cache(meta, messages)
+            if (
+                db_seq < chat.last_seq
+                and _overdue(chat)
+                and not writer.is_pending(chat_id)
+            ):
+                await _reconcile(chat, session)
+            return chat
     except Exception as e:
         logfire.error(f"Error reading chat from Redis: {e}")
 
-    chat = await _fetch_chat(session, chat_id)
+    # a save still queued for the DB would be missing from it
+    if writer.is_pending(chat_id):
+        await writer.flush([chat_id])
+    for shard in shards.lookup(user_id):
+        async with borrow_session(session, shard.read_sessions) as borrowed:
+            chat = await _fetch_chat(borrowed, chat_id)
+        # a caller's session is only tried once
+        if chat or session:
+            break
     if chat:
         try:
-            chat_data = chat.model_dump(by_alias=True, mode="json")
-            chat_data["history"] = json.loads(
-                ModelMessagesTypeAdapter.dump_json(chat.history)
-            )
-            await redis.setex(_make_key(chat.id), CHAT_TTL, chat_data)
+            await _cache_chat(chat, chat.history, db_seq=chat.last_seq)
         except Exception as e:
             logfire.error(f"Error caching chat to Redis: {e}")
 
     return chat
 
 
-async def save_chat(chat: Chat, session: AsyncSession) -> str:
-    """Save a chat session to Redis"""
-    await _create_or_update_chat(session, chat)
+async def _reconcile(chat: Chat, session: AsyncSession | None) -> None:
+    """Write the cached chat's messages the DB doesn't have, such as saves
+    queued on a worker that died before writing them"""
+    try:
+        async with borrow_session(
+            session, shards.for_user(chat.user_id).read_sessions
+        ) as borrowed:
+            db_seq = await borrowed.scalar(
+                select(ChatSession.last_seq).where(ChatSession.id == uuid.UUID(chat.id))
+            )
+        db_seq = db_seq or 0
+        if db_seq >= chat.last_seq:
+            await _set_db_seqs({chat.id: db_seq})
+            return
+        # only the cached tail is left to write from
+        start = max(db_seq, chat.history_offset)
+        if start > db_seq:
+            logfire.error(f"Chat {chat.id} lost messages {db_seq + 1}-{start}")
+        missing = chat.history[start - chat.history_offset :]
+        await writer.write(
+            PendingChat(chat, dict(enumerate(missing.python_items(), start + 1)))
+        )
+        metrics.chat_reconciled.add(chat.last_seq - start)
+    except Exception as e:
+        logfire.error(f"Error reconciling chat {chat.id} with the DB: {e}")
 
-    # add to redis
-    chat_data = chat.model_dump(by_alias=True, mode="json")
-    chat_data["history"] = json.loads(ModelMessagesTypeAdapter.dump_json(chat.history))
+
+async def save_chat(chat: Chat, session: AsyncSession | None = None) -> str:
+    """Save a chat session to Redis and queue it for the DB (see
+    frank/services/persistence.py). With a session, or if Redis didn't take
+    it or won't outlive this process, the DB write happens before this
+    returns."""
+    if not chat.id:
+        chat.id = str(uuid.uuid4())
+    chat.updated_at = datetime.now(timezone.utc)
+    _chats.pop(chat.id, None)
+
+    # messages after last_seq are new; history may start partway through
+    previous_seq = chat.last_seq
+    new_messages = chat.history[max(0, previous_seq - chat.history_offset) :]
+    chat.last_seq = chat.history_offset + len(chat.history)
+    pending = PendingChat(
+        chat, dict(enumerate(new_messages.python_items(), start=previous_seq + 1))
+    )
+
+    # push only the new messages; rewrite the cached chat if it has gone
+    # missing or is somewhere else
+    cached = False
     try:
-        await get_redis().setex(_make_key(chat.id), CHAT_TTL, chat_data)
+        cached = await _cache_chat(chat, new_messages, previous_seq)
+        cached = cached or await _cache_chat(chat, chat.history)
     except Exception as e:
         logfire.error(f"Error saving chat session: {e}")
-        # not catastrophic, don't reraise exception
+        # not catastrophic, the DB write below still happens
+
+    if session is not None:
+        await write_chats(session, [pending])
+        try:
+            await _set_db_seqs({chat.id: chat.last_seq})
+        except Exception as e:
+            logfire.error(f"Error noting saved chat in Redis: {e}")
+    elif cached and settings.WRITE_BEHIND_MS and get_redis().durable:
+        writer.put(pending)
+    else:
+        await writer.write(pending)
     return chat.id
 
 
+async def save_summary(chat: Chat) -> None:
+    """Persist the chat's rolling summary and the seq it covers"""
+    async with shards.session(chat.user_id) as session:
+        chat_row = await session.get(ChatSession, uuid.UUID(chat.id))
+        if chat_row:
+            chat_row.summary = chat.summary
+            chat_row.summary_seq = chat.summary_seq
+            await session.commit()
+    try:
+        await _set_cached_fields(
+            chat.id, summary=chat.summary, summarySeq=chat.summary_seq
+        )
+    except Exception as e:
+        logfire.error(f"Error updating summary in Redis: {e}")
+
+
 def make_user_chat(chat: Chat) -> UserChat:
     """Make a UserChat model from a Chat model to send to the client"""
+    # read straight from the messages' JSON; no need to decode them for this
     return UserChat(
         **chat.model_dump(by_alias=True),
         history=[
             ChatEntry(
-                role="user" if isinstance(msg, ModelRequest) else "assistant",
+                role="user" if msg["kind"] == "request" else "assistant",
                 content=" ".join(
-                    part.content
-                    for part in msg.parts
-                    if isinstance(part, (UserPromptPart, TextPart))
-                    and getattr(part, "content", None)
+                    part["content"]
+                    for part in msg["parts"]
+                    if part["part_kind"] in _DISPLAY_PARTS
+                    and isinstance(part.get("content"), str)
+                    and part["content"]
                 ),
-                ts=getattr(
-                    msg.parts[0],
-                    "timestamp",
-                    getattr(msg, "timestamp", datetime.now(timezone.utc)),
+                ts=msg["parts"][0].get(
+                    "timestamp", msg.get("timestamp") or datetime.now(timezone.utc)
                 ),
             )
-            for msg in chat.history
-            if len(msg.parts) > 0
+            for msg in chat.history.python_items()
+            if len(msg["parts"]) > 0
+        ],
+    )
+
+
+_DISPLAY_PARTS = {UserPromptPart.part_kind, TextPart.part_kind}
+
+
+# Decoded chats, shared by every load on this worker; callers get copies so
+# they can't change each other's history. Saves and title updates here drop
+# the entry, other workers' entries age out after CHAT_CACHE_TTL_S.
+_chats: TTLCache[str, Chat] = TTLCache(
+    maxsize=settings.CHAT_CACHE_SIZE, ttl=settings.CHAT_CACHE_TTL_S
+)
+_loading: dict[str, asyncio.Future[Chat | None]] = {}
+
+
+def _copy_chat(chat: Chat) -> Chat:
+    return chat.model_copy(update={"history": chat.history.copy()})
+
+
+# Cached chats are a hash of metadata (each field a JSON value) plus a list of
+# the last HISTORY_LENGTH messages, one JSON message per entry. The hash's
+# lastSeq is the DB seq of the list's last message, so a save only has to push
+# what came after it, and dbSeq the last one the DB is known to have. Entries
+# are read back into History as is.
+
+# returns the metadata hash and the last ARGV[1] messages
+_READ_CHAT = """
+return {
+    redis.call("hgetall", KEYS[1]),
+    redis.call("lrange", KEYS[2], -tonumber(ARGV[1]), -1),
+}
+"""
+
+# ARGV: lastSeq the cache must be at ("" to rewrite it), ttl, max messages,
+# number of metadata fields, then field/value pairs, then messages to push.
+# Returns 0 without writing if the cache is somewhere else.
+_WRITE_CHAT = """
+if ARGV[1] == "" then
+    redis.call("del", KEYS[1], KEYS[2])
+elseif redis.call("hget", KEYS[1], "lastSeq") ~= ARGV[1] then
+    return 0
+end
+local first = 5 + 2 * tonumber(ARGV[4])
+redis.call("hset", KEYS[1], unpack(ARGV, 5, first - 1))
+if first <= #ARGV then
+    redis.call("rpush", KEYS[2], unpack(ARGV, first))
+    redis.call("ltrim", KEYS[2], -tonumber(ARGV[3]), -1)
+end
+redis.call("expire", KEYS[1], ARGV[2])
+redis.call("expire", KEYS[2], ARGV[2])
+return 1
+"""
+
+# updates metadata fields (ARGV: field/value pairs) without recreating an
+# expired chat
+_SET_FIELDS = """
+if redis.call("exists", KEYS[1]) == 1 then
+    return redis.call("hset", KEYS[1], unpack(ARGV))
+end
+return 0
+"""
+
+
+# sets dbSeq (ARGV[1]) without moving it back or recreating an expired chat
+_SET_DB_SEQ = """
+if redis.call("exists", KEYS[1]) == 0 then
+    return 0
+end
+local current = redis.call("hget", KEYS[1], "dbSeq")
+if not current or tonumber(current) < tonumber(ARGV[1]) then
+    redis.call("hset", KEYS[1], "dbSeq", ARGV[1])
+end
+return 1
+"""
+
+
+async def _cache_chat(
+    chat: Chat,
+    messages: History,
+    previous_seq: int | None = None,
+    db_seq: int | None = None,
+) -> bool:
+    """Write the chat's metadata and push `messages` onto its cached history.
+    With `previous_seq`, only if the cache is at that seq; otherwise the cache
+    is replaced and `messages` should be the whole history. `db_seq` is how
+    far the DB is known to have the chat, if it is."""
+    meta = chat.model_dump(by_alias=True, mode="json")
+    meta["lastSeq"] = chat.last_seq
+    if db_seq is not None:
+        meta["dbSeq"] = db_seq
+    meta["summary"] = chat.summary
+    meta["summarySeq"] = chat.summary_seq
+    fields = [item for k, v in meta.items() for item in (k, json.dumps(v))]
+    written = await get_redis().eval(
+        _WRITE_CHAT,
+        keys=[_meta_key(chat.id), _history_key(chat.id)],
+        args=[
+            "" if previous_seq is None else json.dumps(previous_seq),
+            str(CHAT_TTL),
+            str(HISTORY_LENGTH),
+            str(len(meta)),
+            *fields,
+            *await messages[-HISTORY_LENGTH:].dump_json(),
         ],
     )
+    return bool(written)
+
+
+async def _set_cached_fields(chat_id: str, **fields) -> None:
+    _chats.pop(chat_id, None)
+    await get_redis().eval(
+        _SET_FIELDS,
+        keys=[_meta_key(chat_id)],
+        args=[item for k, v in fields.items() for item in (k, json.dumps(v))],
+    )
+
+
+async def _set_db_seqs(seqs: dict[str, int]) -> None:
+    """Note in the cache the last seq the DB has of each chat"""
+    pipeline = get_redis().pipeline()
+    for chat_id, seq in seqs.items():
+        pipeline.eval(_SET_DB_SEQ, keys=[_meta_key(chat_id)], args=[json.dumps(seq)])
+    await pipeline.execute()
+
+
+writer.on_written = _set_db_seqs
+
 
+def _chat_from_cache(meta: list[str], messages: list[str]) -> tuple[Chat, int]:
+    """The cached chat, and the last seq the DB is known to have (0 if not
+    known)"""
+    data = {k: json.loads(v) for k, v in zip(meta[::2], meta[1::2])}
+    db_seq = data.pop("dbSeq", 0)
+    history = History(messages)
+    chat = Chat.model_validate(
+        {**data, "historyOffset": data["lastSeq"] - len(history)}
+    ).model_copy(update={"history": history})
+    return chat, db_seq
 
-def _make_key(chat_id: str) -> str:
-    """Create Redis key for chat session"""
-    return f"chat:{chat_id}"
 
+def _overdue(chat: Chat) -> bool:
+    # long enough since the last save that its worker should have written it
+    updated_at = chat.updated_at
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    age = (datetime.now(timezone.utc) - updated_at).total_seconds()
+    return age > settings.WRITE_BEHIND_MS / 1000 + settings.WRITE_BEHIND_GRACE_S
 
-async def _fetch_chat(session: AsyncSession, chat_id: str) -> Chat | None:
+
+def _meta_key(chat_id: str) -> str:
+    """Create Redis key for a chat's metadata"""
+    # braces keep both of a chat's keys in one slot, for the scripts
+    return f"chat:{{{chat_id}}}:meta"
+
+
+def _history_key(chat_id: str) -> str:
+    """Create Redis key for a chat's cached messages"""
+    return f"chat:{{{chat_id}}}:history"
+
+
+async def _fetch_chat(
+    session: AsyncSession, chat_id: str, window: int | None = HISTORY_LENGTH
+) -> Chat | None:
+    """Load a chat from the DB with its last `window` messages, or all of them
+    if `window` is None"""
     try:
         chat_uuid = uuid.UUID(chat_id)
     except ValueError:
@@ -107,17 +391,33 @@ async def _fetch_chat(session: AsyncSession, chat_id: str) -> Chat | None:
     chat_row = await session.get(ChatSession, chat_uuid)
     if not chat_row:
         return None
-
-    result = await session.execute(
-        select(ChatMessage)
+    if chat_row.archive_segment is not None:
+        # moved out of chat_message while idle; put back and read afresh
+        shard = shards.for_user(str(chat_row.user_id))
+        try:
+            await restore(shard, chat_row)
+        except Exception as e:
+            # serve the messages still in chat_message; the chat stays
+            # marked, so a later load tries the archive again
+            logfire.error(f"Error restoring archived chat {chat_id}: {e}")
+        else:
+            async with shard.read_sessions() as fresh:
+                return await _fetch_chat(fresh, chat_id, window)
+
+    # a range of the (chat_id, seq) index, ending at the row's last_seq
+    query = (
+        select(ChatMessage.seq, ChatMessage.content, ChatMessage.body)
         .where(ChatMessage.chat_id == chat_row.id)
-        .order_by(ChatMessage.seq.asc())
+        .order_by(ChatMessage.seq)
     )
-    rows = result.scalars().all()
+    if window is not None:
+        query = query.where(ChatMessage.seq > chat_row.last_seq - window)
+    rows = (await session.execute(query)).all()
 
-    history: list = []
-    for row in rows:
-        history.extend(ModelMessagesTypeAdapter.validate_python(row.content))
+    # unpacked here, validated when first read
+    history = History(
+        message for row in rows for message in decode_row(row.content, row.body)
+    )
 
     return Chat(
         id=str(chat_row.id),
@@ -127,73 +427,20 @@ async def _fetch_chat(session: AsyncSession, chat_id: str) -> Chat | None:
         ts=chat_row.ts,
         updatedAt=chat_row.updated_at,
         history=history,
-        lastSeq=rows[-1].seq if rows else 0,
+        lastSeq=chat_row.last_seq,
+        historyOffset=rows[0].seq - 1 if rows else chat_row.last_seq,
+        summary=chat_row.summary,
+        summarySeq=chat_row.summary_seq or 0,
     )
 
 
-async def _create_or_update_chat(session: AsyncSession, chat: Chat) -> None:
-    chat.updated_at = datetime.now(timezone.utc)
-
-    if chat.id:
-        chat_uuid = uuid.UUID(chat.id)
-        chat_row = await session.get(ChatSession, chat_uuid)
-    else:
-        chat_row = None
-
-    if not chat_row:
-        chat_row = ChatSession(
-            id=uuid.uuid4(),
-            user_id=uuid.UUID(chat.user_id),
-            title=chat.title,
-            model=chat.model,
-            ts=chat.ts,
-        )
-        session.add(chat_row)
-        await session.flush()
-        chat.id = str(chat_row.id)
-    else:
-        chat_row.title = chat.title
-        chat_row.model = chat.model
-        chat_row.ts = chat.ts
-
-    result = await session.execute(
-        select(ChatMessage.seq)
-        .where(ChatMessage.chat_id == chat_row.id)
-        .order_by(ChatMessage.seq.desc())
-        .limit(1)
-    )
-    last_seq = result.scalar_one_or_none() or 0
-
-    new_messages = chat.history[last_seq:]
-    if new_messages:
-        for i, msg in enumerate(new_messages, start=last_seq + 1):
-            session.add(
-                ChatMessage(
-                    chat_id=chat_row.id,
-                    seq=i,
-                    role=ChatRole.USER.value
-                    if isinstance(msg, ModelRequest)
-                    else ChatRole.ASSISTANT.value,
-                    content=json.loads(ModelMessagesTypeAdapter.dump_json([msg])),
-                )
-            )
-        chat.last_seq = last_seq + len(new_messages)
-    else:
-        chat.last_seq = last_seq
-
-    await session.commit()
-
-
-async def get_chat_optional(
-    chat_id: str, session: AsyncSession = Depends(get_session)
-) -> Chat | None:
-    return await load_chat(chat_id, session)
+async def get_chat_optional(chat_id: str, user: UserRequired) -> Chat | None:
+    # only the user's own shard; someone else's chat isn't found there
+    return await load_chat(chat_id, user_id=user.id)
 
 
-async def get_chat_required(
-    chat_id: str, session: AsyncSession = Depends(get_session)
-) -> Chat:
-    chat = await load_chat(chat_id, session)
+async def get_chat_required(chat_id: str, user: UserRequired) -> Chat:
+    chat = await load_chat(chat_id, user_id=user.id)
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
     return chat
@@ -210,7 +457,9 @@ TITLE_PROMPT = (
 )
 
 
-async def generate_and_set_title(chat: Chat, ws: WebSocket) -> None:
+async def generate_and_set_title(
+    chat: Chat, notify: Callable[[ChatEvent], Awaitable[None]]
+) -> None:
     """Generate a chat title asynchronously and push it to the client."""
     try:
         # extract first user message and first assistant reply
@@ -265,7 +514,7 @@ async def generate_and_set_title(chat: Chat, ws: WebSocket) -> None:
 
         # persist to DB
         chat.title = title
-        async with SessionLocal() as session:
+        async with shards.session(chat.user_id) as session:
             chat_row = await session.get(ChatSession, uuid.UUID(chat.id))
             if chat_row:
                 chat_row.title = title
@@ -273,18 +522,12 @@ async def generate_and_set_title(chat: Chat, ws: WebSocket) -> None:
 
         # update Redis cache
         try:
-            redis = get_redis()
-            cached = await redis.get(_make_key(chat.id))
-            if cached:
-                data = cached if isinstance(cached, dict) else json.loads(cached)
-                data["title"] = title
-                await redis.setex(_make_key(chat.id), CHAT_TTL, data)
+            await _set_cached_fields(chat.id, title=title)
         except Exception as e:
             logfire.error(f"Error updating title in Redis: {e}")
 
         # push to client
-        event = ChatTitleEvent(chatId=chat.id, title=title)
-        await ws.send_json(event.model_dump(by_alias=True, mode="json"))
+        await notify(ChatTitleEvent(chatId=chat.id, title=title))
 
     except Exception as e:
         logfire.error(f"Error generating chat title: {e}")
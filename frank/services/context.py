@@ -0,0 +1,180 @@
+"""Prompt context for agent replies.
+
+`Chat.history` is the stored tail of the transcript (every message also stays
+in `ChatMessage`). What the model is sent is fitted for each reply: the newest
+unsummarized messages that fit its token budget, behind the system prompt and
+a rolling summary of everything older. The summary is refreshed in the
+background once the unsummarized messages pass CONTEXT_SUMMARY_AT of the
+budget, so it is normally ready well before anything has to be left out.
+The same goes for the number of messages, since only the last HISTORY_LENGTH
+are kept in memory.
+"""
+
+import asyncio
+import logfire
+from cachetools import LRUCache
+from pydantic_ai import Agent
+from pydantic_ai.messages import (
+    ModelMessage,
+    ModelRequest,
+    SystemPromptPart,
+    TextPart,
+    UserPromptPart,
+)
+from frank.agents import CONTEXT_TOKENS, get_model
+from frank.core import metrics
+from frank.core.config import settings
+from frank.prompts import SYSTEM_PROMPT
+from frank.schemas import AgentQuery, Chat
+from frank.services.chat import HISTORY_LENGTH, save_summary
+
+
+SUMMARY_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an "
+    "assistant. Given the summary so far and the messages that follow it, "
+    "return an updated summary. Keep facts about the user, decisions, open "
+    "questions and anything the assistant committed to. Be concise; return "
+    "ONLY the summary."
+)
+SUMMARY_HEADER = "Summary of the earlier conversation:"
+
+summary_agent = Agent(instrument=True, system_prompt=SUMMARY_PROMPT)
+
+# estimated tokens per message, keyed by id() and holding the message so the
+# id can't be reused while its entry lives
+_token_counts: LRUCache[int, tuple[ModelMessage, int]] = LRUCache(maxsize=50_000)
+_summarizing: set[str] = set()
+
+
+def context_budget(model: str) -> int:
+    """Tokens of history, summary and prompt to send to `model`"""
+    window = CONTEXT_TOKENS.get(model, min(CONTEXT_TOKENS.values()))
+    return max(
+        0, min(settings.CONTEXT_MAX_TOKENS, window - settings.CONTEXT_RESERVE_TOKENS)
+    )
+
+
+def count_tokens(message: ModelMessage) -> int:
+    """Estimated tokens in a message (about 4 characters each), cached"""
+    cached = _token_counts.get(id(message))
+    if cached and cached[0] is message:
+        return cached[1]
+    count = _text_tokens(
+        "".join(
+            part.content
+            for part in message.parts
+            if isinstance(getattr(part, "content", None), str)
+        )
+    )
+    _token_counts[id(message)] = (message, count)
+    return count
+
+
+async def fit_context(chat: Chat, query: AgentQuery) -> list[ModelMessage]:
+    """History to send along with `query`: the newest unsummarized messages
+    that fit the model's budget, led by the system prompt and summary unless
+    the window still starts at the beginning of the chat"""
+    if not chat.history:
+        return []
+
+    head = [SystemPromptPart(content=SYSTEM_PROMPT)]
+    if chat.summary:
+        head.append(SystemPromptPart(content=f"{SUMMARY_HEADER}\n{chat.summary}"))
+    budget = context_budget(query.model) - _text_tokens(query.prompt)
+    budget -= sum(_text_tokens(part.content) for part in head)
+
+    await chat.history.decoded(_summarized(chat))
+    messages, _ = _unsummarized(chat)
+    start = _window_start(messages, budget)
+    window = messages[start:]
+    metrics.context_tokens.record(
+        sum(count_tokens(m) for m in window), {"model": query.model}
+    )
+
+    # the chat's first request already carries the system prompt
+    if window and any(isinstance(p, SystemPromptPart) for p in window[0].parts):
+        return window
+    return [ModelRequest(parts=head), *window]
+
+
+def maybe_summarize(chat: Chat, model: str) -> None:
+    """Refresh the chat's summary in the background if its unsummarized
+    messages have outgrown CONTEXT_SUMMARY_AT of the token budget or of
+    HISTORY_LENGTH. All but the newest CONTEXT_SUMMARY_KEEP is folded in."""
+    if chat.id in _summarizing:
+        return
+    budget = context_budget(model)
+    at, keep = settings.CONTEXT_SUMMARY_AT, settings.CONTEXT_SUMMARY_KEEP
+    messages, first_seq = _unsummarized(chat)
+    tokens = sum(count_tokens(m) for m in messages)
+    if tokens <= budget * at and len(messages) <= HISTORY_LENGTH * at:
+        return
+    end = max(
+        _window_start(messages, int(budget * keep)),
+        len(messages) - int(HISTORY_LENGTH * keep),
+    )
+    end = _turn_start(messages, end)
+    if end == 0:
+        return
+
+    _summarizing.add(chat.id)
+    task = asyncio.create_task(
+        _summarize(chat, messages[:end], through_seq=first_seq + end - 1)
+    )
+    task.add_done_callback(lambda _: _summarizing.discard(chat.id))
+
+
+async def _summarize(chat: Chat, messages: list[ModelMessage], through_seq: int):
+    try:
+        result = await summary_agent.run(
+            _transcript(chat.summary, messages), model=get_model(SUMMARY_MODEL)
+        )
+        chat.summary = result.output.strip()
+        chat.summary_seq = through_seq
+        await save_summary(chat)
+        logfire.info(f"Summarized chat {chat.id} through seq {through_seq}")
+    except Exception as e:
+        logfire.error(f"Error summarizing chat {chat.id}: {e}")
+
+
+def _summarized(chat: Chat) -> int:
+    """Number of messages in history that the summary covers"""
+    return max(0, chat.summary_seq - chat.history_offset)
+
+
+def _unsummarized(chat: Chat) -> tuple[list[ModelMessage], int]:
+    """Messages after the summary, and the seq of the first of them"""
+    skip = _summarized(chat)
+    return chat.history.messages(skip), chat.history_offset + skip + 1
+
+
+def _window_start(messages: list[ModelMessage], budget: int) -> int:
+    """Index of the oldest message in the newest run that fits `budget`,
+    moved forward to a request so turns aren't split"""
+    start, used = len(messages), 0
+    while start > 0 and used + count_tokens(messages[start - 1]) <= budget:
+        start -= 1
+        used += count_tokens(messages[start])
+    return _turn_start(messages, start)
+
+
+def _turn_start(messages: list[ModelMessage], i: int) -> int:
+    """First request at or after index `i`"""
+    while i < len(messages) and not isinstance(messages[i], ModelRequest):
+        i += 1
+    return i
+
+
+def _text_tokens(text: str) -> int:
+    return len(text) // 4 + 4
+
+
+def _transcript(summary: str | None, messages: list[ModelMessage]) -> str:
+    lines = [f"Summary so far:\n{summary or '(none)'}", "", "New messages:"]
+    for msg in messages:
+        role = "User" if isinstance(msg, ModelRequest) else "Assistant"
+        for part in msg.parts:
+            if isinstance(part, (UserPromptPart, TextPart)) and part.content:
+                lines.append(f"{role}: {part.content}")
+    return "\n".join(lines)
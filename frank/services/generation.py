@@ -0,0 +1,422 @@
+"""In-flight agent replies, decoupled from the sockets that stream them.
+
+A `Generation` runs one `stream_agent_response` call in its own task and
+appends the text to a replay buffer. Sockets follow it from an offset, so a
+client that reconnects mid-reply gets the missing tail and then the live
+deltas instead of paying for the whole LLM call again. The buffer tail is
+checkpointed to the cache under the generation id every REPLY_FLUSH_MS, which
+lets a reconnect that lands on another worker catch up from there.
+
+There is at most one generation per chat turn. Every socket showing the chat
+follows the same one, and a lease in the cache keeps other workers from
+starting a duplicate; they follow its checkpoints instead. A stop from one of
+those workers is left in the cache for the producer to pick up when it next
+checkpoints.
+"""
+
+import asyncio
+import bisect
+import time
+import uuid
+import logfire
+from contextlib import aclosing
+from typing import AsyncIterator
+from pydantic import BaseModel, Field
+from pydantic_ai.messages import ModelMessage
+from frank.agents import OnDoneCallback, stream_agent_response, partial_messages
+from frank.core.config import settings
+from frank.core.redis import get_redis
+from frank.schemas import AgentQuery, Chat
+from frank.services.context import fit_context
+
+
+class GenerationFailed(Exception):
+    """The agent errored before the reply finished"""
+
+
+class ResumeGap(Exception):
+    """The requested offset has already left the replay buffer"""
+
+
+class ReplyInProgress(Exception):
+    """The chat already has a reply streaming, here or on another worker"""
+
+    def __init__(self, generation_id: str | None):
+        super().__init__("A reply is already in progress")
+        self.generation_id = generation_id
+
+
+class ReplyCheckpoint(BaseModel):
+    """Cached tail of a reply, for resuming it from another worker"""
+
+    generation_id: str = Field(alias="generationId")
+    start: int = 0
+    text: str = ""
+    done: bool = False
+    error: str | None = None
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.text)
+
+
+class Generation:
+    """One agent reply streaming into a replay buffer"""
+
+    def __init__(
+        self,
+        chat: Chat,
+        query: AgentQuery,
+        on_done: OnDoneCallback,
+        generation_id: str | None = None,
+    ):
+        self.id = generation_id or uuid.uuid4().hex
+        self.chat = chat
+        self.query = query
+        # the reply's position in the chat history
+        self.turn = chat.history_offset + len(chat.history)
+        self.chunks: list[str] = []
+        self.offsets: list[int] = []  # reply offset of each chunk
+        self.length = 0
+        self.done = False
+        self.error: str | None = None
+        self.subscribers = 0
+        self._on_done = on_done
+        self._changed = asyncio.Event()
+        self._flushed_at = 0.0
+        self._flush: asyncio.Task | None = None
+        self._reap: asyncio.TimerHandle | None = None
+        self.task = asyncio.create_task(self._produce())
+        self.task.add_done_callback(self._on_task_done)
+        # let other workers find the reply before its first token
+        self._checkpoint()
+
+    @property
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+    def text_from(self, offset: int) -> str:
+        """Reply text from `offset` to the current end"""
+        if offset >= self.length:
+            return ""
+        i = bisect.bisect_right(self.offsets, offset) - 1
+        head = self.chunks[i][offset - self.offsets[i] :]
+        return head + "".join(self.chunks[i + 1 :])
+
+    async def follow(self, offset: int = 0) -> AsyncIterator[str]:
+        """Yield the reply from `offset` on, then live deltas until it ends.
+        Raises GenerationFailed if the agent errored."""
+        self.subscribers += 1
+        if self._reap:
+            self._reap.cancel()
+            self._reap = None
+        try:
+            offset = min(offset, self.length)
+            while True:
+                if offset < self.length:
+                    text = self.text_from(offset)
+                    offset += len(text)
+                    yield text
+                elif self.done:
+                    break
+                else:
+                    await self._changed.wait()
+            if self.error:
+                raise GenerationFailed(self.error)
+        finally:
+            self.subscribers -= 1
+            if not self.subscribers and not self.done:
+                self._reap_later()
+
+    def checkpoint(self) -> ReplyCheckpoint:
+        start = max(0, self.length - settings.REPLY_BUFFER_CHARS)
+        return ReplyCheckpoint(
+            generationId=self.id,
+            start=start,
+            text=self.text_from(start),
+            done=self.done,
+            error=self.error,
+        )
+
+    def cancel(self) -> None:
+        if not self.task.done():
+            self.task.cancel()
+
+    async def stop(self) -> None:
+        """Cancel the reply and wait for the partial result to be saved"""
+        self.cancel()
+        await asyncio.wait([self.task])
+
+    async def _produce(self):
+        finished = False
+
+        async def _on_done(query: AgentQuery, messages: list[ModelMessage]):
+            nonlocal finished
+            finished = True
+            # followers hear it's done once the chat has the reply, and the
+            # chat is free for its next turn by then
+            await self._on_done(query, messages)
+            self._release()
+            self._finish()
+
+        renew = asyncio.create_task(self._keep_lease())
+        try:
+            # aclosing() shuts the upstream request as soon as we're cancelled
+            async with aclosing(
+                stream_agent_response(
+                    self.query.prompt,
+                    model=self.query.model,
+                    history=await fit_context(self.chat, self.query),
+                    on_done=_on_done,
+                )
+            ) as stream:
+                async for chunk in stream:
+                    self._append(chunk)
+        except asyncio.CancelledError:
+            # stopped, or nobody came back for it; keep what we have
+            if not finished:
+                self.query.result = self.text
+                await self._on_done(self.query, partial_messages(self.query))
+            raise
+        except Exception as e:
+            logfire.error(f"Agent error in generation {self.id}: {e}")
+            self._finish(error=str(e))
+        finally:
+            renew.cancel()
+            self._release()
+            self._finish()
+            # the done checkpoint goes out once the reply is saved, so remote
+            # followers never see it finished before the chat has it
+            self._flush = asyncio.create_task(self._close(self._flush))
+
+    async def _keep_lease(self) -> None:
+        # tokens can stop coming for longer than the lease (a slow first
+        # token, a long tool call), so renew it on a timer too
+        interval = settings.REPLY_LEASE_S / 3
+        while True:
+            await asyncio.sleep(interval)
+            if time.monotonic() - self._flushed_at >= interval:
+                self._checkpoint()
+
+    def _on_task_done(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception():
+            logfire.error(f"Generation {self.id} failed: {task.exception()}")
+
+    def _append(self, chunk: str) -> None:
+        if not chunk:
+            return
+        self.chunks.append(chunk)
+        self.offsets.append(self.length)
+        self.length += len(chunk)
+        self._notify()
+        if time.monotonic() - self._flushed_at >= settings.REPLY_FLUSH_MS / 1000:
+            self._checkpoint()
+
+    def _release(self) -> None:
+        if _generations.get(self.chat.id) is self:
+            del _generations[self.chat.id]
+
+    def _finish(self, error: str | None = None) -> None:
+        if self.done:
+            return
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self) -> None:
+        # wake every follower, then arm a fresh event for the next change
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _reap_later(self) -> None:
+        grace = settings.REPLY_RESUME_GRACE_S
+        if grace <= 0:
+            self.cancel()
+        else:
+            self._reap = asyncio.get_running_loop().call_later(grace, self.cancel)
+
+    def _checkpoint(self) -> None:
+        self._flushed_at = time.monotonic()
+        # chain writes so an older tail never lands after a newer one
+        self._flush = asyncio.create_task(self._write_checkpoint(self._flush))
+
+    async def _write_checkpoint(self, previous: asyncio.Task | None) -> None:
+        if previous:
+            await asyncio.wait([previous])
+        if self.task.done():
+            return  # _close() writes the last one
+        try:
+            # while streaming, the checkpoint and lease live only as long as
+            # the producer keeps renewing them
+            *_, stop = await (
+                get_redis()
+                .pipeline()
+                .setex(
+                    _make_key(self.chat.id),
+                    settings.REPLY_LEASE_S,
+                    self.checkpoint().model_dump_json(by_alias=True),
+                )
+                .expire(_lease_key(self.chat.id, self.turn), settings.REPLY_LEASE_S)
+                .get(_stop_key(self.chat.id))
+                .execute()
+            )
+        except Exception as e:
+            logfire.error(f"Error checkpointing reply {self.id}: {e}")
+            return
+        if stop == self.id:
+            # a socket on another worker stopped it
+            self.cancel()
+
+    async def _close(self, previous: asyncio.Task | None) -> None:
+        if previous:
+            await asyncio.wait([previous])
+        try:
+            await (
+                get_redis()
+                .pipeline()
+                .setex(
+                    _make_key(self.chat.id),
+                    settings.REPLY_TTL,
+                    self.checkpoint().model_dump_json(by_alias=True),
+                )
+                .eval(
+                    _RELEASE_LEASE,
+                    keys=[_lease_key(self.chat.id, self.turn)],
+                    args=[self.id],
+                )
+                .execute()
+            )
+        except Exception as e:
+            logfire.error(f"Error closing reply {self.id}: {e}")
+
+
+_generations: dict[str, Generation] = {}
+
+# delete the lease only if we still hold it
+_RELEASE_LEASE = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+async def start_generation(
+    chat: Chat, query: AgentQuery, on_done: OnDoneCallback
+) -> Generation:
+    """Start streaming the reply for the chat's next turn in the background.
+    Raises ReplyInProgress if the chat already has one streaming."""
+    if generation := _generations.get(chat.id):
+        raise ReplyInProgress(generation.id)
+
+    generation_id = uuid.uuid4().hex
+    turn = chat.history_offset + len(chat.history)
+    holder = await _acquire_lease(chat.id, turn, generation_id)
+    if holder != generation_id:
+        raise ReplyInProgress(holder)
+    if generation := _generations.get(chat.id):
+        # started here while we were taking the lease
+        raise ReplyInProgress(generation.id)
+
+    generation = Generation(chat, query, on_done, generation_id)
+    _generations[chat.id] = generation
+    return generation
+
+
+async def request_stop(chat_id: str, generation_id: str) -> None:
+    """Stop a chat's reply wherever it is streaming: right away if it is
+    here, else at its producer's next checkpoint"""
+    if (generation := _generations.get(chat_id)) and generation.id == generation_id:
+        await generation.stop()
+        return
+    try:
+        await get_redis().setex(
+            _stop_key(chat_id), settings.REPLY_LEASE_S, generation_id
+        )
+    except Exception as e:
+        logfire.error(f"Error requesting reply stop: {e}")
+
+
+def get_generation(chat_id: str) -> Generation | None:
+    """The reply currently streaming for a chat on this worker, if any"""
+    return _generations.get(chat_id)
+
+
+async def load_checkpoint(chat_id: str) -> ReplyCheckpoint | None:
+    """The last checkpoint of a chat's most recent reply, if still cached"""
+    try:
+        cached = await get_redis().get(_make_key(chat_id))
+        if cached:
+            return ReplyCheckpoint.model_validate_json(cached)
+    except Exception as e:
+        logfire.error(f"Error reading reply checkpoint: {e}")
+    return None
+
+
+async def follow_checkpoint(
+    chat_id: str,
+    offset: int = 0,
+    checkpoint: ReplyCheckpoint | None = None,
+    generation_id: str | None = None,
+) -> AsyncIterator[str]:
+    """Yield a reply streaming on another worker from `offset` on, polling its
+    checkpoints until it ends, or none has been read for REPLY_LEASE_S"""
+    if checkpoint:
+        generation_id = checkpoint.generation_id
+    deadline = time.monotonic() + settings.REPLY_LEASE_S
+    while True:
+        if checkpoint:
+            if offset < checkpoint.start:
+                raise ResumeGap(f"offset {offset} is before {checkpoint.start}")
+            if offset < checkpoint.end:
+                yield checkpoint.text[offset - checkpoint.start :]
+                offset = checkpoint.end
+            if checkpoint.done:
+                break
+        await asyncio.sleep(settings.REPLY_FLUSH_MS / 1000)
+        latest = await load_checkpoint(chat_id)
+        if latest and latest.generation_id == generation_id:
+            checkpoint = latest
+            deadline = time.monotonic() + settings.REPLY_LEASE_S
+        elif latest and checkpoint:
+            # another reply has replaced it, so it won't finish
+            raise GenerationFailed("Reply was interrupted")
+        elif time.monotonic() > deadline:
+            # none for a whole lease (a miss may only be the cache failing
+            # a read): the producer went away without finishing
+            raise GenerationFailed("Reply was interrupted")
+    if checkpoint.error:
+        raise GenerationFailed(checkpoint.error)
+
+
+async def _acquire_lease(chat_id: str, turn: int, generation_id: str) -> str:
+    """Take the lease on producing a chat turn. Returns the generation id
+    holding it, which is ours if we got it."""
+    key = _lease_key(chat_id, turn)
+    try:
+        redis = get_redis()
+        while True:
+            if await redis.set(key, generation_id, nx=True, ex=settings.REPLY_LEASE_S):
+                return generation_id
+            if holder := await redis.get(key):
+                return holder
+            # expired between the two calls, so it's free again
+    except Exception as e:
+        # don't block replies on a cache outage
+        logfire.error(f"Error taking reply lease: {e}")
+        return generation_id
+
+
+def _lease_key(chat_id: str, turn: int) -> str:
+    """Create Redis key for the lease on producing a chat turn"""
+    return f"reply-lease:{chat_id}:{turn}"
+
+
+def _make_key(chat_id: str) -> str:
+    """Create Redis key for a chat's reply checkpoint"""
+    return f"reply:{chat_id}"
+
+
+def _stop_key(chat_id: str) -> str:
+    """Create Redis key asking a chat's reply producer to stop"""
+    return f"reply-stop:{chat_id}"
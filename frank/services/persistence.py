@@ -0,0 +1,278 @@
+"""Write-behind persistence for chats.
+
+`save_chat` writes to the cache first and then queues the chat here instead
+of committing it right away. Saves for a chat that is already queued merge
+into its entry, and a background writer commits whatever is queued up to
+WRITE_BEHIND_MS later, up to WRITE_BEHIND_BATCH chats per transaction. Under
+load that turns many small transactions (each waiting on SQLite's write
+lock) into a few larger ones.
+
+Until its flush, the cache holds the only copy of a save, so saves the
+cache didn't take are written through instead, as are saves given a session
+by the caller and every save when the cache is in-process (CACHE_BACKEND
+"memory") and would die with it. The queue is drained on shutdown. Each
+commit is noted in the cached chat (`on_written`), so if a worker dies
+first, a read that finds the DB still behind WRITE_BEHIND_GRACE_S after the
+chat's last save writes what it is missing (`_reconcile` in
+frank/services/chat.py). What is lost is what the cache no longer holds by
+then: saves older than its last HISTORY_LENGTH messages, or chats it has
+expired.
+
+A batch that fails is tried again a chat at a time, so a chat that can't
+be written doesn't hold back the others. Failed chats are queued again, and
+dropped (with an error logged) after WRITE_BEHIND_ATTEMPTS tries.
+
+Each chat is written to its user's shard (see frank/core/shards.py). Shards
+are flushed side by side, and in order within each, so a chat's saves are
+committed in the order they were made.
+"""
+
+import asyncio
+import uuid
+import logfire
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from frank.core import metrics
+from frank.core.config import settings
+from frank.core.shards import shards
+from frank.db.content import content_codec
+from frank.db.models import ChatMessage, ChatRole, ChatSession
+from frank.schemas import Chat
+
+
+@dataclass
+class PendingChat:
+    """A chat's latest saved state and the messages the DB doesn't have yet"""
+
+    chat: Chat
+    # seq -> message JSON
+    messages: dict[int, dict] = field(default_factory=dict)
+    # failed writes so far
+    attempts: int = 0
+
+    def merge(self, newer: "PendingChat") -> None:
+        self.chat = newer.chat
+        self.messages.update(newer.messages)
+
+
+class ChatWriter:
+    """Queue of chats waiting to be written, and the task that writes them"""
+
+    def __init__(self, sessionmaker: async_sessionmaker | None = None):
+        # without one, each chat goes to its user's shard
+        self.sessionmaker = sessionmaker
+        self._pending: dict[str, PendingChat] = {}
+        # taken off the queue but not committed yet
+        self._writing: dict[str, PendingChat] = {}
+        # told each committed chat's last seq
+        self.on_written: Callable[[dict[str, int]], Awaitable[None]] | None = None
+        self._queued = asyncio.Event()
+        self._locks: defaultdict[async_sessionmaker, asyncio.Lock] = defaultdict(
+            asyncio.Lock
+        )
+        self._task: asyncio.Task | None = None
+
+    def put(self, pending: PendingChat) -> None:
+        """Queue a save, merging it into the chat's entry if it has one"""
+        self._merge(pending)
+        self._queued.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def write(self, pending: PendingChat) -> None:
+        """Write a save now, along with any earlier save of the chat still
+        queued"""
+        self._merge(pending)
+        await self.flush([pending.chat.id])
+
+    def is_pending(self, chat_id: str) -> bool:
+        """Whether the chat has a save that isn't committed yet"""
+        return chat_id in self._pending or chat_id in self._writing
+
+    async def flush(self, chat_ids: list[str] | None = None) -> int:
+        """Write the queued chats (or just `chat_ids`) now. Returns how many
+        were written; on failure they are queued again and this raises."""
+        ids = list(self._pending) if chat_ids is None else chat_ids
+        by_shard: defaultdict[async_sessionmaker, list[str]] = defaultdict(list)
+        for chat_id in ids:
+            # one being written is waited for, behind its shard's lock
+            if pending := self._pending.get(chat_id) or self._writing.get(chat_id):
+                by_shard[self._sessionmaker_for(pending)].append(chat_id)
+        results = await asyncio.gather(
+            *(self._flush(s, group) for s, group in by_shard.items()),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return sum(results)
+
+    async def run(self) -> None:
+        """Flush WRITE_BEHIND_MS after each first save, until cancelled"""
+        while True:
+            await self._queued.wait()
+            await asyncio.sleep(settings.WRITE_BEHIND_MS / 1000)
+            self._queued.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logfire.error(f"Error writing chats to the DB: {e}")
+                self._queued.set()
+
+    async def close(self) -> None:
+        """Stop the writer and write everything still queued"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _flush(self, sessionmaker: async_sessionmaker, ids: list[str]) -> int:
+        async with self._locks[sessionmaker]:
+            batch = [p for i in ids if (p := self._pending.pop(i, None))]
+            self._writing.update((p.chat.id, p) for p in batch)
+            metrics.db_writes_pending.set(len(self._pending))
+            done, error, written = 0, None, []
+            try:
+                for start in range(0, len(batch), settings.WRITE_BEHIND_BATCH):
+                    chunk = batch[start : start + settings.WRITE_BEHIND_BATCH]
+                    try:
+                        async with sessionmaker() as session:
+                            await write_chats(session, chunk)
+                    except Exception:
+                        # one at a time, so a chat that can't be written
+                        # doesn't hold back the rest
+                        for pending in chunk:
+                            try:
+                                async with sessionmaker() as session:
+                                    await write_chats(session, [pending])
+                            except Exception as e:
+                                error = error or e
+                                self._failed(pending, e)
+                            else:
+                                written.append(pending)
+                            done += 1
+                    else:
+                        written.extend(chunk)
+                        done += len(chunk)
+            except BaseException:
+                for pending in batch[done:]:
+                    self._requeue(pending)
+                raise
+            finally:
+                for pending in batch:
+                    if self._writing.get(pending.chat.id) is pending:
+                        del self._writing[pending.chat.id]
+            await self._written(written)
+            if error:
+                raise error
+            return done
+
+    async def _written(self, written: list[PendingChat]) -> None:
+        if not (written and self.on_written):
+            return
+        try:
+            await self.on_written({p.chat.id: p.chat.last_seq for p in written})
+        except Exception as e:
+            logfire.error(f"Error noting written chats: {e}")
+
+    def _sessionmaker_for(self, pending: PendingChat) -> async_sessionmaker:
+        return self.sessionmaker or shards.for_user(pending.chat.user_id).sessions
+
+    def _merge(self, pending: PendingChat) -> None:
+        if queued := self._pending.get(pending.chat.id):
+            queued.merge(pending)
+        else:
+            self._pending[pending.chat.id] = pending
+        metrics.db_writes_pending.set(len(self._pending))
+
+    def _failed(self, pending: PendingChat, error: Exception) -> None:
+        pending.attempts += 1
+        if pending.attempts < settings.WRITE_BEHIND_ATTEMPTS:
+            self._requeue(pending)
+            return
+        # the cache may still have it for `_reconcile` in frank/services/chat.py
+        metrics.db_writes_dropped.add(1)
+        logfire.error(
+            f"Giving up writing chat {pending.chat.id} (seqs "
+            f"{sorted(pending.messages)}) after {pending.attempts} attempts: "
+            f"{error}"
+        )
+
+    def _requeue(self, pending: PendingChat) -> None:
+        # anything saved since is newer
+        if newer := self._pending.get(pending.chat.id):
+            pending.merge(newer)
+        self._pending[pending.chat.id] = pending
+        metrics.db_writes_pending.set(len(self._pending))
+
+
+async def write_chats(session: AsyncSession, batch: list[PendingChat]) -> None:
+    """Upsert the chats' rows and insert the messages the DB doesn't have yet,
+    in one transaction. Those are the ones after the row's last_seq, which is
+    kept up to date here along with the other message counters, and any
+    earlier ones missing from chat_message."""
+    ids = [uuid.UUID(p.chat.id) for p in batch]
+    codec = content_codec()
+    rows = {
+        row.id: row
+        for row in await session.scalars(
+            select(ChatSession).where(ChatSession.id.in_(ids))
+        )
+    }
+    for chat_id, pending in zip(ids, batch):
+        chat = pending.chat
+        if not (row := rows.get(chat_id)):
+            row = rows[chat_id] = ChatSession(
+                id=chat_id, user_id=uuid.UUID(chat.user_id)
+            )
+            session.add(row)
+        # title and summary are also written on their own, so never go back
+        row.title = chat.title or row.title
+        row.model = chat.model
+        row.ts = chat.ts
+        if chat.summary_seq > (row.summary_seq or 0):
+            row.summary = chat.summary
+            row.summary_seq = chat.summary_seq
+
+        last_seq = row.last_seq or 0
+        messages = sorted(pending.messages.items())
+        # saves can reach the DB out of order (a requeued batch, another
+        # worker's writer), so seqs below last_seq go in too unless present
+        earlier = [seq for seq, _ in messages if seq <= last_seq]
+        present = set()
+        if earlier:
+            present = set(
+                await session.scalars(
+                    select(ChatMessage.seq).where(
+                        ChatMessage.chat_id == chat_id, ChatMessage.seq.in_(earlier)
+                    )
+                )
+            )
+        new = [(s, m) for s, m in messages if s not in present]
+        if new:
+            # a unique (chat_id, seq) index fails the transaction if another
+            # writer got to these seqs first; it is retried from there
+            session.add_all(
+                ChatMessage(
+                    chat_id=chat_id,
+                    seq=seq,
+                    role=ChatRole.USER.value
+                    if message["kind"] == "request"
+                    else ChatRole.ASSISTANT.value,
+                    **codec.columns([message]),
+                )
+                for seq, message in new
+            )
+            row.last_seq = max(last_seq, new[-1][0])
+            row.message_count = (row.message_count or 0) + len(new)
+            row.last_message_at = datetime.now(timezone.utc)
+    await session.commit()
+    metrics.db_write_batch.record(len(batch))
+
+
+writer = ChatWriter()
@@ -0,0 +1,215 @@
+import asyncio
+import time
+import logfire
+from collections import deque
+from typing import Awaitable, Callable, Literal
+from frank.core import metrics
+from frank.schemas import ChatEvent, EventType, ReplyEvent
+
+
+SendText = Callable[[str], Awaitable[None]]
+WriteEvent = Callable[[ChatEvent], Awaitable[None]]
+OverflowPolicy = Literal["merge", "drop", "disconnect"]
+
+# events the client can do without when it can't keep up
+DROPPABLE = {EventType.CHAT_TITLE, EventType.PING, EventType.PONG}
+
+
+class ReplyCoalescer:
+    """Batches streamed reply deltas into fewer frames.
+
+    The first delta of each reply is sent right away so time-to-first-token is
+    unchanged. After that, deltas are buffered and flushed once `window`
+    seconds have passed, `max_bytes` have piled up, or the reply ends.
+    A window of 0 sends every delta as its own frame.
+    """
+
+    def __init__(self, send: SendText, window: float = 0.03, max_bytes: int = 2048):
+        self.send = send
+        self.window = window
+        self.max_bytes = max_bytes
+        self.frames = 0
+        self.deltas = 0
+        self._buffer: list[str] = []
+        self._size = 0
+        self._started = False
+        self._timer: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+
+    async def push(self, text: str) -> None:
+        """Add a delta to the current reply"""
+        if not text:
+            return
+
+        self.deltas += 1
+        self._buffer.append(text)
+        self._size += len(text.encode())
+
+        if not self._started or self.window <= 0 or self._size >= self.max_bytes:
+            self._started = True
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def flush(self) -> None:
+        """Send whatever is buffered as a single frame"""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        async with self._lock:
+            if not self._buffer:
+                return
+            text = "".join(self._buffer)
+            self._buffer.clear()
+            self._size = 0
+            self.frames += 1
+            await self.send(text)
+
+    async def end(self) -> None:
+        """Flush the tail of the current reply and get ready for the next one"""
+        await self.flush()
+        if self.deltas:
+            metrics.reply_frames.record(self.frames)
+            metrics.reply_deltas.record(self.deltas)
+        self.frames = 0
+        self.deltas = 0
+        self._started = False
+
+    def discard(self) -> None:
+        """Drop the current reply's buffered deltas without sending them"""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        self._buffer.clear()
+        self._size = 0
+        self.frames = 0
+        self.deltas = 0
+        self._started = False
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.window)
+        # clear the timer first so flush() doesn't cancel us mid-send
+        self._timer = None
+        await self.flush()
+
+
+class Outbox:
+    """Bounded queue of outgoing events, written to the socket by its own task.
+
+    Senders never wait on the socket. When `max_size` events are already
+    queued, the overflow policy decides what happens to the next one:
+    "merge" folds a reply delta (or its done event) into the queued delta it
+    continues, "drop" discards events in DROPPABLE, and "disconnect" gives
+    up on the client. Each policy falls back to the next one when it can't
+    make room.
+    """
+
+    def __init__(
+        self,
+        write: WriteEvent,
+        disconnect: Callable[[], Awaitable[None]],
+        max_size: int = 256,
+        policy: OverflowPolicy = "merge",
+    ):
+        self.write = write
+        self.disconnect = disconnect
+        self.max_size = max_size
+        self.policy = policy
+        self.closed = False
+        self._queue: deque[ChatEvent] = deque()
+        self._ready = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._writer: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def put(self, event: ChatEvent) -> None:
+        """Queue an event for the socket without waiting on it"""
+        if self.closed:
+            return
+        if len(self._queue) >= self.max_size and not self._make_room(event):
+            return
+
+        self._queue.append(event)
+        metrics.outbox_queued.add(1)
+        self._idle.clear()
+        self._ready.set()
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._run())
+
+    async def drain(self) -> None:
+        """Wait until everything queued so far has been written"""
+        await self._idle.wait()
+
+    def close(self) -> None:
+        """Stop writing and drop whatever is still queued"""
+        self.closed = True
+        if self._writer:
+            self._writer.cancel()
+            self._writer = None
+        metrics.outbox_queued.add(-len(self._queue))
+        self._queue.clear()
+        self._idle.set()
+
+    def _make_room(self, event: ChatEvent) -> bool:
+        """Apply the overflow policy to `event`. True if it should still be
+        queued."""
+        if self.policy == "merge" and self._merge(event):
+            metrics.outbox_overflow.add(1, {"action": "merge"})
+            return False
+        if self.policy in ("merge", "drop"):
+            if event.type in DROPPABLE:
+                metrics.outbox_overflow.add(1, {"action": "drop"})
+                return False
+            for queued in self._queue:
+                if queued.type in DROPPABLE:
+                    self._queue.remove(queued)
+                    metrics.outbox_queued.add(-1)
+                    metrics.outbox_overflow.add(1, {"action": "drop"})
+                    return True
+
+        metrics.outbox_overflow.add(1, {"action": "disconnect"})
+        logfire.info(f"Outbox full ({len(self._queue)} events), disconnecting")
+        self.close()
+        asyncio.create_task(self.disconnect())
+        return False
+
+    def _merge(self, event: ChatEvent) -> bool:
+        last = self._queue[-1] if self._queue else None
+        if not (
+            isinstance(event, ReplyEvent)
+            and isinstance(last, ReplyEvent)
+            and not last.done
+            and last.generation_id == event.generation_id
+            and last.offset + len(last.text) == event.offset
+        ):
+            return False
+        # a done event folds in too, ending the merged delta
+        self._queue[-1] = last.model_copy(
+            update={"text": last.text + event.text, "done": event.done}
+        )
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            if not self._queue:
+                self._ready.clear()
+                self._idle.set()
+                await self._ready.wait()
+                continue
+
+            event = self._queue.popleft()
+            metrics.outbox_queued.add(-1)
+            started = time.perf_counter()
+            try:
+                await self.write(event)
+            except Exception as e:
+                # socket is gone; the receive loop will notice too
+                logfire.info(f"Outbox write failed: {e}")
+                self._writer = None
+                self.close()
+                return
+            metrics.outbox_stall.record((time.perf_counter() - started) * 1000)
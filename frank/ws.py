@@ -1,20 +1,39 @@
 import asyncio
-import json
+import time
+import uuid
 import pydantic
 import logfire
+from contextlib import aclosing
+from typing import AsyncIterator
 from fastapi import WebSocket, WebSocketDisconnect
-from sqlalchemy.ext.asyncio import AsyncSession
-from pydantic_ai.result import StreamedRunResult
-from frank.agents import stream_agent_response, MODELS, DEFAULT_MODEL
+from pydantic_ai.messages import ModelMessage
+from frank import connections
+from frank.agents import MODELS, DEFAULT_MODEL
+from frank.codec import JSON_CODEC, EventCodec, negotiate_codec
+from frank.core.config import settings
+from frank.history import History
+from frank.streaming import Outbox, ReplyCoalescer
 from frank.services.chat import (
     load_chat,
     save_chat,
     generate_and_set_title,
     HISTORY_LENGTH,
 )
-from frank.services.auth import UserRequired
+from frank.services.context import maybe_summarize
+from frank.services.generation import (
+    Generation,
+    GenerationFailed,
+    ReplyInProgress,
+    ResumeGap,
+    follow_checkpoint,
+    get_generation,
+    load_checkpoint,
+    request_stop,
+    start_generation,
+)
 from frank.schemas import (
     AgentQuery,
+    AuthUserOut,
     ChatEvent,
     InitializeEvent,
     InitializeAckEvent,
@@ -25,6 +44,8 @@ from frank.schemas import (
     Chat,
     NewChatEvent,
     NewChatAckEvent,
+    PingEvent,
+    PongEvent,
 )
 
 
@@ -33,30 +54,77 @@ class ChatWebSocketHandler:
         "Cannot call 'receive' once a disconnect message has been received",
     }
 
-    def __init__(self, ws: WebSocket, user: UserRequired, session: AsyncSession):
+    def __init__(
+        self,
+        ws: WebSocket,
+        user: AuthUserOut,
+        coalesce_ms: int | None = None,
+        coalesce_bytes: int | None = None,
+    ):
         self.ws = ws
         self.user = user
-        self.session = session
         self.chat: Chat | None = None
+        self.codec: EventCodec = JSON_CODEC
+        # heartbeat bookkeeping for the reaper (see frank/connections.py)
+        self.task: asyncio.Task | None = None
+        self.reaped = False
+        self.last_seen = self.last_activity = self.last_ping = time.monotonic()
+        # the reply this socket is following, the task streaming it to the
+        # socket, and how much of it has been sent
+        self.reply: Generation | None = None
+        self.reply_task: asyncio.Task | None = None
+        self.reply_id: str | None = None
+        self.reply_offset = 0
+        self.outbox = Outbox(
+            self.write_event,
+            self.disconnect_slow_client,
+            max_size=settings.WS_OUTBOX_SIZE,
+            policy=settings.WS_OUTBOX_POLICY,
+        )
+        self.replies = ReplyCoalescer(
+            self.send_reply_text,
+            window=(
+                coalesce_ms
+                if coalesce_ms is not None
+                else settings.WS_COALESCE_WINDOW_MS
+            )
+            / 1000,
+            max_bytes=coalesce_bytes or settings.WS_COALESCE_MAX_BYTES,
+        )
 
     async def run(self):
-        await self.ws.accept()
+        # JSON text frames unless the client offers a binary subprotocol;
+        # permessage-deflate is negotiated by the server (see main.py)
+        offered = self.ws.scope.get("subprotocols", [])
+        self.codec, subprotocol = negotiate_codec(offered)
+        await self.ws.accept(subprotocol=subprotocol)
         logfire.info(f"WebSocket connected for user {self.user.id}")
+        self.task = asyncio.current_task()
+        connections.register(self)
 
+        # the receive loop keeps reading while a reply streams in its own
+        # task, so stop events and disconnects are seen right away
         try:
             while True:
-                data = await self.ws.receive_text()
+                data = await self.receive_frame()
+                self.last_seen = time.monotonic()
                 if not data:
                     continue
                 try:
                     # parse event
-                    event = pydantic.TypeAdapter(ChatEvent).validate_python(
-                        json.loads(data)
-                    )
+                    event = self.codec.decode(data)
+
+                    if event.type == EventType.PING:
+                        await self.send_to_user(PongEvent())
+                        continue
+                    if event.type == EventType.PONG:
+                        continue
+                    self.last_activity = self.last_seen
 
                     if not self.chat and event.type not in (
                         EventType.INITIALIZE,
                         EventType.NEW_CHAT,
+                        EventType.STOP,
                     ):
                         await self.send_error("No chat initialized", "no_chat")
                         return
@@ -70,13 +138,22 @@ class ChatWebSocketHandler:
                     case EventType.INITIALIZE:
                         await self.handle_initialize(event)
                     case EventType.NEW_CHAT:
+                        await self.detach_reply()
                         await self.handle_new_chat(event)
                     case EventType.SEND:
                         await self.handle_send(event)
+                    case EventType.STOP:
+                        await self.stop_generation()
 
         except WebSocketDisconnect:
             logfire.info("WebSocket disconnected")
 
+        except asyncio.CancelledError:
+            if not self.reaped:
+                raise
+            # cancelled by reap(); finish up normally
+            asyncio.current_task().uncancel()
+
         except RuntimeError as e:
             if any(ignore in str(e) for ignore in self.IGNORE_ERRORS):
                 pass
@@ -84,11 +161,39 @@ class ChatWebSocketHandler:
                 logfire.error(f"Runtime error: {e}")
                 raise
 
+        finally:
+            # the reply keeps streaming for a grace period in case the client
+            # reconnects, then it's cancelled
+            connections.unregister(self)
+            await self.detach_reply()
+            self.outbox.close()
+            self.chat = None
+
     async def handle_initialize(self, event: InitializeEvent):
+        if (
+            self.reply_task
+            and self.chat
+            and self.chat.id == event.chat_id
+            and event.resume_from is None
+        ):
+            # already streaming this chat's reply (new_chat with stream=True),
+            # no need to load it back or subscribe again
+            ack_event = InitializeAckEvent(chatId=event.chat_id, models=MODELS)
+            await self.send_to_user(ack_event)
+            return
+
+        await self.detach_reply()
         chat: Chat | None = None
 
         if event.chat_id:
-            chat = await load_chat(event.chat_id, self.session)
+            # a reply streaming here has the freshest copy of the chat, which
+            # may not even be saved yet
+            generation = get_generation(event.chat_id)
+            chat = (
+                generation.chat
+                if generation
+                else await load_chat(event.chat_id, user_id=self.user.id)
+            )
             if chat and chat.user_id != self.user.id:
                 await self.send_error("Access denied", "access_denied")
                 return
@@ -98,18 +203,28 @@ class ChatWebSocketHandler:
         ack_event = InitializeAckEvent(chatId=event.chat_id, models=MODELS)
         await self.send_to_user(ack_event)
 
-        # if chat is pending and has a query, stream response
-        if chat and chat.pending and chat.cur_query:
-            await self.stream_response(chat.cur_query, chat)
+        if chat:
+            await self.resume_reply(chat, event.resume_from)
 
     async def handle_new_chat(self, event: NewChatEvent):
         # create/save new chat and send back ack
         model = event.model or DEFAULT_MODEL.id
         chat = Chat(userId=self.user.id, pending=True)
         chat.cur_query = AgentQuery(prompt=event.message, model=model)
-        chat_id = await save_chat(chat, self.session)
 
-        await self.send_to_user(NewChatAckEvent(chatId=chat_id))
+        if not event.stream:
+            chat_id = await save_chat(chat)
+            await self.send_to_user(NewChatAckEvent(chatId=chat_id))
+            return
+
+        # fast path: pick the id ourselves so the reply can start now, with
+        # the insert running alongside the upstream request
+        chat.id = str(uuid.uuid4())
+        created = asyncio.create_task(save_chat(chat))
+        created.add_done_callback(_log_save_error)
+        await self.send_to_user(NewChatAckEvent(chatId=chat.id))
+        self.chat = chat
+        await self.start_reply(chat.cur_query, chat, after=created)
 
     async def handle_send(self, event: SendEvent):
         """Handle message from the user"""
@@ -118,61 +233,234 @@ class ChatWebSocketHandler:
             await self.send_error("No chat initialized", "no_chat")
             return
 
-        async def _on_done(query: AgentQuery, result: StreamedRunResult):
-            await self.handle_agent_done(query, result, self.chat)
+        if get_generation(self.chat.id):
+            await self.send_error("A reply is already in progress", "busy")
+            return
 
+        # another socket may have added turns to this chat since we loaded it,
+        # and an idle socket's chat has had its history dropped
+        self.chat = (
+            await load_chat(self.chat.id, fresh=True, user_id=self.user.id) or self.chat
+        )
+        query = AgentQuery(prompt=event.message, model=event.model or DEFAULT_MODEL.id)
         try:
-            async for chunk in stream_agent_response(
-                event.message,
-                model=event.model if event.model else None,
-                history=self.chat.history,
-                on_done=_on_done,
-            ):
-                await self.send_to_user(ReplyEvent(text=chunk, done=False))
-        except Exception as e:
-            logfire.error(f"Agent error in handle_send: {e}")
-            await self.send_error(str(e), "agent_error")
+            await self.start_reply(query, self.chat)
+        except ReplyInProgress:
+            await self.send_error("A reply is already in progress", "busy")
+
+    async def resume_reply(self, chat: Chat, resume_from: int | None):
+        """Pick up a reply that is streaming (or just finished) for this chat:
+        from this worker's buffer, from another worker's checkpoints, or by
+        starting over if the pending chat's reply was lost entirely"""
+        offset = resume_from or 0
+        if generation := get_generation(chat.id):
+            self.join_reply(generation, offset)
+        elif checkpoint := await load_checkpoint(chat.id):
+            # a finished reply is already in the saved chat, so only replay it
+            # for a client that says how much it has
+            if not checkpoint.done or resume_from is not None:
+                self.follow_reply(
+                    checkpoint.generation_id,
+                    follow_checkpoint(chat.id, offset, checkpoint),
+                    offset,
+                )
+        elif chat.pending and chat.cur_query:
+            try:
+                await self.start_reply(chat.cur_query, chat)
+            except ReplyInProgress as e:
+                # another socket got there first
+                if generation := get_generation(chat.id):
+                    self.join_reply(generation, offset)
+                else:
+                    self.follow_reply(
+                        e.generation_id,
+                        follow_checkpoint(
+                            chat.id, offset, generation_id=e.generation_id
+                        ),
+                        offset,
+                    )
+
+    async def start_reply(
+        self, query: AgentQuery, chat: Chat, after: asyncio.Task | None = None
+    ) -> None:
+        """Start the reply and follow it. Its save waits for `after`, e.g. the
+        chat's own insert."""
+
+        async def _on_done(q: AgentQuery, messages: list[ModelMessage]):
+            if after:
+                await asyncio.wait([after])
+            await self.handle_agent_done(q, messages, chat)
+
+        generation = await start_generation(chat, query, _on_done)
+        self.join_reply(generation, 0)
 
-    async def stream_response(self, query: AgentQuery, chat: Chat):
-        async def _on_done(q: AgentQuery, result: StreamedRunResult):
-            await self.handle_agent_done(q, result, chat)
+    def join_reply(self, generation: Generation, offset: int) -> None:
+        # share the generation's chat so this socket sees the new turn too
+        self.chat = generation.chat
+        self.reply = generation
+        self.follow_reply(generation.id, generation.follow(offset), offset)
 
+    def follow_reply(
+        self, generation_id: str | None, text: AsyncIterator[str], offset: int
+    ) -> None:
+        self.reply_id = generation_id
+        self.reply_offset = offset
+        self.reply_task = asyncio.create_task(self.stream_reply(text))
+        self.reply_task.add_done_callback(self._on_reply_done)
+
+    async def stream_reply(self, text: AsyncIterator[str]):
+        """Send a reply's text to the socket, then its done event"""
         try:
-            async for chunk in stream_agent_response(
-                query.prompt,
-                model=query.model,
-                history=chat.history,
-                on_done=_on_done,
-            ):
-                await self.send_to_user(ReplyEvent(text=chunk, done=False))
-        except Exception as e:
-            logfire.error(f"Agent error in stream_response: {e}")
+            async with aclosing(text):
+                async for chunk in text:
+                    await self.replies.push(chunk)
+            await self.replies.end()
+            await self.send_to_user(
+                ReplyEvent(
+                    done=True, generationId=self.reply_id, offset=self.reply_offset
+                )
+            )
+        except GenerationFailed as e:
+            await self.replies.end()
             await self.send_error(str(e), "agent_error")
+        except ResumeGap as e:
+            await self.replies.end()
+            await self.send_error(str(e), "resume_unavailable")
+        except (WebSocketDisconnect, RuntimeError) as e:
+            # socket went away mid-reply; the client can resume on reconnect
+            logfire.info(f"Reply stream closed: {e}")
+
+    async def detach_reply(self) -> None:
+        """Stop sending the current reply to this socket; the reply itself
+        carries on for anyone else following it"""
+        task = self.reply_task
+        if task and not task.done():
+            task.cancel()
+            await asyncio.wait([task])
+            self.replies.discard()
+        self.reply = None
+
+    async def stop_generation(self) -> None:
+        """Cancel the current reply, keeping whatever was generated so far"""
+        if self.reply:
+            await self.reply.stop()
+            if self.reply_task:
+                await asyncio.wait([self.reply_task])
+        elif self.reply_task and self.chat and self.reply_id:
+            # streaming on another worker: its producer sees the stop at the
+            # next checkpoint, and the follower streams the end from there
+            # without holding up the receive loop
+            await request_stop(self.chat.id, self.reply_id)
+
+    def _on_reply_done(self, task: asyncio.Task) -> None:
+        if task is self.reply_task:
+            self.reply_task = None
+            self.reply = None
+        if not task.cancelled() and task.exception():
+            logfire.error(f"Reply stream failed: {task.exception()}")
 
     async def handle_agent_done(
         self,
         query: AgentQuery,
-        result: StreamedRunResult,
+        messages: list[ModelMessage],
         chat: Chat,
     ):
         logfire.info(f"\n\n*** Agent query: {query.model_dump_json()}")
 
-        # send done event to client
-        await self.send_to_user(ReplyEvent(done=True))
-
-        # update chat history
-        chat.history.extend(result.new_messages())
-        chat.history = chat.history[-HISTORY_LENGTH:]
+        # update chat history (the stored tail; prompts are fitted from it)
+        chat.history.extend(messages)
+        if len(chat.history) > HISTORY_LENGTH:
+            chat.history_offset += len(chat.history) - HISTORY_LENGTH
+            chat.history = chat.history[-HISTORY_LENGTH:]
         chat.cur_query = query
         chat.pending = False
-        await save_chat(chat, self.session)
+        # finish the save even if the reply is being stopped right now
+        await asyncio.shield(save_chat(chat))
+        maybe_summarize(chat, query.model)
 
         # generate title asynchronously after first response
         if chat.title is None:
-            asyncio.create_task(generate_and_set_title(chat, self.ws))
+            asyncio.create_task(generate_and_set_title(chat, self.send_to_user))
+
+    async def receive_frame(self) -> str | bytes:
+        message = await self.ws.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+        return message.get("text") or message.get("bytes") or ""
 
     async def send_to_user(self, response: ChatEvent):
-        await self.ws.send_json(response.model_dump(by_alias=True, mode="json"))
+        # queued, so a slow client never holds up the caller
+        self.outbox.put(response)
+
+    async def write_event(self, event: ChatEvent):
+        data = self.codec.encode(event)
+        if self.codec.binary:
+            await self.ws.send_bytes(data)
+        else:
+            await self.ws.send_text(data.decode())
+
+    def is_idle(self, now: float) -> bool:
+        """No reply streaming and no user events for WS_IDLE_AFTER_S"""
+        return (
+            self.reply_task is None
+            and now - self.last_activity > settings.WS_IDLE_AFTER_S
+        )
+
+    def evict_chat(self) -> bool:
+        """Drop the chat's history, keeping the chat as a handle (id, seq and
+        metadata) for handle_send to load it back by. Returns whether there
+        was anything to drop."""
+        chat = self.chat
+        if not chat or not chat.history:
+            return False
+        # a copy, since a finished reply may share the chat with other sockets
+        self.chat = chat.model_copy(
+            update={
+                "history": History(),
+                "history_offset": chat.history_offset + len(chat.history),
+            }
+        )
+        return True
+
+    def resident_messages(self) -> int:
+        return len(self.chat.history) if self.chat else 0
+
+    def resident_bytes(self) -> int:
+        return self.chat.history.size if self.chat else 0
+
+    def ping(self, now: float) -> None:
+        self.last_ping = now
+        self.outbox.put(PingEvent())
+
+    async def reap(self, reason: str) -> None:
+        """Close a dead or idle connection; run() then releases its state"""
+        logfire.info(f"Closing {reason} websocket for user {self.user.id}")
+        self.reaped = True
+        # 4000 tells the client not to reconnect until the user is back
+        code = 4000 if reason == "idle" else 1001
+        try:
+            # a half-open socket may never finish the close handshake
+            await asyncio.wait_for(self.ws.close(code=code, reason=reason), 1)
+        except Exception as e:
+            logfire.info(f"Error closing {reason} websocket: {e}")
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+    async def disconnect_slow_client(self):
+        # 1013 "try again later": the client can reconnect and resume
+        await self.ws.close(code=1013, reason="Client too slow")
+
+    async def send_reply_text(self, text: str):
+        event = ReplyEvent(
+            text=text, done=False, generationId=self.reply_id, offset=self.reply_offset
+        )
+        self.reply_offset += len(text)
+        await self.send_to_user(event)
 
     async def send_error(self, detail: str, code: str):
         await self.send_to_user(ErrorEvent(detail=detail, code=code))
+
+
+def _log_save_error(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception():
+        logfire.error(f"Error saving new chat: {task.exception()}")
@@ -1,13 +1,29 @@
+import asyncio
 import uvicorn
-from fastapi import Depends, FastAPI, WebSocket
-from sqlalchemy.ext.asyncio import AsyncSession
+from contextlib import asynccontextmanager, suppress
+from fastapi import FastAPI, Query, WebSocket
+from frank.connections import run_reaper
+from frank.core.executor import monitor_loop
+from frank.services.persistence import writer
 from frank.ws import ChatWebSocketHandler
 from frank.core.logging import configure_logging
 from frank.api.routes import router as api_router
-from frank.core.db import get_session
-from frank.services.auth import UserRequired
+from frank.services.auth import WsUserRequired
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = [asyncio.create_task(run_reaper()), asyncio.create_task(monitor_loop())]
+    yield
+    for task in tasks:
+        task.cancel()
+    with suppress(asyncio.CancelledError):
+        await asyncio.gather(*tasks)
+    # write chats still queued for the DB
+    await writer.close()
+
+
+app = FastAPI(lifespan=lifespan)
 configure_logging(app)
 
 app.include_router(api_router)
@@ -16,11 +32,24 @@ app.include_router(api_router)
 @app.websocket("/ws/chat")
 async def chat_ws(
     ws: WebSocket,
-    user: UserRequired,
-    session: AsyncSession = Depends(get_session),
+    user: WsUserRequired,
+    coalesce_ms: int | None = Query(None, ge=0, le=250),
+    coalesce_bytes: int | None = Query(None, ge=1),
 ):
-    await ChatWebSocketHandler(ws, user, session).run()
+    await ChatWebSocketHandler(
+        ws,
+        user,
+        coalesce_ms=coalesce_ms,
+        coalesce_bytes=coalesce_bytes,
+    ).run()
 
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
+    uvicorn.run(
+        "main:app",
+        host="127.0.0.1",
+        port=8000,
+        reload=True,
+        ws="websockets",
+        ws_per_message_deflate=True,
+    )
@@ -3,9 +3,52 @@ import os
 # Set dummy env vars before any frank.* imports that trigger Settings()
 os.environ.setdefault("APP_ENV", "test")
 os.environ.setdefault("LOGFIRE_TOKEN", "test")
+os.environ.setdefault("CACHE_BACKEND", "memory")
 os.environ.setdefault("UPSTASH_REDIS_REST_URL", "https://fake.upstash.io")
 os.environ.setdefault("UPSTASH_REDIS_REST_TOKEN", "test")
 os.environ.setdefault("OPENROUTER_API_KEY", "test")
 os.environ.setdefault("HELICONE_API_KEY", "test")
 os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
 os.environ.setdefault("PROMPTLAYER_API_KEY", "test")
+
+# Builders shared by the test modules
+import uuid  # noqa: E402
+from unittest.mock import AsyncMock  # noqa: E402
+from pydantic_ai.messages import (  # noqa: E402
+    ModelRequest,
+    ModelResponse,
+    TextPart,
+    UserPromptPart,
+)
+from frank.codec import encode_event  # noqa: E402
+from frank.schemas import AuthUserOut, Chat  # noqa: E402
+
+
+def turn(i: int, chars: int | None = None) -> list:
+    """A question and its answer, `chars` long if given"""
+    return [
+        ModelRequest(parts=[UserPromptPart(content=f"question {i}")]),
+        ModelResponse(
+            parts=[TextPart(content=f"answer {i}" if chars is None else "x" * chars)]
+        ),
+    ]
+
+
+def make_chat(user_id: str | None = None) -> Chat:
+    return Chat(id=str(uuid.uuid4()), userId=user_id or str(uuid.uuid4()), title="Chat")
+
+
+def frame(event) -> dict:
+    """A websocket.receive message carrying `event`"""
+    return {"type": "websocket.receive", "text": encode_event(event).decode()}
+
+
+def make_handler(user: AuthUserOut | None = None, coalesce_ms: int = 0):
+    """A handler on a mock socket, for a new user if none is given. Replies
+    aren't coalesced unless asked for."""
+    from frank.ws import ChatWebSocketHandler
+
+    ws = AsyncMock()
+    ws.scope = {}
+    user = user or AuthUserOut(id=str(uuid.uuid4()))
+    return ChatWebSocketHandler(ws, user, coalesce_ms=coalesce_ms)
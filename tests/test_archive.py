@@ -0,0 +1,199 @@
+"""Tests for moving idle chats to archive segments and back."""
+
+import uuid
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+from sqlalchemy import func, select, update
+from frank.core.config import settings
+from frank.core.db import Base
+from frank.core.redis import MemoryBackend
+from frank.core.shards import Shards, shard_urls
+from frank.db import archive as archive_module
+from frank.db.archive import (
+    Progress,
+    SegmentReader,
+    SegmentWriter,
+    _archive_batch,
+    archive,
+    stats,
+)
+from frank.db.models import ChatMessage, ChatSession
+from frank.history import History
+from frank.schemas import Chat
+from frank.services import chat as chat_service
+from frank.services.chat import load_chat
+from frank.services.persistence import ChatWriter, PendingChat
+from tests.conftest import turn
+
+LONG_AGO = datetime.now(timezone.utc) - timedelta(days=90)
+
+
+@pytest_asyncio.fixture
+async def shards(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    monkeypatch.setattr(archive_module, "_reader", SegmentReader())
+    shards = Shards.connect(
+        shard_urls(2, f"sqlite+aiosqlite:///{tmp_path}/chats-{{shard}}.db")
+    )
+    for shard in shards:
+        async with shard.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    yield shards
+    archive_module._reader.close()
+    await shards.dispose()
+
+
+async def _save(shards, turns: int = 3, idle: bool = True) -> PendingChat:
+    messages = History([m for i in range(turns) for m in turn(i)])
+    chat = Chat(id=str(uuid.uuid4()), userId=str(uuid.uuid4()), lastSeq=len(messages))
+    pending = PendingChat(chat, dict(enumerate(messages.python_items(), 1)))
+    shard = shards.for_user(chat.user_id)
+    await ChatWriter(shard.sessions).write(pending)
+    if idle:
+        async with shard.sessions() as session:
+            await session.execute(
+                update(ChatSession)
+                .where(ChatSession.id == uuid.UUID(chat.id))
+                .values(last_message_at=LONG_AGO)
+            )
+            await session.commit()
+    return pending
+
+
+async def _message_count(shard, chat_id: str) -> int:
+    async with shard.read_sessions() as session:
+        return await session.scalar(
+            select(func.count()).where(ChatMessage.chat_id == uuid.UUID(chat_id))
+        )
+
+
+class TestArchive:
+    """Idle chats' messages move to segments and come back when loaded."""
+
+    @pytest.mark.asyncio
+    async def test_archives_idle_chats(self, shards):
+        idle = [await _save(shards) for _ in range(6)]
+        active = await _save(shards, idle=False)
+        before = datetime.now(timezone.utc) - timedelta(days=30)
+
+        progress = await archive(shards, before, batch=4)
+        assert (progress.chats, progress.messages) == (6, 36)
+        assert 0 < progress.archive_bytes < progress.db_bytes
+        assert (await archive(shards, before)).chats == 0
+
+        for pending in idle:
+            shard = shards.for_user(pending.chat.user_id)
+            assert await _message_count(shard, pending.chat.id) == 0
+        shard = shards.for_user(active.chat.user_id)
+        assert await _message_count(shard, active.chat.id) == 6
+
+        totals = await stats(shards)
+        assert totals["archived_chats"] == 6 and totals["chats"] == 7
+        assert totals["live_bytes"] == progress.archive_bytes
+        assert totals["messages"] == 6
+
+    @pytest.mark.asyncio
+    async def test_load_restores_chat(self, shards):
+        pending = await _save(shards)
+        await archive(shards, datetime.now(timezone.utc))
+        redis = MemoryBackend()
+        chat_service._chats.clear()
+
+        with (
+            patch("frank.services.chat.shards", shards),
+            patch("frank.services.chat.get_redis", return_value=redis),
+        ):
+            chat = await load_chat(pending.chat.id, user_id=pending.chat.user_id)
+
+        assert list(chat.history.python_items()) == list(pending.messages.values())
+        assert chat.last_seq == 6
+        shard = shards.for_user(pending.chat.user_id)
+        assert await _message_count(shard, pending.chat.id) == 6
+        async with shard.read_sessions() as session:
+            row = await session.get(ChatSession, uuid.UUID(pending.chat.id))
+        assert row.archive_segment is None
+
+    @pytest.mark.asyncio
+    async def test_restore_keeps_seqs_written_since(self, shards):
+        pending = await _save(shards)
+        await archive(shards, datetime.now(timezone.utc))
+        shard = shards.for_user(pending.chat.user_id)
+        # e.g. reconciling a stale cache writes the first message again
+        await ChatWriter(shard.sessions).write(
+            PendingChat(pending.chat, {1: pending.messages[1]})
+        )
+        async with shard.read_sessions() as session:
+            row = await session.get(ChatSession, uuid.UUID(pending.chat.id))
+
+        assert await archive_module.restore(shard, row) == 5
+        assert await _message_count(shard, pending.chat.id) == 6
+
+    @pytest.mark.asyncio
+    async def test_load_survives_bad_archive(self, shards):
+        pending = await _save(shards)
+        await archive(shards, datetime.now(timezone.utc))
+        segment = archive_module.segment_path(1)
+        segment.write_bytes(segment.read_bytes()[:-1] + b"!")
+        redis = MemoryBackend()
+        chat_service._chats.clear()
+
+        with (
+            patch("frank.services.chat.shards", shards),
+            patch("frank.services.chat.get_redis", return_value=redis),
+        ):
+            chat = await load_chat(pending.chat.id, user_id=pending.chat.user_id)
+
+        # what's left in the DB, with the archive kept for another try
+        assert len(chat.history) == 0
+        assert chat.last_seq == chat.history_offset == 6
+        shard = shards.for_user(pending.chat.user_id)
+        async with shard.read_sessions() as session:
+            row = await session.get(ChatSession, uuid.UUID(pending.chat.id))
+        assert row.archive_segment == 1
+
+    @pytest.mark.asyncio
+    async def test_skips_chat_saved_since_read(self, shards):
+        pending = await _save(shards)
+        shard = shards.for_user(pending.chat.user_id)
+        chat_id = uuid.UUID(pending.chat.id)
+        writer, progress = SegmentWriter(), Progress()
+        # as if it had 4 messages when picked and 6 by the time it was marked
+        await _archive_batch(shard, {chat_id: 4}, writer, progress)
+        writer.close()
+
+        assert progress.chats == 0
+        assert await _message_count(shard, pending.chat.id) == 6
+        async with shard.read_sessions() as session:
+            row = await session.get(ChatSession, chat_id)
+        assert row.archive_segment is None
+
+    def test_segments_roll_over_and_check_records(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(settings, "ARCHIVE_DIR", str(tmp_path))
+        monkeypatch.setattr(settings, "ARCHIVE_SEGMENT_BYTES", 150)
+        writer, reader = SegmentWriter(), SegmentReader()
+        chat_ids = [uuid.uuid4() for _ in range(3)]
+        located = [writer.append(i, b"x" * 80) for i in chat_ids]
+        writer.sync()
+        assert [segment for segment, _, _ in located] == [1, 1, 2]
+        assert reader.read(chat_ids[1], *located[1]) == b"x" * 80
+        assert reader.read(chat_ids[2], *located[2]) == b"x" * 80
+
+        # appended to after it was mapped
+        more = writer.append(chat_ids[0], b"y" * 10)
+        writer.close()
+        assert more[0] == 2
+        assert reader.read(chat_ids[0], *more) == b"y" * 10
+
+        with pytest.raises(ValueError):
+            reader.read(chat_ids[0], *located[1])
+        reader.close()
+
+    def test_one_writer_at_a_time(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(settings, "ARCHIVE_DIR", str(tmp_path))
+        writer = SegmentWriter()
+        with pytest.raises(RuntimeError):
+            SegmentWriter()
+        writer.close()
+        SegmentWriter().close()
@@ -0,0 +1,152 @@
+"""Tests for the cache backends behind get_redis()."""
+
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from frank.core.redis import (
+    CacheUnavailable,
+    CircuitBreaker,
+    GuardedBackend,
+    MemoryBackend,
+    UpstashBackend,
+)
+
+_INCR_BY = """
+return redis.call("incrby", KEYS[1], ARGV[1])
+"""
+
+
+class TestMemoryBackend:
+    """The in-process backend behaves like Redis, scripts included."""
+
+    @pytest.mark.asyncio
+    async def test_commands(self):
+        cache = MemoryBackend()
+        assert await cache.set("k", "v", nx=True, ex=10)
+        assert not await cache.set("k", "other", nx=True, ex=10)
+        assert await cache.get("k") == "v"
+        await cache.setex("k", 10, "w")
+        assert await cache.get("k") == "w"
+        assert await cache.delete("k") == 1
+        assert await cache.get("k") is None
+
+    @pytest.mark.asyncio
+    async def test_scripts_and_pipeline(self):
+        cache = MemoryBackend()
+        assert await cache.eval(_INCR_BY, keys=["n"], args=["2"]) == 2
+
+        results = await (
+            cache.pipeline()
+            .setex("a", 10, "1")
+            .eval(_INCR_BY, keys=["n"], args=["3"])
+            .expire("n", 10)
+            .execute()
+        )
+        assert results == [True, 5, True]
+        assert await cache.client.ttl("n") == 10
+
+
+class TestUpstashBackend:
+    """Pipelines map onto one Upstash pipeline request."""
+
+    @pytest.mark.asyncio
+    async def test_pipeline_sends_one_request(self):
+        with patch("frank.core.redis.UpstashRedis") as client_cls:
+            pipe = MagicMock()
+            pipe.exec = AsyncMock(return_value=["OK", 1])
+            client_cls.return_value.pipeline.return_value = pipe
+            cache = UpstashBackend(url="https://fake.upstash.io", token="t")
+
+            results = await (
+                cache.pipeline()
+                .setex("a", 10, "1")
+                .eval(_INCR_BY, keys=["n"], args=["3"])
+                .execute()
+            )
+
+        assert results == ["OK", 1]
+        pipe.setex.assert_called_once_with("a", 10, "1")
+        pipe.eval.assert_called_once_with(_INCR_BY, keys=["n"], args=["3"])
+        pipe.exec.assert_awaited_once()
+
+
+class HangingBackend(MemoryBackend):
+    """Every get hangs until `hang` is cleared"""
+
+    def __init__(self):
+        super().__init__()
+        self.hang = True
+        self.calls = 0
+
+    async def get(self, key: str):
+        self.calls += 1
+        if self.hang:
+            await asyncio.Event().wait()
+        return await super().get(key)
+
+
+def _guarded(backend, reset_s: float = 60) -> GuardedBackend:
+    return GuardedBackend(
+        backend, timeout_ms=10, breaker=CircuitBreaker(failures=2, reset_s=reset_s)
+    )
+
+
+class TestCircuitBreaker:
+    """Slow calls time out, and a failing cache stops being called."""
+
+    @pytest.mark.asyncio
+    async def test_times_out_then_opens(self):
+        backend = HangingBackend()
+        cache = _guarded(backend)
+        for _ in range(2):
+            with pytest.raises(CacheUnavailable):
+                await cache.get("k")
+        assert cache.breaker.state == "open"
+
+        # skipped without touching the backend
+        with pytest.raises(CacheUnavailable):
+            await cache.get("k")
+        assert backend.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_half_open_probe_closes(self):
+        backend = HangingBackend()
+        cache = _guarded(backend, reset_s=0.01)
+        for _ in range(2):
+            with pytest.raises(CacheUnavailable):
+                await cache.get("k")
+
+        await asyncio.sleep(0.02)
+        backend.hang = False
+        assert await cache.get("k") is None
+        assert cache.breaker.state == "closed"
+
+    @pytest.mark.asyncio
+    async def test_failed_probe_reopens(self):
+        cache = _guarded(HangingBackend(), reset_s=0.01)
+        for _ in range(2):
+            with pytest.raises(CacheUnavailable):
+                await cache.get("k")
+
+        await asyncio.sleep(0.02)
+        assert cache.breaker.allow()
+        # only one probe at a time
+        assert not cache.breaker.allow()
+        cache.breaker.record_failure()
+        assert cache.breaker.state == "open"
+
+    @pytest.mark.asyncio
+    async def test_load_chat_falls_back_to_db(self):
+        from frank.schemas import Chat
+        from frank.services.chat import load_chat
+
+        chat = Chat(id="c", userId="u")
+        cache = _guarded(HangingBackend())
+        cache.backend.eval = AsyncMock(side_effect=asyncio.Event().wait)
+        with (
+            patch("frank.services.chat.get_redis", return_value=cache),
+            patch("frank.services.chat._fetch_chat", AsyncMock(return_value=chat)),
+            patch("frank.services.chat.borrow_session"),
+        ):
+            loaded = await asyncio.wait_for(load_chat("c", fresh=True), 1)
+        assert loaded.id == "c"
@@ -0,0 +1,272 @@
+"""Tests for chat caching: the in-process cache and the Redis layout."""
+
+import asyncio
+import pytest
+import pytest_asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+from frank.core.db import Base
+from frank.core.redis import MemoryBackend
+from frank.services import chat as chat_service
+from frank.services.chat import HISTORY_LENGTH, load_chat, make_user_chat, save_chat
+from tests.conftest import make_chat, turn
+
+
+class RecordingBackend(MemoryBackend):
+    """In-process cache that records the args of every script it runs"""
+
+    def __init__(self):
+        super().__init__()
+        self.evals: list[list[str]] = []
+
+    async def eval(self, script: str, keys: list[str], args: list[str]):
+        self.evals.append(args)
+        return await super().eval(script, keys, args)
+
+
+@pytest.fixture(autouse=True)
+def local_cache():
+    chat_service._chats.clear()
+    yield chat_service._chats
+    chat_service._chats.clear()
+
+
+@pytest.fixture
+def redis():
+    backend = RecordingBackend()
+    with patch("frank.services.chat.get_redis", return_value=backend):
+        yield backend
+
+
+@pytest_asyncio.fixture
+async def session():
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        yield session
+    await engine.dispose()
+
+
+class TestCacheLayout:
+    """Saves push only new messages; loads read them back."""
+
+    @pytest.mark.asyncio
+    async def test_round_trip(self, redis, session):
+        chat = make_chat()
+        chat.history = turn(0) + turn(1)
+        await save_chat(chat, session)
+
+        loaded = await load_chat(chat.id)
+        assert loaded.title == "Chat"
+        assert loaded.last_seq == 4
+        assert loaded.history_offset == 0
+        assert [m.parts[0].content for m in loaded.history] == [
+            "question 0",
+            "answer 0",
+            "question 1",
+            "answer 1",
+        ]
+
+    @pytest.mark.asyncio
+    async def test_save_pushes_only_new_messages(self, redis, session):
+        chat = make_chat()
+        sizes = []
+        for i in range(5):
+            chat.history.extend(turn(i))
+            await save_chat(chat, session)
+            sizes.append(len(redis.evals[-1]))
+
+        # same metadata and two messages every turn, however long the chat
+        assert len(set(sizes[1:])) == 1
+        assert await redis.client.llen(chat_service._history_key(chat.id)) == 10
+
+    @pytest.mark.asyncio
+    async def test_rewrites_missing_cache(self, redis, session):
+        chat = make_chat()
+        chat.history = turn(0)
+        await save_chat(chat, session)
+        await redis.client.flushall()
+
+        chat.history.extend(turn(1))
+        await save_chat(chat, session)
+        loaded = await load_chat(chat.id)
+        assert len(loaded.history) == 4
+
+    @pytest.mark.asyncio
+    @patch("frank.services.chat.shards.session")
+    @patch("frank.services.chat.httpx.AsyncClient")
+    async def test_title_updates_only_metadata(
+        self, mock_client_cls, mock_session_local, redis, session
+    ):
+        chat = make_chat()
+        chat.title = None
+        chat.history = turn(0)
+        await save_chat(chat, session)
+
+        mock_resp = MagicMock()
+        mock_resp.json.return_value = {"choices": [{"message": {"content": "Hi"}}]}
+        mock_client = AsyncMock()
+        mock_client.post.return_value = mock_resp
+        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
+        mock_client.__aexit__ = AsyncMock(return_value=False)
+        mock_client_cls.return_value = mock_client
+        mock_session_local.return_value = session
+        await chat_service.generate_and_set_title(chat, AsyncMock())
+
+        assert redis.evals[-1] == ["title", '"Hi"']
+        assert (await load_chat(chat.id)).title == "Hi"
+
+
+class TestHistoryWindow:
+    """Only the last HISTORY_LENGTH messages are loaded and kept."""
+
+    @pytest.mark.asyncio
+    async def test_load_reads_window(self, redis, session):
+        chat = make_chat()
+        for i in range(HISTORY_LENGTH // 2 + 5):
+            chat.history.extend(turn(i))
+        await save_chat(chat, session)
+
+        loaded = await load_chat(chat.id)
+        assert len(loaded.history) == HISTORY_LENGTH
+        assert loaded.history_offset == 10
+        assert loaded.history[0].parts[0].content == "question 5"
+
+    @pytest.mark.asyncio
+    async def test_saves_after_window_is_full(self, redis, session):
+        chat = make_chat()
+        for i in range(HISTORY_LENGTH // 2 + 5):
+            chat.history.extend(turn(i))
+        await save_chat(chat, session)
+
+        loaded = await load_chat(chat.id)
+        loaded.history.extend(turn(99))
+        await save_chat(loaded, session)
+        assert loaded.last_seq == HISTORY_LENGTH + 12
+
+        await redis.client.flushall()
+        reloaded = await load_chat(chat.id, session)
+        assert reloaded.history[-1].parts[0].content == "answer 99"
+
+    @pytest.mark.asyncio
+    async def test_db_load_reads_window(self, redis, session):
+        chat = make_chat()
+        for i in range(HISTORY_LENGTH // 2 + 5):
+            chat.history.extend(turn(i))
+        await save_chat(chat, session)
+        await redis.client.flushall()
+
+        loaded = await load_chat(chat.id, session, fresh=True)
+        assert len(loaded.history) == HISTORY_LENGTH
+        assert (loaded.last_seq, loaded.history_offset) == (HISTORY_LENGTH + 10, 10)
+        assert loaded.history[0].parts[0].content == "question 5"
+
+        full = await chat_service._fetch_chat(session, chat.id, window=None)
+        assert len(full.history) == HISTORY_LENGTH + 10
+        assert full.history_offset == 0
+
+
+class TestLocalCache:
+    """Loads are served in process and concurrent misses share one load."""
+
+    @pytest.mark.asyncio
+    async def test_hit_skips_redis(self, redis, session):
+        chat = make_chat()
+        chat.history = turn(0)
+        await save_chat(chat, session)
+        first = await load_chat(chat.id)
+        reads = len(redis.evals)
+
+        first.history.extend(turn(1))
+        second = await load_chat(chat.id)
+        assert len(redis.evals) == reads
+        # callers get their own copy
+        assert len(second.history) == 2
+
+    @pytest.mark.asyncio
+    async def test_save_invalidates(self, redis, session, local_cache):
+        chat = make_chat()
+        await save_chat(chat, session)
+        await load_chat(chat.id)
+        assert chat.id in local_cache
+
+        chat.title = "Renamed"
+        await save_chat(chat, session)
+        assert chat.id not in local_cache
+        assert (await load_chat(chat.id)).title == "Renamed"
+
+    @pytest.mark.asyncio
+    async def test_fresh_skips_local_cache(self, redis, session):
+        chat = make_chat()
+        await save_chat(chat, session)
+        await load_chat(chat.id)
+        reads = len(redis.evals)
+
+        await load_chat(chat.id, fresh=True)
+        assert len(redis.evals) == reads + 1
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_coalesce(self, redis):
+        chat = make_chat()
+
+        async def _slow_fetch(session, chat_id):
+            await asyncio.sleep(0.01)
+            return chat
+
+        with (
+            patch("frank.services.chat._fetch_chat", side_effect=_slow_fetch) as fetch,
+            patch("frank.services.chat.borrow_session"),
+        ):
+            loaded = await asyncio.gather(*(load_chat(chat.id) for _ in range(5)))
+
+        fetch.assert_awaited_once()
+        assert {c.id for c in loaded} == {chat.id}
+        assert len({id(c) for c in loaded}) == 5
+
+    @pytest.mark.asyncio
+    async def test_waiter_retries_failed_load(self, redis):
+        chat = make_chat()
+        calls = 0
+
+        async def _flaky_fetch(session, chat_id):
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            if calls == 1:
+                raise RuntimeError("db down")
+            return chat
+
+        with (
+            patch("frank.services.chat._fetch_chat", side_effect=_flaky_fetch),
+            patch("frank.services.chat.borrow_session"),
+        ):
+            first, second = await asyncio.gather(
+                load_chat(chat.id), load_chat(chat.id), return_exceptions=True
+            )
+
+        assert isinstance(first, RuntimeError)
+        assert second.id == chat.id
+
+
+class TestLazyLoad:
+    """Loading a chat doesn't decode its history unless it is used."""
+
+    @pytest.mark.asyncio
+    async def test_cache_load_stays_raw(self, redis, session):
+        chat = make_chat()
+        for i in range(4):
+            chat.history.extend(turn(i))
+        await save_chat(chat, session)
+
+        loaded = await load_chat(chat.id, session, fresh=True)
+        assert loaded.history.pending == 8
+
+        user_chat = make_user_chat(loaded)
+        assert [e.content for e in user_chat.history[:2]] == [
+            "question 0",
+            "answer 0",
+        ]
+        assert loaded.history.pending == 8
+        assert loaded.history == chat.history
@@ -5,7 +5,7 @@ import uuid
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 from pydantic_ai.messages import ModelRequest, ModelResponse, UserPromptPart, TextPart
-from frank.schemas import Chat
+from frank.schemas import Chat, ChatTitleEvent
 from frank.services.chat import generate_and_set_title, TITLE_MODEL
 
 
@@ -27,13 +27,13 @@ class TestTitleExtraction:
 
     @pytest.mark.asyncio
     @patch("frank.services.chat.get_redis")
-    @patch("frank.services.chat.SessionLocal")
+    @patch("frank.services.chat.shards.session")
     @patch("frank.services.chat.httpx.AsyncClient")
     async def test_extracts_messages_and_calls_api(
         self, mock_client_cls, mock_session_local, mock_redis
     ):
         chat = _make_chat_with_history("How do I cook pasta?", "Boil water first.")
-        ws = AsyncMock()
+        notify = AsyncMock()
 
         # mock httpx response
         mock_resp = MagicMock()
@@ -61,7 +61,7 @@ class TestTitleExtraction:
         mock_redis_inst.get.return_value = None
         mock_redis.return_value = mock_redis_inst
 
-        await generate_and_set_title(chat, ws)
+        await generate_and_set_title(chat, notify)
 
         # verify API was called with correct model and prompt
         call_kwargs = mock_client.post.call_args
@@ -73,13 +73,13 @@ class TestTitleExtraction:
 
     @pytest.mark.asyncio
     @patch("frank.services.chat.get_redis")
-    @patch("frank.services.chat.SessionLocal")
+    @patch("frank.services.chat.shards.session")
     @patch("frank.services.chat.httpx.AsyncClient")
     async def test_sets_title_on_chat_and_db(
         self, mock_client_cls, mock_session_local, mock_redis
     ):
         chat = _make_chat_with_history("Hello", "Hi there!")
-        ws = AsyncMock()
+        notify = AsyncMock()
 
         mock_resp = MagicMock()
         mock_resp.raise_for_status = MagicMock()
@@ -103,7 +103,7 @@ class TestTitleExtraction:
         mock_redis_inst.get.return_value = None
         mock_redis.return_value = mock_redis_inst
 
-        await generate_and_set_title(chat, ws)
+        await generate_and_set_title(chat, notify)
 
         # title should be stripped of quotes
         assert chat.title == "Greeting Exchange"
@@ -113,13 +113,13 @@ class TestTitleExtraction:
 
     @pytest.mark.asyncio
     @patch("frank.services.chat.get_redis")
-    @patch("frank.services.chat.SessionLocal")
+    @patch("frank.services.chat.shards.session")
     @patch("frank.services.chat.httpx.AsyncClient")
     async def test_sends_title_event_to_websocket(
         self, mock_client_cls, mock_session_local, mock_redis
     ):
         chat = _make_chat_with_history("What is AI?", "Artificial intelligence is...")
-        ws = AsyncMock()
+        notify = AsyncMock()
 
         mock_resp = MagicMock()
         mock_resp.raise_for_status = MagicMock()
@@ -142,14 +142,14 @@ class TestTitleExtraction:
         mock_redis_inst.get.return_value = None
         mock_redis.return_value = mock_redis_inst
 
-        await generate_and_set_title(chat, ws)
+        await generate_and_set_title(chat, notify)
 
-        # verify websocket received the title event
-        ws.send_json.assert_awaited_once()
-        sent = ws.send_json.call_args[0][0]
-        assert sent["type"] == "chat_title"
-        assert sent["chatId"] == chat.id
-        assert sent["title"] == "Understanding AI"
+        # verify the title event was pushed to the client
+        notify.assert_awaited_once()
+        sent = notify.call_args[0][0]
+        assert isinstance(sent, ChatTitleEvent)
+        assert sent.chat_id == chat.id
+        assert sent.title == "Understanding AI"
 
     @pytest.mark.asyncio
     async def test_skips_when_no_user_message(self):
@@ -159,22 +159,22 @@ class TestTitleExtraction:
             title=None,
             history=[],
         )
-        ws = AsyncMock()
+        notify = AsyncMock()
 
-        await generate_and_set_title(chat, ws)
+        await generate_and_set_title(chat, notify)
 
         # should not have sent anything
-        ws.send_json.assert_not_awaited()
+        notify.assert_not_awaited()
 
     @pytest.mark.asyncio
     @patch("frank.services.chat.get_redis")
-    @patch("frank.services.chat.SessionLocal")
+    @patch("frank.services.chat.shards.session")
     @patch("frank.services.chat.httpx.AsyncClient")
     async def test_does_not_raise_on_api_error(
         self, mock_client_cls, mock_session_local, mock_redis
     ):
         chat = _make_chat_with_history("Hello", "Hi")
-        ws = AsyncMock()
+        notify = AsyncMock()
 
         mock_resp = MagicMock()
         mock_resp.status_code = 500
@@ -186,18 +186,18 @@ class TestTitleExtraction:
         mock_client_cls.return_value = mock_client
 
         # should not raise — errors are caught and logged
-        await generate_and_set_title(chat, ws)
-        ws.send_json.assert_not_awaited()
+        await generate_and_set_title(chat, notify)
+        notify.assert_not_awaited()
 
     @pytest.mark.asyncio
     @patch("frank.services.chat.get_redis")
-    @patch("frank.services.chat.SessionLocal")
+    @patch("frank.services.chat.shards.session")
     @patch("frank.services.chat.httpx.AsyncClient")
     async def test_updates_redis_cache(
         self, mock_client_cls, mock_session_local, mock_redis
     ):
         chat = _make_chat_with_history("Test", "Response")
-        ws = AsyncMock()
+        notify = AsyncMock()
 
         mock_resp = MagicMock()
         mock_resp.raise_for_status = MagicMock()
@@ -216,19 +216,16 @@ class TestTitleExtraction:
         mock_session.__aexit__ = AsyncMock(return_value=False)
         mock_session_local.return_value = mock_session
 
-        cached_data = json.dumps({"title": None, "id": chat.id})
         mock_redis_inst = AsyncMock()
-        mock_redis_inst.get.return_value = cached_data
         mock_redis.return_value = mock_redis_inst
 
-        await generate_and_set_title(chat, ws)
+        await generate_and_set_title(chat, notify)
 
-        # redis should have been updated with new title
-        mock_redis_inst.setex.assert_awaited_once()
-        set_args = mock_redis_inst.setex.call_args[0]
-        assert set_args[0] == f"chat:{chat.id}"
-        cached = set_args[2]
-        assert cached["title"] == "Test Title"
+        # only the title field of the cached metadata is updated
+        mock_redis_inst.eval.assert_awaited_once()
+        kwargs = mock_redis_inst.eval.call_args.kwargs
+        assert kwargs["keys"] == [f"chat:{{{chat.id}}}:meta"]
+        assert kwargs["args"] == ["title", json.dumps("Test Title")]
 
 
 class TestTitleTrigger:
@@ -243,19 +240,16 @@ class TestTitleTrigger:
 
         ws = AsyncMock()
         user = AuthUserOut(id=str(uuid.uuid4()))
-        handler = ChatWebSocketHandler(ws, user, AsyncMock())
+        handler = ChatWebSocketHandler(ws, user)
 
         chat = Chat(id=str(uuid.uuid4()), userId=handler.user.id, title=None)
         query = AgentQuery(prompt="hi", model="test")
-        result = MagicMock()
-        result.new_messages.return_value = []
-
-        await handler.handle_agent_done(query, result, chat)
+        await handler.handle_agent_done(query, [], chat)
 
         mock_save.assert_awaited_once()
         # asyncio.create_task wraps the coroutine, so generate_and_set_title
         # should have been called
-        mock_gen_title.assert_called_once_with(chat, ws)
+        mock_gen_title.assert_called_once_with(chat, handler.send_to_user)
 
     @pytest.mark.asyncio
     @patch("frank.ws.generate_and_set_title")
@@ -266,7 +260,7 @@ class TestTitleTrigger:
 
         ws = AsyncMock()
         user = AuthUserOut(id=str(uuid.uuid4()))
-        handler = ChatWebSocketHandler(ws, user, AsyncMock())
+        handler = ChatWebSocketHandler(ws, user)
 
         chat = Chat(
             id=str(uuid.uuid4()),
@@ -274,9 +268,6 @@ class TestTitleTrigger:
             title="Already titled",
         )
         query = AgentQuery(prompt="hi", model="test")
-        result = MagicMock()
-        result.new_messages.return_value = []
-
-        await handler.handle_agent_done(query, result, chat)
+        await handler.handle_agent_done(query, [], chat)
 
         mock_gen_title.assert_not_called()
@@ -0,0 +1,125 @@
+"""Tests for the websocket event codec."""
+
+import json
+import uuid
+import msgpack
+import pytest
+import pydantic
+from unittest.mock import AsyncMock
+from frank.codec import (
+    JSON_CODEC,
+    MSGPACK_CODEC,
+    decode_event,
+    encode_event,
+    negotiate_codec,
+)
+from frank.schemas import (
+    AuthUserOut,
+    ChatModel,
+    InitializeAckEvent,
+    NewChatEvent,
+    ReplyEvent,
+    SendEvent,
+)
+
+
+class TestDecodeEvent:
+    """decode_event validates raw frames straight into the ChatEvent union."""
+
+    def test_decodes_text_frame(self):
+        raw = '{"type": "send", "chatId": "abc", "message": "hi", "model": null}'
+        event = decode_event(raw)
+        assert isinstance(event, SendEvent)
+        assert event.chat_id == "abc"
+
+    def test_decodes_bytes_frame(self):
+        raw = b'{"type": "new_chat", "message": "hi", "model": null}'
+        assert isinstance(decode_event(raw), NewChatEvent)
+
+    def test_rejects_invalid_json(self):
+        with pytest.raises(pydantic.ValidationError):
+            decode_event("{not json")
+
+    def test_rejects_unknown_type(self):
+        with pytest.raises(pydantic.ValidationError):
+            decode_event('{"type": "nope"}')
+
+
+class TestEncodeEvent:
+    """encode_event matches the previous model_dump(by_alias, mode=json) output."""
+
+    @pytest.mark.parametrize(
+        "event",
+        [
+            ReplyEvent(text="hello", done=False),
+            InitializeAckEvent(
+                chatId="abc", models=[ChatModel(id="m", label="M", isDefault=True)]
+            ),
+        ],
+    )
+    def test_matches_model_dump(self, event):
+        encoded = encode_event(event)
+        assert isinstance(encoded, bytes)
+        assert json.loads(encoded) == event.model_dump(by_alias=True, mode="json")
+
+    def test_round_trip(self):
+        event = SendEvent(chatId="abc", message="hi", model=None)
+        assert decode_event(encode_event(event)) == event
+
+
+class TestMsgpackCodec:
+    """The msgpack codec carries the same events in binary frames."""
+
+    def test_round_trip(self):
+        event = InitializeAckEvent(
+            chatId="abc", models=[ChatModel(id="m", label="M", isDefault=True)]
+        )
+        data = MSGPACK_CODEC.encode(event)
+        assert msgpack.unpackb(data)["models"][0]["isDefault"] is True
+        assert MSGPACK_CODEC.decode(data) == event
+
+    def test_smaller_than_json(self):
+        event = ReplyEvent(text="hello world", done=False)
+        assert len(MSGPACK_CODEC.encode(event)) < len(JSON_CODEC.encode(event))
+
+    def test_rejects_garbage(self):
+        with pytest.raises(pydantic.ValidationError):
+            MSGPACK_CODEC.decode(b"\xc1")
+
+
+class TestNegotiation:
+    """Clients opt into binary frames through websocket subprotocols."""
+
+    def test_defaults_to_json_without_subprotocol(self):
+        assert negotiate_codec([]) == (JSON_CODEC, None)
+
+    def test_ignores_unknown_subprotocols(self):
+        assert negotiate_codec(["graphql-ws"]) == (JSON_CODEC, None)
+
+    def test_picks_first_supported(self):
+        codec, subprotocol = negotiate_codec(["x", "frank.msgpack.v1", "frank.json.v1"])
+        assert codec is MSGPACK_CODEC
+        assert subprotocol == "frank.msgpack.v1"
+
+    @pytest.mark.asyncio
+    async def test_handler_accepts_and_sends_binary(self):
+        from frank.ws import ChatWebSocketHandler
+
+        ws = AsyncMock()
+        ws.scope = {"subprotocols": ["frank.msgpack.v1"]}
+        frame = MSGPACK_CODEC.encode(NewChatEvent(message="hi"))
+        ws.receive.side_effect = [
+            {"type": "websocket.receive", "bytes": frame},
+            {"type": "websocket.disconnect", "code": 1000},
+        ]
+        handler = ChatWebSocketHandler(ws, AuthUserOut(id=str(uuid.uuid4())))
+        handler.handle_new_chat = AsyncMock()
+
+        await handler.run()
+
+        ws.accept.assert_awaited_once_with(subprotocol="frank.msgpack.v1")
+        assert isinstance(handler.handle_new_chat.call_args[0][0], NewChatEvent)
+
+        await handler.write_event(ReplyEvent(text="hi"))
+        ws.send_bytes.assert_awaited_once()
+        assert msgpack.unpackb(ws.send_bytes.call_args[0][0])["text"] == "hi"
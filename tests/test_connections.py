@@ -0,0 +1,148 @@
+"""Tests for websocket heartbeats and the stale-connection reaper."""
+
+import asyncio
+import json
+import time
+import pytest
+from unittest.mock import AsyncMock, patch
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart, UserPromptPart
+from frank import connections
+from frank.core.config import settings
+from frank.schemas import PingEvent, PongEvent, SendEvent
+from tests.conftest import frame, make_chat, make_handler
+
+
+@pytest.fixture
+def handler():
+    handler = make_handler()
+    handler.chat = make_chat(handler.user.id)
+    return handler
+
+
+async def _start(handler, frames=()):
+    """Run the handler on a socket that sends `frames`, then goes silent"""
+
+    async def _receive():
+        for message in frames:
+            yield message
+        await asyncio.Event().wait()
+
+    received = _receive()
+    handler.ws.receive = lambda: anext(received)
+    task = asyncio.create_task(handler.run())
+    await asyncio.sleep(0.01)
+    return task
+
+
+class TestHeartbeat:
+    """Pings are answered and don't count as user activity."""
+
+    @pytest.mark.asyncio
+    async def test_answers_ping_with_pong(self, handler):
+        handler.chat = None
+        activity = handler.last_activity
+        task = await _start(handler, [frame(PingEvent()), frame(PongEvent())])
+
+        await handler.outbox.drain()
+        sent = [json.loads(c.args[0]) for c in handler.ws.send_text.await_args_list]
+        assert [f["type"] for f in sent] == ["pong"]
+        assert handler.last_activity == activity
+        assert handler.last_seen > activity
+
+        await handler.reap("test")
+        await task
+
+    @pytest.mark.asyncio
+    async def test_reaper_pings_when_due(self, handler, monkeypatch):
+        monkeypatch.setattr(settings, "WS_PING_INTERVAL_S", 10)
+        task = await _start(handler)
+
+        await connections.reap_once(time.monotonic() + 11)
+        await handler.outbox.drain()
+        sent = handler.ws.send_text.call_args[0][0]
+        assert json.loads(sent)["type"] == "ping"
+
+        await handler.reap("test")
+        await task
+
+
+class TestReaper:
+    """Dead and idle connections are closed and let go of their state."""
+
+    @pytest.mark.asyncio
+    async def test_reaps_dead_connection(self, handler):
+        task = await _start(handler)
+        assert handler in connections.connections()
+
+        later = time.monotonic() + settings.WS_DEAD_TIMEOUT_S + 1
+        assert await connections.reap_once(later) == 1
+        await asyncio.wait_for(task, 1)
+
+        handler.ws.close.assert_awaited_once_with(code=1001, reason="dead")
+        assert handler not in connections.connections()
+        assert handler.chat is None
+        assert not task.cancelled()
+
+    @pytest.mark.asyncio
+    async def test_reaps_idle_connection(self, handler, monkeypatch):
+        monkeypatch.setattr(settings, "WS_IDLE_TIMEOUT_S", 600)
+        task = await _start(handler)
+
+        # still answering pings, but nobody has used it for a while
+        handler.last_seen = time.monotonic() + 601
+        assert await connections.reap_once(time.monotonic() + 601) == 1
+        await asyncio.wait_for(task, 1)
+        handler.ws.close.assert_awaited_once_with(code=4000, reason="idle")
+
+    @pytest.mark.asyncio
+    async def test_keeps_streaming_connection(self, handler, monkeypatch):
+        monkeypatch.setattr(settings, "WS_IDLE_TIMEOUT_S", 600)
+        task = await _start(handler)
+        handler.reply_task = asyncio.create_task(asyncio.sleep(10))
+
+        handler.last_seen = time.monotonic() + 601
+        assert await connections.reap_once(time.monotonic() + 601) == 0
+
+        handler.reply_task.cancel()
+        await handler.reap("test")
+        await task
+
+    @pytest.mark.asyncio
+    async def test_evicts_idle_history(self, handler, monkeypatch):
+        monkeypatch.setattr(settings, "WS_EVICT_AFTER_S", 120)
+        chat = handler.chat
+        chat.history = [
+            ModelRequest(parts=[UserPromptPart(content="hi")]),
+            ModelResponse(parts=[TextPart(content="hello")]),
+        ]
+        task = await _start(handler)
+
+        # not idle for long enough yet
+        handler.last_seen = time.monotonic() + 61
+        await connections.reap_once(time.monotonic() + 61)
+        assert handler.chat is chat
+        assert handler.resident_bytes() > 0
+
+        handler.last_seen = time.monotonic() + 121
+        assert await connections.reap_once(time.monotonic() + 121) == 0
+        assert handler.chat.id == chat.id
+        assert handler.chat.title == "Chat"
+        assert len(handler.chat.history) == 0
+        assert handler.chat.history_offset == 2
+        assert handler.resident_bytes() == 0
+        # the original is left alone for anyone sharing it
+        assert len(chat.history) == 2
+
+        # the next send loads the history back
+        with (
+            patch("frank.ws.load_chat", AsyncMock(return_value=chat)) as load,
+            patch.object(handler, "start_reply", AsyncMock()),
+        ):
+            await handler.handle_send(
+                SendEvent(chatId=chat.id, message="again", model=None)
+            )
+        load.assert_awaited_once_with(chat.id, fresh=True, user_id=handler.user.id)
+        assert handler.chat is chat
+
+        await handler.reap("test")
+        await task
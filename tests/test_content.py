@@ -0,0 +1,112 @@
+"""Tests for the stored message content codecs."""
+
+import uuid
+import pytest
+import pytest_asyncio
+from sqlalchemy import insert, select
+from frank.core.config import settings
+from frank.core.db import Base
+from frank.core.shards import Shards, shard_urls
+from frank.db.content import decode_body, decode_row, encode_body, migrate
+from frank.db.models import ChatMessage, ChatRole, ChatSession
+from frank.history import History
+from frank.schemas import Chat
+from frank.services.chat import _fetch_chat
+from frank.services.persistence import PendingChat, write_chats
+from tests.conftest import turn
+
+
+@pytest_asyncio.fixture
+async def shards(tmp_path):
+    shards = Shards.connect(
+        shard_urls(2, f"sqlite+aiosqlite:///{tmp_path}/chats-{{shard}}.db")
+    )
+    for shard in shards:
+        async with shard.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    yield shards
+    await shards.dispose()
+
+
+def _messages(turns: int) -> list[dict]:
+    return list(History([m for i in range(turns) for m in turn(i)]).python_items())
+
+
+async def _save(shard, codec: str, messages: list[dict], monkeypatch) -> str:
+    monkeypatch.setattr(settings, "CONTENT_CODEC", codec)
+    chat = Chat(id=str(uuid.uuid4()), userId=str(uuid.uuid4()), lastSeq=4)
+    async with shard.sessions() as session:
+        await write_chats(session, [PendingChat(chat, dict(enumerate(messages, 1)))])
+    return chat.id
+
+
+class TestContentCodec:
+    """Messages are stored compressed and read back from either column."""
+
+    def test_round_trip(self):
+        messages = _messages(3)
+        body = encode_body(messages)
+        assert body[0] == 1
+        assert decode_body(body) == messages
+        assert decode_row(None, body) == messages
+        assert decode_row(messages, None) == messages
+
+    def test_unknown_version(self):
+        with pytest.raises(ValueError):
+            decode_body(b"\x7f" + encode_body(_messages(1))[1:])
+
+    @pytest.mark.asyncio
+    async def test_reads_json_and_zstd_rows(self, shards, monkeypatch):
+        shard, messages = shards[0], _messages(2)
+        json_id = await _save(shard, "json", messages, monkeypatch)
+        zstd_id = await _save(shard, "zstd", messages, monkeypatch)
+
+        async with shard.read_sessions() as session:
+            rows = {
+                str(row.chat_id): row
+                for row in await session.execute(
+                    select(ChatMessage.chat_id, ChatMessage.content, ChatMessage.body)
+                )
+            }
+            assert rows[json_id].body is None and rows[json_id].content
+            assert rows[zstd_id].content is None and rows[zstd_id].body
+            chats = [await _fetch_chat(session, i) for i in (json_id, zstd_id)]
+        for chat in chats:
+            assert list(chat.history.python_items()) == messages
+            assert chat.history.messages() == History(messages).messages()
+
+    @pytest.mark.asyncio
+    async def test_migrate_rewrites_json_rows(self, shards, monkeypatch):
+        chat_ids = [
+            await _save(shard, "json", _messages(2), monkeypatch) for shard in shards
+        ]
+        # a row from before the codec, with no body column set
+        async with shards[1].sessions() as session:
+            await session.execute(
+                insert(ChatMessage),
+                [
+                    {
+                        "chat_id": uuid.UUID(chat_ids[1]),
+                        "seq": 5,
+                        "role": ChatRole.USER.value,
+                        "content": _messages(3)[4:5],
+                    }
+                ],
+            )
+            row = await session.get(ChatSession, uuid.UUID(chat_ids[1]))
+            row.last_seq = 5
+            await session.commit()
+
+        monkeypatch.setattr(settings, "CONTENT_CODEC", "zstd")
+        assert await migrate(shards, batch=2, pause=0) == 9
+        assert await migrate(shards, batch=2, pause=0) == 0
+
+        for shard, chat_id in zip(shards, chat_ids):
+            async with shard.read_sessions() as session:
+                assert not (
+                    await session.scalars(
+                        select(ChatMessage.id).where(ChatMessage.body.is_(None))
+                    )
+                ).all()
+                chat = await _fetch_chat(session, chat_id)
+            assert len(chat.history) == chat.last_seq
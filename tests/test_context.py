@@ -0,0 +1,112 @@
+"""Tests for fitting prompt history to the model's budget and summarizing."""
+
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from pydantic_ai.messages import (
+    ModelRequest,
+    ModelResponse,
+    SystemPromptPart,
+    TextPart,
+    UserPromptPart,
+)
+from frank.prompts import SYSTEM_PROMPT
+from frank.schemas import AgentQuery, Chat
+from frank.services import context
+from frank.services.context import fit_context, maybe_summarize
+from tests.conftest import turn
+
+MODEL = "deepseek/deepseek-v3.2"
+
+
+def _chat(turns: int, chars: int = 40) -> Chat:
+    chat = Chat(id="c", userId="u")
+    first = ModelRequest(
+        parts=[
+            SystemPromptPart(content=SYSTEM_PROMPT),
+            UserPromptPart(content="question 0"),
+        ]
+    )
+    chat.history = [first, ModelResponse(parts=[TextPart(content="hi")])]
+    for i in range(1, turns):
+        chat.history.extend(turn(i, chars))
+    return chat
+
+
+def _query() -> AgentQuery:
+    return AgentQuery(prompt="next", model=MODEL)
+
+
+@pytest.fixture
+def budget():
+    with patch("frank.services.context.context_budget", return_value=4_000):
+        yield 4_000
+
+
+class TestFitContext:
+    """Only the newest unsummarized messages that fit are sent."""
+
+    @pytest.mark.asyncio
+    async def test_short_chat_unchanged(self, budget):
+        chat = _chat(3)
+        assert await fit_context(chat, _query()) == chat.history
+
+    @pytest.mark.asyncio
+    async def test_long_chat_gets_head(self, budget):
+        chat = _chat(40, chars=1_000)
+        chat.summary = "the user likes tea"
+        chat.summary_seq = 20
+
+        fitted = await fit_context(chat, _query())
+        head, window = fitted[0], fitted[1:]
+        assert [p.content for p in head.parts] == [
+            SYSTEM_PROMPT,
+            f"{context.SUMMARY_HEADER}\nthe user likes tea",
+        ]
+        assert window == chat.history[-len(window) :]
+        assert len(window) < len(chat.history) - 20
+        assert isinstance(window[0], ModelRequest)
+        assert sum(context.count_tokens(m) for m in window) <= budget
+
+    @pytest.mark.asyncio
+    async def test_skips_summarized_messages(self, budget):
+        chat = _chat(3)
+        chat.summary = "earlier"
+        chat.summary_seq = 2
+
+        fitted = await fit_context(chat, _query())
+        assert fitted[1:] == chat.history[2:]
+
+
+class TestSummarize:
+    """Summaries are refreshed in the background once history grows."""
+
+    @pytest.mark.asyncio
+    async def test_below_threshold_does_nothing(self, budget):
+        with patch.object(context.summary_agent, "run", AsyncMock()) as run:
+            maybe_summarize(_chat(3), MODEL)
+            await asyncio.sleep(0)
+        run.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_folds_in_older_messages(self, budget):
+        chat = _chat(40, chars=1_000)
+        result = MagicMock(output=" the user asked 20 questions ")
+        with (
+            patch.object(context.summary_agent, "run", AsyncMock(return_value=result)),
+            patch("frank.services.context.get_model"),
+            patch("frank.services.context.save_summary", AsyncMock()) as save,
+        ):
+            maybe_summarize(chat, MODEL)
+            # a second trigger while the first runs is ignored
+            maybe_summarize(chat, MODEL)
+            for _ in range(3):
+                await asyncio.sleep(0)
+
+        save.assert_awaited_once_with(chat)
+        assert chat.summary == "the user asked 20 questions"
+        # keeps about half the budget, starting on a request
+        kept = chat.history[chat.summary_seq :]
+        assert isinstance(kept[0], ModelRequest)
+        assert sum(context.count_tokens(m) for m in kept) <= budget // 2
+        assert "c" not in context._summarizing
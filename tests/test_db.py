@@ -0,0 +1,55 @@
+"""Tests for the single-writer SQLite engines."""
+
+import asyncio
+import pytest
+import pytest_asyncio
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from frank.core.config import settings
+from frank.core.db import Base, create_engines
+from frank.db.models import User
+
+
+@pytest_asyncio.fixture
+async def engines(tmp_path):
+    writer, reader = create_engines(f"sqlite+aiosqlite:///{tmp_path}/frank.db")
+    async with writer.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield writer, reader
+    await writer.dispose()
+    await reader.dispose()
+
+
+class TestSqliteEngines:
+    """Writes share one connection; reads get a read-only WAL pool."""
+
+    @pytest.mark.asyncio
+    async def test_writes_queue_for_one_connection(self, engines):
+        writer, reader = engines
+        assert writer.pool.size() == 1
+        sessions = async_sessionmaker(writer, expire_on_commit=False)
+
+        async def write():
+            async with sessions() as session:
+                session.add(User())
+                await session.commit()
+
+        await asyncio.gather(*(write() for _ in range(50)))
+        async with reader.connect() as conn:
+            assert await conn.scalar(select(func.count()).select_from(User)) == 50
+            assert await conn.scalar(text("PRAGMA journal_mode")) == "wal"
+
+    @pytest.mark.asyncio
+    async def test_reads_are_read_only(self, engines):
+        _, reader = engines
+        async with reader.connect() as conn:
+            with pytest.raises(OperationalError, match="readonly"):
+                await conn.execute(text("DELETE FROM users"))
+
+    def test_other_databases_share_an_engine(self, tmp_path, monkeypatch):
+        writer, reader = create_engines("sqlite+aiosqlite:///:memory:")
+        assert writer is reader
+        monkeypatch.setattr(settings, "SQLITE_SINGLE_WRITER", False)
+        writer, reader = create_engines(f"sqlite+aiosqlite:///{tmp_path}/frank.db")
+        assert writer is reader
@@ -0,0 +1,73 @@
+"""Tests for running history serialization off the event loop."""
+
+import asyncio
+import os
+import threading
+import pytest
+from unittest.mock import patch
+from frank.core import executor
+from frank.core.config import settings
+from frank.core.executor import monitor_loop, offload
+from frank.history import History, _message_adapter
+from tests.conftest import turn
+
+
+def _thread_name() -> str:
+    return threading.current_thread().name
+
+
+@pytest.fixture
+def thresholds(monkeypatch):
+    monkeypatch.setattr(settings, "SERIALIZE_OFFLOAD_BYTES", 1_000)
+    monkeypatch.setattr(settings, "SERIALIZE_PROCESS_BYTES", 0)
+
+
+class TestOffload:
+    """Payloads go inline, to threads or to processes by size."""
+
+    @pytest.mark.asyncio
+    async def test_small_runs_inline(self, thresholds):
+        assert await offload(_thread_name, size=999) == _thread_name()
+
+    @pytest.mark.asyncio
+    async def test_large_runs_in_thread(self, thresholds):
+        assert (await offload(_thread_name, size=1_000)).startswith("serialize")
+
+    @pytest.mark.asyncio
+    async def test_largest_can_run_in_process(self, thresholds, monkeypatch):
+        monkeypatch.setattr(settings, "SERIALIZE_PROCESS_BYTES", 5_000)
+        try:
+            assert await offload(os.getpid, size=4_999) == os.getpid()
+            assert await offload(os.getpid, size=5_000) != os.getpid()
+        finally:
+            executor._process_pool().shutdown()
+            executor._process_pool.cache_clear()
+
+    @pytest.mark.asyncio
+    async def test_history_decodes_offloaded(self, thresholds):
+        raw = [
+            _message_adapter.dump_json(msg).decode()
+            for i in range(20)
+            for msg in turn(i)
+        ]
+        history = History(raw)
+        assert history.size >= 1_000
+
+        messages = await history.decoded(4)
+        assert history.pending == 4
+        assert messages == History(raw[4:]).messages()
+        assert await history.dump_json() == raw
+
+
+class TestLoopMonitor:
+    """Loop lag is sampled while the monitor runs."""
+
+    @pytest.mark.asyncio
+    async def test_records_lag(self, monkeypatch):
+        monkeypatch.setattr(settings, "LOOP_LAG_INTERVAL_S", 0.001)
+        with patch.object(executor.metrics, "loop_lag") as lag:
+            task = asyncio.create_task(monitor_loop())
+            await asyncio.sleep(0.02)
+            task.cancel()
+        assert lag.record.call_count > 1
+        assert all(c.args[0] >= 0 for c in lag.record.call_args_list)
@@ -0,0 +1,63 @@
+"""Tests for History, which decodes chat messages only when they are read."""
+
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart, UserPromptPart
+from frank.history import History, _message_adapter
+from frank.schemas import Chat
+from tests.conftest import turn
+
+
+def _raw(turns: int) -> list[str]:
+    return [
+        _message_adapter.dump_json(msg).decode()
+        for i in range(turns)
+        for msg in turn(i)
+    ]
+
+
+class TestHistory:
+    """Raw messages stay raw until read, then are decoded once."""
+
+    def test_len_slice_and_append_dont_decode(self):
+        history = History(_raw(5))
+        history.extend(turn(5))
+        tail = history[-4:]
+        assert len(history) == 12
+        assert isinstance(tail, History) and len(tail) == 4
+        assert history.pending == 10
+
+    def test_reading_decodes_in_place(self):
+        history = History(_raw(3))
+        assert history[-1] == ModelResponse(
+            parts=[TextPart(content="answer 2")], timestamp=history[-1].timestamp
+        )
+        assert history.pending == 5
+
+        messages = history.messages(2)
+        assert isinstance(messages[0], ModelRequest)
+        assert messages[0].parts[0] == UserPromptPart(
+            content="question 1", timestamp=messages[0].parts[0].timestamp
+        )
+        assert history.pending == 2
+        assert list(history) == history.messages() and history.pending == 0
+
+    def test_dicts_and_messages_round_trip(self):
+        messages = turn(0)
+        history = History(
+            [_message_adapter.dump_python(messages[0], mode="json"), messages[1]]
+        )
+        assert list(history.json_items()) == [
+            _message_adapter.dump_json(msg).decode() for msg in messages
+        ]
+        assert history == messages
+
+    def test_raw_json_passes_through(self):
+        raw = _raw(2)
+        history = History(raw)
+        assert list(history.json_items()) == raw
+        assert history.pending == 4
+
+    def test_chat_coerces_lists(self):
+        chat = Chat(userId="u", history=turn(0))
+        assert isinstance(chat.history, History)
+        chat.history = turn(1)
+        assert isinstance(chat.history, History)
@@ -4,6 +4,8 @@ Verifies that submitting a chat from the home page correctly creates a chat
 and returns a NewChatAckEvent with the new chat id.
 """
 
+import asyncio
+import json
 import uuid
 import pytest
 import pydantic
@@ -25,8 +27,8 @@ class TestNewChatCreation:
         assert chat.pending is True
 
     def test_new_chat_id_is_falsy(self):
-        """_create_or_update_chat uses `if chat.id:` to decide whether to
-        INSERT or UPDATE — new chats need a falsy id."""
+        """save_chat uses `if not chat.id:` to decide whether to assign an
+        id to a new chat — new chats need a falsy id."""
         chat = Chat(userId=str(uuid.uuid4()))
         assert not chat.id
 
@@ -58,8 +60,7 @@ class TestHandleNewChat:
 
         ws = AsyncMock()
         user = AuthUserOut(id=str(uuid.uuid4()))
-        session = AsyncMock()
-        return ChatWebSocketHandler(ws, user, session)
+        return ChatWebSocketHandler(ws, user)
 
     @pytest.mark.asyncio
     @patch("frank.ws.save_chat")
@@ -69,6 +70,7 @@ class TestHandleNewChat:
 
         event = NewChatEvent(message="hello", model="google/gemini-2.5-flash")
         await handler.handle_new_chat(event)
+        await handler.outbox.drain()
 
         mock_save.assert_awaited_once()
         saved_chat = mock_save.call_args[0][0]
@@ -76,8 +78,8 @@ class TestHandleNewChat:
         assert saved_chat.user_id == handler.user.id
         assert saved_chat.cur_query.prompt == "hello"
 
-        handler.ws.send_json.assert_awaited_once()
-        ack = handler.ws.send_json.call_args[0][0]
+        handler.ws.send_text.assert_awaited_once()
+        ack = json.loads(handler.ws.send_text.call_args[0][0])
         assert ack["type"] == "new_chat_ack"
         assert ack["chatId"] == fake_id
 
@@ -94,3 +96,58 @@ class TestHandleNewChat:
 
         saved_chat = mock_save.call_args[0][0]
         assert saved_chat.cur_query.model == DEFAULT_MODEL.id
+
+
+class TestStreamingNewChat:
+    """With stream=True the reply starts on new_chat, without a round trip."""
+
+    @pytest.fixture
+    def handler(self):
+        from frank.ws import ChatWebSocketHandler
+
+        ws = AsyncMock()
+        user = AuthUserOut(id=str(uuid.uuid4()))
+        return ChatWebSocketHandler(ws, user, coalesce_ms=0)
+
+    @pytest.mark.asyncio
+    @patch("frank.ws.load_chat")
+    @patch("frank.ws.save_chat")
+    async def test_streams_reply_after_ack(self, mock_save, mock_load, handler):
+        from frank.schemas import AgentQuery, InitializeEvent
+
+        saves: list[tuple[bool, int]] = []
+        inserted = asyncio.Event()
+
+        async def _save(chat):
+            saves.append((chat.pending, len(chat.history)))
+            if len(saves) == 1:
+                await inserted.wait()
+            return chat.id
+
+        async def _stream(prompt, model=None, history=None, on_done=None):
+            yield "Hi"
+            # the upstream request runs while the insert is still going
+            inserted.set()
+            yield " there"
+            await on_done(AgentQuery(prompt=prompt, model=model), [])
+
+        mock_save.side_effect = _save
+        with patch("frank.services.generation.stream_agent_response", _stream):
+            await handler.handle_new_chat(NewChatEvent(message="hello", stream=True))
+            following, generation = handler.reply_task, handler.reply
+            # the client's follow-up initialize doesn't load or subscribe again
+            await handler.handle_initialize(InitializeEvent(chatId=handler.chat.id))
+            await following
+            await generation.task
+            await handler.outbox.drain()
+
+        mock_load.assert_not_awaited()
+        frames = [json.loads(c.args[0]) for c in handler.ws.send_text.await_args_list]
+        ack = frames[0]
+        assert ack["type"] == "new_chat_ack"
+        assert ack["chatId"] == handler.chat.id
+        replies = [f for f in frames if f["type"] == "reply"]
+        assert "".join(r["text"] for r in replies) == "Hi there"
+        assert replies[-1]["done"] is True
+        # the reply's save lands after the insert
+        assert saves == [(True, 0), (False, 0)]
@@ -0,0 +1,109 @@
+"""Tests for the bounded per-connection outbox."""
+
+import asyncio
+import pytest
+from unittest.mock import AsyncMock
+from frank.schemas import ChatTitleEvent, ErrorEvent, ReplyEvent
+from frank.streaming import Outbox
+
+
+class SlowSocket:
+    """Records written events; blocks every write until released."""
+
+    def __init__(self):
+        self.written: list = []
+        self.release = asyncio.Event()
+
+    async def write(self, event):
+        await self.release.wait()
+        self.written.append(event)
+
+
+def _delta(text: str, offset: int) -> ReplyEvent:
+    return ReplyEvent(text=text, generationId="g", offset=offset)
+
+
+class TestOutbox:
+    """Senders never wait on the socket; events are written in order."""
+
+    @pytest.mark.asyncio
+    async def test_writes_in_order(self):
+        written = []
+        outbox = Outbox(AsyncMock(side_effect=written.append), AsyncMock())
+        for i in range(3):
+            outbox.put(_delta("x", i))
+        await outbox.drain()
+        assert [e.offset for e in written] == [0, 1, 2]
+
+    @pytest.mark.asyncio
+    async def test_put_does_not_wait_for_slow_socket(self):
+        socket = SlowSocket()
+        outbox = Outbox(socket.write, AsyncMock(), max_size=10)
+        for i in range(5):
+            outbox.put(_delta("x", i))
+        # nothing written yet, but nobody was blocked
+        assert socket.written == []
+        socket.release.set()
+        await outbox.drain()
+        assert len(socket.written) == 5
+
+    @pytest.mark.asyncio
+    async def test_write_failure_closes(self):
+        outbox = Outbox(AsyncMock(side_effect=RuntimeError("gone")), AsyncMock())
+        outbox.put(_delta("x", 0))
+        outbox.put(_delta("y", 1))
+        await outbox.drain()
+        assert outbox.closed
+        assert len(outbox) == 0
+
+
+class TestOverflow:
+    """A full outbox merges, drops or disconnects according to its policy."""
+
+    @pytest.mark.asyncio
+    async def test_merge_folds_contiguous_deltas(self):
+        socket = SlowSocket()
+        outbox = Outbox(socket.write, AsyncMock(), max_size=2, policy="merge")
+        outbox.put(_delta("a", 0))
+        await asyncio.sleep(0)  # writer takes "a" and blocks on the socket
+        outbox.put(_delta("b", 1))
+        outbox.put(_delta("c", 2))
+        outbox.put(_delta("d", 3))
+        outbox.put(_delta("e", 4))
+        outbox.put(ReplyEvent(done=True, generationId="g", offset=5))
+        assert len(outbox) == 2
+
+        socket.release.set()
+        await outbox.drain()
+        assert [(e.text, e.offset, e.done) for e in socket.written] == [
+            ("a", 0, False),
+            ("b", 1, False),
+            ("cde", 2, True),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_drop_discards_optional_events(self):
+        socket = SlowSocket()
+        outbox = Outbox(socket.write, AsyncMock(), max_size=2, policy="drop")
+        outbox.put(ChatTitleEvent(chatId="c", title="Old"))
+        outbox.put(_delta("a", 0))
+        # a critical event evicts the queued title; a new title is dropped
+        outbox.put(ErrorEvent(code="x", detail="y"))
+        outbox.put(ChatTitleEvent(chatId="c", title="New"))
+
+        socket.release.set()
+        await outbox.drain()
+        assert [e.type.value for e in socket.written] == ["reply", "error"]
+
+    @pytest.mark.asyncio
+    async def test_disconnect_when_no_room(self):
+        disconnect = AsyncMock()
+        outbox = Outbox(SlowSocket().write, disconnect, max_size=1, policy="merge")
+        outbox.put(_delta("a", 0))
+        outbox.put(_delta("b", 5))  # not contiguous, can't merge
+        await asyncio.sleep(0)
+
+        disconnect.assert_awaited_once()
+        assert outbox.closed
+        outbox.put(_delta("c", 6))
+        assert len(outbox) == 0
@@ -0,0 +1,260 @@
+"""Tests for writing chats to the DB behind the cache."""
+
+import asyncio
+import uuid
+import pytest
+import pytest_asyncio
+from unittest.mock import patch
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from frank.core.config import settings
+from frank.core.db import Base
+from frank.core.redis import MemoryBackend
+from frank.db.models import ChatMessage, ChatSession
+from frank.history import History
+from frank.services import chat as chat_service
+from frank.services.chat import _fetch_chat, load_chat, save_chat
+from frank.services.persistence import ChatWriter, PendingChat, write_chats
+from tests.conftest import make_chat, turn
+
+
+class CountingWriter(ChatWriter):
+    """Writer counting the transactions it commits"""
+
+    def __init__(self, sessionmaker):
+        super().__init__(sessionmaker)
+        self.transactions = 0
+
+    async def flush(self, chat_ids=None):
+        written = await super().flush(chat_ids)
+        self.transactions += -(-written // settings.WRITE_BEHIND_BATCH)
+        return written
+
+
+class SharedBackend(MemoryBackend):
+    """Stands in for a Redis server, which outlives the worker"""
+
+    durable = True
+
+
+@pytest_asyncio.fixture
+async def sessionmaker(tmp_path):
+    # a file, so the writer and the test don't share a connection
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/chats.db")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+@pytest.fixture
+def writer(sessionmaker, monkeypatch):
+    monkeypatch.setattr(settings, "WRITE_BEHIND_MS", 20)
+    chat_service._chats.clear()
+    writer = CountingWriter(sessionmaker)
+    writer.on_written = chat_service._set_db_seqs
+    with (
+        patch("frank.services.chat.writer", writer),
+        patch("frank.services.chat.get_redis", return_value=SharedBackend()),
+    ):
+        yield writer
+
+
+async def _message_count(sessionmaker, chat_id: str) -> int:
+    async with sessionmaker() as session:
+        return await session.scalar(
+            select(func.count()).where(ChatMessage.chat_id == uuid.UUID(chat_id))
+        )
+
+
+class TestWriteBehind:
+    """Saves are cached now and written to the DB in batches."""
+
+    @pytest.mark.asyncio
+    async def test_saves_merge_and_commit_together(self, writer, sessionmaker):
+        chats = [make_chat() for _ in range(3)]
+        for i in range(2):
+            for chat in chats:
+                chat.history.extend(turn(i))
+                await save_chat(chat)
+
+        # readable from the cache before the DB has it
+        assert (await load_chat(chats[0].id)).last_seq == 4
+        assert await _message_count(sessionmaker, chats[0].id) == 0
+
+        await asyncio.sleep(0.2)
+        assert writer.transactions == 1
+        for chat in chats:
+            assert await _message_count(sessionmaker, chat.id) == 4
+
+    @pytest.mark.asyncio
+    async def test_failed_write_is_retried(self, writer, sessionmaker):
+        chat = make_chat()
+        chat.history = turn(0)
+        await save_chat(chat)
+
+        with patch(
+            "frank.services.persistence.write_chats", side_effect=RuntimeError("db")
+        ):
+            with pytest.raises(RuntimeError):
+                await writer.flush()
+        chat.history.extend(turn(1))
+        await save_chat(chat)
+
+        await writer.close()
+        assert await _message_count(sessionmaker, chat.id) == 4
+        async with sessionmaker() as session:
+            assert (await session.get(ChatSession, uuid.UUID(chat.id))).title == "Chat"
+
+    @pytest.mark.asyncio
+    async def test_bad_chat_doesnt_block_batch(self, writer, sessionmaker, monkeypatch):
+        monkeypatch.setattr(settings, "WRITE_BEHIND_ATTEMPTS", 3)
+        # flushed here only
+        monkeypatch.setattr(settings, "WRITE_BEHIND_MS", 60_000)
+        chats = [make_chat() for _ in range(3)]
+        for chat in chats:
+            chat.history = turn(0)
+            await save_chat(chat)
+        bad = chats[1].id
+
+        async def _write(session, batch):
+            if any(p.chat.id == bad for p in batch):
+                raise RuntimeError("constraint")
+            await write_chats(session, batch)
+
+        with patch("frank.services.persistence.write_chats", _write):
+            for _ in range(3):
+                with pytest.raises(RuntimeError):
+                    await writer.flush()
+                assert not writer.is_pending(chats[0].id)
+            # given up on after three tries
+            assert not writer.is_pending(bad)
+            assert await writer.flush() == 0
+
+        counts = [await _message_count(sessionmaker, c.id) for c in chats]
+        assert counts == [2, 0, 2]
+
+    @pytest.mark.asyncio
+    async def test_db_load_flushes_first(self, writer, sessionmaker):
+        chat = make_chat()
+        chat.history = turn(0)
+        await save_chat(chat)
+        await chat_service.get_redis().client.flushall()
+        chat_service._chats.clear()
+
+        async with sessionmaker() as session:
+            loaded = await load_chat(chat.id, session)
+            assert loaded.last_seq == 2
+            assert len((await _fetch_chat(session, chat.id)).history) == 2
+
+    @pytest.mark.asyncio
+    async def test_writes_through_without_cache(self, writer, sessionmaker):
+        chat = make_chat()
+        chat.history = turn(0)
+        with patch.object(chat_service, "_cache_chat", side_effect=RuntimeError):
+            await save_chat(chat)
+        assert not writer.is_pending(chat.id)
+        assert await _message_count(sessionmaker, chat.id) == 2
+
+    @pytest.mark.asyncio
+    async def test_memory_cache_writes_through(self, writer, sessionmaker):
+        chat = make_chat()
+        chat.history = turn(0)
+        # an in-process cache dies with the worker, so it can't hold saves
+        with patch("frank.services.chat.get_redis", return_value=MemoryBackend()):
+            await save_chat(chat)
+        assert not writer.is_pending(chat.id)
+        assert await _message_count(sessionmaker, chat.id) == 2
+
+    @pytest.mark.asyncio
+    async def test_cache_read_writes_lost_saves(
+        self, writer, sessionmaker, monkeypatch
+    ):
+        monkeypatch.setattr(settings, "WRITE_BEHIND_GRACE_S", 0)
+        chat = make_chat()
+        chat.history = turn(0)
+        await save_chat(chat)
+        await writer.flush()
+        chat.history.extend(turn(1))
+        await save_chat(chat)
+        # the worker dies with the second save still queued
+        writer._pending.clear()
+        chat_service._chats.clear()
+        await asyncio.sleep(0.05)
+
+        async with sessionmaker() as session:
+            loaded = await load_chat(chat.id, session)
+        assert loaded.last_seq == 4
+        assert await _message_count(sessionmaker, chat.id) == 4
+        async with sessionmaker() as session:
+            row = await session.get(ChatSession, uuid.UUID(chat.id))
+            assert row.last_seq == 4
+
+    @pytest.mark.asyncio
+    async def test_cache_read_leaves_db_alone(self, writer, sessionmaker, monkeypatch):
+        monkeypatch.setattr(settings, "WRITE_BEHIND_GRACE_S", 0)
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def _slow_write(session, batch):
+            started.set()
+            await release.wait()
+            await write_chats(session, batch)
+
+        chat = make_chat()
+        chat.history = turn(0)
+        with (
+            patch("frank.services.persistence.write_chats", _slow_write),
+            patch.object(chat_service, "_reconcile") as reconcile,
+        ):
+            await save_chat(chat)
+            await asyncio.wait_for(started.wait(), 1)
+            # overdue, but its flush is still going
+            await asyncio.sleep(0.05)
+            assert (await load_chat(chat.id, fresh=True)).last_seq == 2
+            release.set()
+            await writer.flush([chat.id])
+            # and once committed, the cache says so
+            assert (await load_chat(chat.id, fresh=True)).last_seq == 2
+            reconcile.assert_not_called()
+
+        redis = chat_service.get_redis()
+        assert await redis.client.hget(chat_service._meta_key(chat.id), "dbSeq") == "2"
+        assert await _message_count(sessionmaker, chat.id) == 2
+
+    @pytest.mark.asyncio
+    async def test_counters_track_messages(self, writer, sessionmaker):
+        chat = make_chat()
+        chat.history = turn(0)
+        await save_chat(chat)
+        await writer.flush()
+        # a save the DB already has adds nothing
+        chat.last_seq = 0
+        await save_chat(chat)
+        chat.history.extend(turn(1))
+        await save_chat(chat)
+        await writer.flush()
+
+        async with sessionmaker() as session:
+            row = await session.get(ChatSession, uuid.UUID(chat.id))
+            assert (row.last_seq, row.message_count) == (4, 4)
+            assert row.last_message_at is not None
+            window = await _fetch_chat(session, chat.id, window=3)
+        assert (window.last_seq, window.history_offset) == (4, 1)
+        assert len(window.history) == 3
+        assert await _message_count(sessionmaker, chat.id) == 4
+
+    @pytest.mark.asyncio
+    async def test_out_of_order_saves_all_land(self, sessionmaker):
+        chat = make_chat()
+        messages = list(History([m for i in range(3) for m in turn(i)]).python_items())
+        for seqs in ((1, 2), (5, 6), (3, 4)):
+            async with sessionmaker() as session:
+                await write_chats(
+                    session, [PendingChat(chat, {s: messages[s - 1] for s in seqs})]
+                )
+
+        async with sessionmaker() as session:
+            row = await session.get(ChatSession, uuid.UUID(chat.id))
+            assert (row.last_seq, row.message_count) == (6, 6)
+            loaded = await _fetch_chat(session, chat.id)
+        assert list(loaded.history.python_items()) == messages
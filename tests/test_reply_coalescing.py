@@ -0,0 +1,108 @@
+"""Tests for batching streamed reply deltas into fewer frames."""
+
+import asyncio
+import json
+import uuid
+import pytest
+from unittest.mock import AsyncMock, patch
+from frank.streaming import ReplyCoalescer
+
+
+class TestReplyCoalescer:
+    """ReplyCoalescer flushes on first delta, window, byte size and end."""
+
+    @pytest.mark.asyncio
+    async def test_first_delta_is_sent_immediately(self):
+        send = AsyncMock()
+        replies = ReplyCoalescer(send, window=10, max_bytes=1024)
+
+        await replies.push("Hel")
+
+        send.assert_awaited_once_with("Hel")
+
+    @pytest.mark.asyncio
+    async def test_buffers_until_end(self):
+        send = AsyncMock()
+        replies = ReplyCoalescer(send, window=10, max_bytes=1024)
+
+        for text in ["a", "b", "c", "d"]:
+            await replies.push(text)
+        assert send.await_count == 1
+
+        await replies.end()
+        assert [c.args[0] for c in send.await_args_list] == ["a", "bcd"]
+
+    @pytest.mark.asyncio
+    async def test_flushes_on_byte_threshold(self):
+        send = AsyncMock()
+        replies = ReplyCoalescer(send, window=10, max_bytes=4)
+
+        for text in ["first", "ab", "cd", "e"]:
+            await replies.push(text)
+
+        assert [c.args[0] for c in send.await_args_list] == ["first", "abcd"]
+
+    @pytest.mark.asyncio
+    async def test_flushes_after_window(self):
+        send = AsyncMock()
+        replies = ReplyCoalescer(send, window=0.01, max_bytes=1024)
+
+        await replies.push("a")
+        await replies.push("b")
+        await replies.push("c")
+        await asyncio.sleep(0.05)
+
+        assert [c.args[0] for c in send.await_args_list] == ["a", "bc"]
+
+    @pytest.mark.asyncio
+    async def test_zero_window_disables_coalescing(self):
+        send = AsyncMock()
+        replies = ReplyCoalescer(send, window=0, max_bytes=1024)
+
+        for text in ["a", "b", "c"]:
+            await replies.push(text)
+
+        assert send.await_count == 3
+
+    @pytest.mark.asyncio
+    async def test_end_resets_for_next_reply(self):
+        send = AsyncMock()
+        replies = ReplyCoalescer(send, window=10, max_bytes=1024)
+
+        await replies.push("a")
+        await replies.push("b")
+        await replies.end()
+        await replies.push("c")
+
+        assert [c.args[0] for c in send.await_args_list] == ["a", "b", "c"]
+        assert replies.frames == 1
+
+
+class TestHandlerCoalescing:
+    """The WS handler streams agent deltas through its coalescer."""
+
+    @pytest.mark.asyncio
+    @patch("frank.services.generation.stream_agent_response")
+    async def test_stream_response_batches_frames(self, mock_stream):
+        from frank.ws import ChatWebSocketHandler
+        from frank.schemas import AgentQuery, AuthUserOut, Chat
+
+        async def _deltas(*args, **kwargs):
+            for text in ["He", "llo", " wor", "ld"]:
+                yield text
+                await asyncio.sleep(0.001)
+
+        mock_stream.side_effect = _deltas
+
+        ws = AsyncMock()
+        user = AuthUserOut(id=str(uuid.uuid4()))
+        handler = ChatWebSocketHandler(ws, user, coalesce_ms=1000)
+        chat = Chat(id=str(uuid.uuid4()), userId=user.id)
+
+        await handler.start_reply(AgentQuery(prompt="hi", model="test"), chat)
+        await handler.reply_task
+        await handler.outbox.drain()
+
+        frames = [json.loads(c.args[0]) for c in ws.send_text.await_args_list]
+        assert [f["text"] for f in frames if not f["done"]] == ["He", "llo world"]
+        assert [f["offset"] for f in frames] == [0, 2, 11]
@@ -0,0 +1,121 @@
+"""Tests for splitting chats over databases by user."""
+
+import uuid
+import pytest
+import pytest_asyncio
+from unittest.mock import patch
+from sqlalchemy import func, select
+from frank.core.db import Base
+from frank.core.redis import MemoryBackend
+from frank.core.shards import Shards, shard_urls
+from frank.db.models import ChatMessage, ChatSession
+from frank.db.reshard import reshard
+from frank.history import History
+from frank.schemas import Chat
+from frank.services import chat as chat_service
+from frank.services.chat import load_chat
+from frank.services.persistence import ChatWriter, PendingChat
+from tests.conftest import turn
+
+
+async def _connect(tmp_path, name: str, count: int) -> Shards:
+    shards = Shards.connect(
+        shard_urls(count, f"sqlite+aiosqlite:///{tmp_path}/{name}-{{shard}}.db")
+    )
+    for shard in shards:
+        async with shard.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    return shards
+
+
+@pytest_asyncio.fixture
+async def shards(tmp_path):
+    shards = await _connect(tmp_path, "chats", 3)
+    yield shards
+    await shards.dispose()
+
+
+def _pending(user_id: str) -> PendingChat:
+    chat = Chat(id=str(uuid.uuid4()), userId=user_id, lastSeq=2)
+    return PendingChat(chat, dict(enumerate(History(turn(0)).python_items(), 1)))
+
+
+async def _chat_ids(shard) -> set[str]:
+    async with shard.read_sessions() as session:
+        return {str(i) for i in await session.scalars(select(ChatSession.id))}
+
+
+class TestShards:
+    """Each user's chats are written to and read from one shard."""
+
+    def test_users_map_to_one_shard(self, shards):
+        user_ids = [str(uuid.uuid4()) for _ in range(30)]
+        assert {shards.index_for(u) for u in user_ids} == {0, 1, 2}
+        for user_id in user_ids:
+            assert shards.lookup(user_id) == [shards.for_user(user_id)]
+        assert shards.lookup(None) == list(shards)
+
+    def test_url_needs_placeholder(self):
+        with pytest.raises(ValueError):
+            shard_urls(2, "sqlite+aiosqlite:///chats.db")
+
+    @pytest.mark.asyncio
+    async def test_writer_flushes_each_shard(self, shards):
+        saves = [_pending(str(uuid.uuid4())) for _ in range(12)]
+        writer = ChatWriter()
+        with patch("frank.services.persistence.shards", shards):
+            for pending in saves:
+                writer.put(pending)
+            assert await writer.flush() == 12
+            await writer.close()
+
+        for i, shard in enumerate(shards):
+            assert await _chat_ids(shard) == {
+                p.chat.id for p in saves if shards.index_for(p.chat.user_id) == i
+            }
+
+    @pytest.mark.asyncio
+    async def test_load_looks_in_users_shard(self, shards):
+        pending = _pending(str(uuid.uuid4()))
+        shard = shards.index_for(pending.chat.user_id)
+        await ChatWriter(shards[shard].sessions).write(pending)
+        other = next(u for u in map(str, range(100)) if shards.index_for(u) != shard)
+        redis = MemoryBackend()
+
+        async def _load(user_id):
+            # straight from the DB each time
+            chat_service._chats.clear()
+            await redis.client.flushall()
+            return await load_chat(pending.chat.id, user_id=user_id)
+
+        with (
+            patch("frank.services.chat.shards", shards),
+            patch("frank.services.chat.get_redis", return_value=redis),
+        ):
+            assert len((await _load(pending.chat.user_id)).history) == 2
+            assert await _load(other) is None
+            # every shard is tried when the user isn't known
+            assert await _load(None)
+
+    @pytest.mark.asyncio
+    async def test_reshard_moves_chats(self, shards, tmp_path):
+        source = await _connect(tmp_path, "old", 1)
+        saves = [_pending(str(uuid.uuid4())) for _ in range(20)]
+        writer = ChatWriter(source[0].sessions)
+        for pending in saves:
+            writer.put(pending)
+        await writer.close()
+
+        assert await reshard(source, shards, batch=7) == 20
+        # nothing left to move on a second run
+        assert await reshard(source, shards, batch=7) == 0
+        assert await _chat_ids(source[0]) == set()
+        for i, shard in enumerate(shards):
+            ids = await _chat_ids(shard)
+            assert ids == {
+                p.chat.id for p in saves if shards.index_for(p.chat.user_id) == i
+            }
+            async with shard.read_sessions() as session:
+                count = await session.scalar(select(func.count(ChatMessage.id)))
+            assert count == 2 * len(ids)
+        await source.dispose()
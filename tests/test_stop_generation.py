@@ -0,0 +1,493 @@
+"""Tests for in-flight replies: stopping them, resuming them after a
+disconnect, and sharing one between sockets."""
+
+import asyncio
+import json
+import uuid
+import pytest
+from unittest.mock import AsyncMock, patch
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart, UserPromptPart
+from frank.core.config import settings
+from frank.core.redis import MemoryBackend
+from frank.schemas import (
+    AgentQuery,
+    AuthUserOut,
+    Chat,
+    InitializeEvent,
+    SendEvent,
+    StopEvent,
+)
+from frank.services.generation import (
+    ReplyCheckpoint,
+    follow_checkpoint,
+    get_generation,
+)
+from tests.conftest import frame, make_chat, make_handler
+
+
+class FakeAgentStream:
+    """Stands in for stream_agent_response: yields a few deltas, then hangs
+    like a slow upstream until it is closed."""
+
+    def __init__(self, deltas: list[str]):
+        self.deltas = deltas
+        self.started = asyncio.Event()
+        self.closed = False
+        self.calls = 0
+
+    async def __call__(self, prompt, model=None, history=None, on_done=None):
+        self.calls += 1
+        try:
+            for text in self.deltas:
+                yield text
+            self.started.set()
+            await asyncio.Event().wait()
+        finally:
+            self.closed = True
+
+
+class FinishedAgentStream:
+    """Stands in for stream_agent_response: yields its text and hands the
+    turn to on_done, like a reply that completes"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.calls = 0
+
+    async def __call__(self, prompt, model=None, history=None, on_done=None):
+        self.calls += 1
+        yield self.text
+        messages = [
+            ModelRequest(parts=[UserPromptPart(content=prompt)]),
+            ModelResponse(parts=[TextPart(content=self.text)]),
+        ]
+        await on_done(
+            AgentQuery(prompt=prompt, model=model, result=self.text), messages
+        )
+
+
+async def _sent(handler) -> list[dict]:
+    await handler.outbox.drain()
+    return [json.loads(c.args[0]) for c in handler.ws.send_text.await_args_list]
+
+
+@pytest.fixture(autouse=True)
+def redis():
+    backend = MemoryBackend()
+    with patch("frank.services.generation.get_redis", return_value=backend):
+        yield backend
+
+
+@pytest.fixture
+def handler():
+    handler = make_handler()
+    handler.chat = make_chat(handler.user.id)
+    # handle_send reloads the chat before starting a reply
+    with patch("frank.ws.load_chat", AsyncMock(return_value=handler.chat)):
+        yield handler
+
+
+class TestStopGeneration:
+    """A stop cancels the upstream stream and keeps the partial reply."""
+
+    @pytest.mark.asyncio
+    @patch("frank.ws.save_chat")
+    async def test_stop_saves_partial_reply(self, mock_save, handler):
+        stream = FakeAgentStream(["Hel", "lo"])
+        with patch("frank.services.generation.stream_agent_response", stream):
+            await handler.handle_send(
+                SendEvent(chatId=handler.chat.id, message="hi", model=None)
+            )
+            await asyncio.wait_for(stream.started.wait(), 1)
+            await handler.stop_generation()
+
+        assert stream.closed
+        assert handler.reply is None
+        mock_save.assert_awaited_once()
+        assert (await _sent(handler))[-1]["done"] is True
+
+        request, response = handler.chat.history
+        assert isinstance(request, ModelRequest)
+        assert request.parts[0].content == "hi"
+        assert isinstance(response, ModelResponse)
+        assert response.parts[0].content == "Hello"
+
+    @pytest.mark.asyncio
+    @patch("frank.ws.save_chat")
+    async def test_send_while_streaming_is_rejected(self, mock_save, handler):
+        stream = FakeAgentStream(["Hi"])
+        event = SendEvent(chatId=handler.chat.id, message="hi", model=None)
+        with patch("frank.services.generation.stream_agent_response", stream):
+            await handler.handle_send(event)
+            await asyncio.wait_for(stream.started.wait(), 1)
+            handler.send_error = AsyncMock()
+            await handler.handle_send(event)
+            await handler.stop_generation()
+
+        handler.send_error.assert_awaited_once()
+        assert handler.send_error.call_args[0][1] == "busy"
+
+    @pytest.mark.asyncio
+    async def test_producer_stops_when_asked_by_another_worker(self, redis):
+        from frank.services.generation import Generation
+
+        stream = FakeAgentStream(["Hel", "lo"])
+        chat = Chat(id=str(uuid.uuid4()), userId=str(uuid.uuid4()))
+        on_done = AsyncMock()
+        with patch("frank.services.generation.stream_agent_response", stream):
+            generation = Generation(chat, AgentQuery(prompt="hi", model="m"), on_done)
+            await asyncio.wait_for(stream.started.wait(), 1)
+            await redis.set(f"reply-stop:{chat.id}", generation.id)
+            generation._checkpoint()
+            await asyncio.wait_for(asyncio.wait([generation.task]), 1)
+
+        assert stream.closed
+        assert generation.checkpoint().done
+        on_done.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    @patch("frank.ws.save_chat")
+    async def test_send_right_after_done(self, mock_save, handler):
+        async def _slow_save(chat):
+            await asyncio.sleep(0.05)
+
+        mock_save.side_effect = _slow_save
+        stream = FinishedAgentStream("Hi")
+        event = SendEvent(chatId=handler.chat.id, message="hi", model="m")
+        with patch("frank.services.generation.stream_agent_response", stream):
+            await handler.handle_send(event)
+            await asyncio.wait_for(handler.reply_task, 1)
+            assert (await _sent(handler))[-1]["done"] is True
+            # the client answers the done event straight away
+            handler.send_error = AsyncMock()
+            await handler.handle_send(event)
+            await asyncio.wait_for(handler.reply_task, 1)
+
+        handler.send_error.assert_not_awaited()
+        assert stream.calls == 2
+        assert len(handler.chat.history) == 4
+
+
+class TestReceiveLoop:
+    """The socket keeps being read while a reply streams."""
+
+    @pytest.mark.asyncio
+    @patch("frank.ws.save_chat")
+    async def test_stop_event_cancels_reply(self, mock_save, handler):
+        stream = FakeAgentStream(["Hel", "lo"])
+        chat = handler.chat
+
+        async def _receive():
+            yield frame(SendEvent(chatId=chat.id, message="hi", model=None))
+            await stream.started.wait()
+            yield frame(StopEvent(chatId=chat.id))
+            await asyncio.sleep(0.01)
+            yield {"type": "websocket.disconnect", "code": 1000}
+
+        frames = _receive()
+        handler.ws.receive = lambda: anext(frames)
+
+        with patch("frank.services.generation.stream_agent_response", stream):
+            await asyncio.wait_for(handler.run(), 1)
+
+        assert stream.closed
+        mock_save.assert_awaited_once()
+        assert chat.history[-1].parts[0].content == "Hello"
+        # the closed socket lets go of the chat
+        assert handler.chat is None
+
+    @pytest.mark.asyncio
+    @patch("frank.ws.save_chat")
+    async def test_disconnect_closes_upstream_without_grace(
+        self, mock_save, handler, monkeypatch
+    ):
+        monkeypatch.setattr(settings, "REPLY_RESUME_GRACE_S", 0)
+        stream = FakeAgentStream(["Hi"])
+        chat = handler.chat
+
+        async def _receive():
+            yield frame(SendEvent(chatId=chat.id, message="hi", model=None))
+            await stream.started.wait()
+            yield {"type": "websocket.disconnect", "code": 1001}
+
+        frames = _receive()
+        handler.ws.receive = lambda: anext(frames)
+
+        with patch("frank.services.generation.stream_agent_response", stream):
+            await asyncio.wait_for(handler.run(), 1)
+            await asyncio.wait([get_generation(chat.id).task])
+
+        assert stream.closed
+        mock_save.assert_awaited_once()
+
+
+class TestResume:
+    """A reconnecting client picks the reply up from the offset it has."""
+
+    @pytest.mark.asyncio
+    @patch("frank.ws.save_chat")
+    @patch("frank.ws.load_chat")
+    async def test_resumes_live_reply_from_offset(self, mock_load, mock_save, handler):
+        stream = FakeAgentStream(["Hel", "lo", " there"])
+        mock_load.return_value = handler.chat
+        with patch("frank.services.generation.stream_agent_response", stream):
+            await handler.handle_send(
+                SendEvent(chatId=handler.chat.id, message="hi", model=None)
+            )
+            await asyncio.wait_for(stream.started.wait(), 1)
+            # the first socket drops after receiving "Hel"
+            await handler.detach_reply()
+            generation = get_generation(handler.chat.id)
+            assert not stream.closed
+
+            resumed = make_handler(handler.user)
+            await resumed.handle_initialize(
+                InitializeEvent(chatId=handler.chat.id, resumeFrom=3)
+            )
+            await asyncio.sleep(0.01)
+            await resumed.stop_generation()
+
+        assert generation.subscribers == 0
+        replies = [f for f in (await _sent(resumed)) if f["type"] == "reply"]
+        assert replies[0]["text"] == "lo there"
+        assert replies[0]["offset"] == 3
+        assert replies[0]["generationId"] == generation.id
+        assert replies[-1]["done"] is True
+        mock_save.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    @patch("frank.ws.load_chat")
+    async def test_follows_checkpoint_from_another_worker(
+        self, mock_load, handler, redis
+    ):
+        checkpoint = ReplyCheckpoint(
+            generationId="g1", start=0, text="Hello there", done=True
+        )
+        await redis.setex(
+            f"reply:{handler.chat.id}", 60, checkpoint.model_dump_json(by_alias=True)
+        )
+        mock_load.return_value = handler.chat
+
+        resumed = make_handler(handler.user)
+        await resumed.handle_initialize(
+            InitializeEvent(chatId=handler.chat.id, resumeFrom=6)
+        )
+        await resumed.reply_task
+
+        replies = [f for f in (await _sent(resumed)) if f["type"] == "reply"]
+        assert [r["text"] for r in replies] == ["there", ""]
+        assert replies[-1]["done"] is True
+
+    @pytest.mark.asyncio
+    @patch("frank.ws.load_chat")
+    async def test_stop_while_following_another_worker(
+        self, mock_load, handler, redis, monkeypatch
+    ):
+        monkeypatch.setattr(settings, "REPLY_FLUSH_MS", 10)
+        key = f"reply:{handler.chat.id}"
+        checkpoint = ReplyCheckpoint(generationId="g1", start=0, text="Hel")
+        await redis.setex(key, 60, checkpoint.model_dump_json(by_alias=True))
+        mock_load.return_value = handler.chat
+
+        resumed = make_handler(handler.user)
+        await resumed.handle_initialize(InitializeEvent(chatId=handler.chat.id))
+        await asyncio.sleep(0.02)
+        # doesn't wait on the remote reply, just asks its worker to stop
+        await asyncio.wait_for(resumed.stop_generation(), 0.1)
+        assert await redis.get(f"reply-stop:{handler.chat.id}") == "g1"
+        assert not resumed.reply_task.done()
+
+        # which it does at its next checkpoint
+        checkpoint = ReplyCheckpoint(
+            generationId="g1", start=0, text="Hello", done=True
+        )
+        await redis.setex(key, 60, checkpoint.model_dump_json(by_alias=True))
+        await asyncio.wait_for(resumed.reply_task, 1)
+
+        replies = [f for f in (await _sent(resumed)) if f["type"] == "reply"]
+        assert "".join(r["text"] for r in replies) == "Hello"
+        assert replies[-1]["done"] is True
+
+    @pytest.mark.asyncio
+    async def test_follow_rides_out_a_failed_read(self, redis, monkeypatch):
+        monkeypatch.setattr(settings, "REPLY_FLUSH_MS", 10)
+        chat_id = str(uuid.uuid4())
+        checkpoint = ReplyCheckpoint(generationId="g1", text="Hel")
+        get, failed = redis.get, False
+
+        async def _flaky_get(k):
+            nonlocal failed
+            if not failed:
+                failed = True
+                raise ConnectionError("cache timed out")
+            return await get(k)
+
+        follow = follow_checkpoint(chat_id, 0, checkpoint)
+        assert await anext(follow) == "Hel"
+        with patch.object(redis, "get", _flaky_get):
+            done = checkpoint.model_copy(update={"text": "Hello", "done": True})
+            await redis.setex(
+                f"reply:{chat_id}", 60, done.model_dump_json(by_alias=True)
+            )
+            assert [text async for text in follow] == ["lo"]
+        assert failed
+
+    @pytest.mark.asyncio
+    @patch("frank.ws.load_chat")
+    async def test_reports_offsets_outside_the_buffer(self, mock_load, handler, redis):
+        checkpoint = ReplyCheckpoint(generationId="g1", start=100, text="tail")
+        await redis.setex(
+            f"reply:{handler.chat.id}", 60, checkpoint.model_dump_json(by_alias=True)
+        )
+        mock_load.return_value = handler.chat
+
+        resumed = make_handler(handler.user)
+        await resumed.handle_initialize(
+            InitializeEvent(chatId=handler.chat.id, resumeFrom=10)
+        )
+        await resumed.reply_task
+
+        assert (await _sent(resumed))[-1]["code"] == "resume_unavailable"
+
+
+class TestReplyBuffer:
+    """The replay buffer serves any offset and checkpoints a bounded tail."""
+
+    @pytest.mark.asyncio
+    async def test_text_from_offsets_and_bounded_checkpoint(self, monkeypatch):
+        from frank.services.generation import Generation
+
+        monkeypatch.setattr(settings, "REPLY_BUFFER_CHARS", 4)
+        stream = FakeAgentStream(["Hel", "lo", " there"])
+        chat = Chat(id=str(uuid.uuid4()), userId=str(uuid.uuid4()))
+        with patch("frank.services.generation.stream_agent_response", stream):
+            generation = Generation(
+                chat, AgentQuery(prompt="hi", model="m"), AsyncMock()
+            )
+            await asyncio.wait_for(stream.started.wait(), 1)
+
+            assert generation.text_from(0) == "Hello there"
+            assert generation.text_from(4) == "o there"
+            assert generation.text_from(11) == ""
+
+            checkpoint = generation.checkpoint()
+            assert (checkpoint.start, checkpoint.text) == (7, "here")
+            assert not checkpoint.done
+
+            await generation.stop()
+        assert generation.checkpoint().done
+
+
+class TestSingleFlight:
+    """Sockets showing the same chat share one generation per turn."""
+
+    @pytest.mark.asyncio
+    @patch("frank.ws.save_chat")
+    @patch("frank.ws.load_chat")
+    async def test_pending_chat_initialized_twice(self, mock_load, mock_save):
+        user = AuthUserOut(id=str(uuid.uuid4()))
+        chat = Chat(id=str(uuid.uuid4()), userId=user.id, title="Chat", pending=True)
+        chat.cur_query = AgentQuery(prompt="hi", model="m")
+        mock_load.side_effect = lambda chat_id, **_: chat.model_copy(deep=True)
+        stream = FakeAgentStream(["Hel", "lo"])
+        first, second = make_handler(user), make_handler(user)
+
+        with patch("frank.services.generation.stream_agent_response", stream):
+            await first.handle_initialize(InitializeEvent(chatId=chat.id))
+            await asyncio.wait_for(stream.started.wait(), 1)
+            # the late subscriber gets the buffered prefix, then the live tail
+            await second.handle_initialize(InitializeEvent(chatId=chat.id))
+            await asyncio.sleep(0.01)
+            assert first.reply is second.reply
+            assert second.chat is first.chat
+            following = first.reply_task
+            await second.stop_generation()
+            await asyncio.wait([following])
+
+        assert stream.calls == 1
+        mock_save.assert_awaited_once()
+        for handler in (first, second):
+            replies = [f for f in (await _sent(handler)) if f["type"] == "reply"]
+            assert "".join(r["text"] for r in replies) == "Hello"
+            assert replies[-1]["done"] is True
+
+    @pytest.mark.asyncio
+    @patch("frank.ws.save_chat")
+    async def test_send_from_second_socket_is_rejected(self, mock_save, handler):
+        stream = FakeAgentStream(["Hi"])
+        other = make_handler(handler.user)
+        other.chat = handler.chat
+        event = SendEvent(chatId=handler.chat.id, message="hi", model=None)
+        with patch("frank.services.generation.stream_agent_response", stream):
+            await handler.handle_send(event)
+            await asyncio.wait_for(stream.started.wait(), 1)
+            await other.handle_send(event)
+            await handler.stop_generation()
+
+        assert stream.calls == 1
+        assert (await _sent(other))[-1]["code"] == "busy"
+
+    @pytest.mark.asyncio
+    async def test_lease_renewed_while_waiting_for_tokens(self, redis):
+        from frank.services.generation import Generation, _acquire_lease
+
+        stream = FakeAgentStream([])
+        chat = Chat(id=str(uuid.uuid4()), userId=str(uuid.uuid4()))
+        key = f"reply-lease:{chat.id}:0"
+        with (
+            patch("frank.services.generation.stream_agent_response", stream),
+            patch.object(settings, "REPLY_LEASE_S", 3),
+        ):
+            generation = Generation(
+                chat, AgentQuery(prompt="hi", model="m"), AsyncMock()
+            )
+            assert await _acquire_lease(chat.id, 0, generation.id) == generation.id
+            await asyncio.wait_for(stream.started.wait(), 1)
+            await redis.expire(key, 2)
+            # no tokens since, but the producer keeps the lease alive
+            await asyncio.sleep(1.3)
+            assert await redis.client.ttl(key) >= 2
+            await generation.stop()
+            await asyncio.wait([generation._flush])
+
+        # and lets it go when done
+        assert await redis.get(key) is None
+
+    @pytest.mark.asyncio
+    async def test_lease_expiring_mid_acquire_is_retaken(self):
+        from frank.services.generation import _acquire_lease
+
+        redis = AsyncMock()
+        # held when we try, but gone by the time we look at who holds it
+        redis.set.side_effect = [False, True]
+        redis.get.return_value = None
+        with patch("frank.services.generation.get_redis", return_value=redis):
+            assert await _acquire_lease("c1", 0, "mine") == "mine"
+        assert redis.set.await_count == 2
+
+    @pytest.mark.asyncio
+    @patch("frank.ws.load_chat")
+    async def test_follows_lease_holder_on_another_worker(
+        self, mock_load, handler, redis
+    ):
+        chat = handler.chat.model_copy(update={"pending": True})
+        chat.cur_query = AgentQuery(prompt="hi", model="m")
+        mock_load.return_value = chat
+        checkpoint = ReplyCheckpoint(generationId="remote", text="Hi", done=True)
+        # the other worker holds the lease but hasn't checkpointed yet
+        await redis.set(f"reply-lease:{chat.id}:0", "remote")
+        stream = FakeAgentStream(["never"])
+
+        with patch("frank.services.generation.stream_agent_response", stream):
+            resumed = make_handler(handler.user)
+            await resumed.handle_initialize(InitializeEvent(chatId=chat.id))
+            await asyncio.sleep(0.01)
+            await redis.setex(
+                f"reply:{chat.id}", 60, checkpoint.model_dump_json(by_alias=True)
+            )
+            await asyncio.wait_for(resumed.reply_task, 2)
+
+        assert stream.calls == 0
+        replies = [f for f in (await _sent(resumed)) if f["type"] == "reply"]
+        assert [r["text"] for r in replies] == ["Hi", ""]
+        assert replies[0]["generationId"] == "remote"